@@ -0,0 +1,173 @@
+### Accumulation of the registry histograms in dense NumPy arrays.
+# Instead of one ROOT histogram per observable, final state and region, each
+# observable has a single array of cells indexed by (flavour final state,
+# region, bin). A batch of candidates is added to the final state and all the
+# regions it belongs to in one vectorized operation; the ROOT histograms,
+# named as in H4l_histos (e.g. ZZMass_2GeV_4mu_ggH125), are only created when
+# the results are written, the inclusive ones as the sum of the flavours.
+#
+# Contents are accumulated in Float_t in event order, as TH1F::Fill does,
+# Sumw2 and the statistics in double.
+
+import numpy as np
+
+import H4l_columnar
+import H4l_histos
+
+
+class Accumulator:
+    """
+    The sums of weights of one observable, in the flavour final states (see
+    H4l_histos.flavourStates) and in a list of regions ('' for all events).
+    """
+
+    def __init__(self, observable, regions=('',)):
+        obs = H4l_histos.observables[observable]
+        self.observable = observable
+        self.regions    = list(regions)
+        self.x          = obs['x']
+        self.y          = obs.get('y')
+        self.xbins      = obs['bins'][0:3]
+        self.ybins      = obs['bins'][3:6] if self.y else None
+
+        self.nCells = self.xbins[0]+2
+        if self.y:
+            self.nCells *= self.ybins[0]+2
+        nSlots = len(H4l_histos.flavourStates)*len(self.regions)
+        nStats = 7 if self.y else 4
+
+        # one slot per (final state, region), in this order
+        self.content = np.zeros((nSlots, self.nCells), dtype=np.float32)
+        self.sumw2   = np.zeros((nSlots, self.nCells), dtype=np.float64)
+        self.stats   = np.zeros((nSlots, nStats), dtype=np.float64)
+        self.entries = np.zeros(nSlots, dtype=np.int64)
+        self.inclusive = {}
+
+    def slot(self, finalState, region):
+        return H4l_histos.flavourStates.index(finalState)*len(self.regions) + self.regions.index(region)
+
+    def fill(self, values, weight, fsIndex):
+        """
+        Add a batch of candidates.
+
+        Parameters
+        ----------
+        values : Dict[str, np.ndarray]
+            Candidate variables (filled and region variables).
+        weight : np.ndarray
+            The candidate weights.
+        fsIndex : np.ndarray
+            Index of the final state of each candidate in H4l_histos.flavourStates;
+            -1 (not filled) for unexpected flavours.
+        """
+
+        self.inclusive.clear()
+        w = np.asarray(weight, dtype=np.float64)
+        n = len(w)
+        if n == 0: return
+
+        x = np.asarray(values[self.x], dtype=np.float64)
+        bins = H4l_columnar.findBin(*self.xbins, x)
+        inRange = (bins >= 1) & (bins <= self.xbins[0])
+        if self.y:
+            y = np.asarray(values[self.y], dtype=np.float64)
+            ybins = H4l_columnar.findBin(*self.ybins, y)
+            inRange &= (ybins >= 1) & (ybins <= self.ybins[0])
+            bins = bins + (self.xbins[0]+2)*ybins
+
+        # (candidate, slot) pairs, ordered by candidate: each cell still
+        # receives its weights in event order
+        inFs = np.stack([fsIndex == i for i in range(len(H4l_histos.flavourStates))], axis=1)
+        inRegions = np.stack([np.broadcast_to(H4l_histos.inRegion(r, values), n) for r in self.regions], axis=1)
+        cand, slot = np.nonzero((inFs[:, :, None] & inRegions[:, None, :]).reshape(n, -1))
+
+        cells = slot*self.nCells + bins[cand]
+        wc = w[cand]
+        np.add.at(self.content.reshape(-1), cells, wc.astype(np.float32))
+        np.add.at(self.sumw2.reshape(-1), cells, wc*wc)
+        self.entries += np.bincount(slot, minlength=len(self.entries))
+
+        ir = inRange[cand]
+        s = slot[ir]
+        wi = wc[ir]
+        xi = x[cand][ir]
+        moments = [wi, wi*wi, wi*xi, wi*xi*xi]
+        if self.y:
+            yi = y[cand][ir]
+            moments += [wi*yi, wi*yi*yi, wi*xi*yi]
+        for k, m in enumerate(moments):
+            self.stats[:, k] += np.bincount(s, weights=m, minlength=len(self.stats))
+
+    def histo(self, region, finalState, samplename):
+        """
+        Create the ROOT histogram of one final state and region.
+        """
+
+        h = H4l_histos.BookedHisto(self.observable, region, finalState, samplename).histo
+        if finalState:
+            i = self.slot(finalState, region)
+            H4l_columnar.setHisto(h, self.content[i], self.sumw2[i], self.stats[i], self.entries[i])
+        else:
+            H4l_columnar.setHisto(h, *self.inclusiveSums(region))
+        return h
+
+    def inclusiveSums(self, region):
+        """
+        Contents, Sumw2, statistics and entries of the inclusive histogram:
+        the sums over the flavour final states, computed once per region.
+        """
+
+        if region not in self.inclusive:
+            slots = [self.slot(fs, region) for fs in H4l_histos.flavourStates]
+            self.inclusive[region] = (self.content[slots].astype(np.float64).sum(axis=0),
+                                      self.sumw2[slots].sum(axis=0),
+                                      self.stats[slots].sum(axis=0),
+                                      self.entries[slots].sum())
+        return self.inclusive[region]
+
+
+class HistoAccumulator:
+    """
+    Accumulators for a list of requested histograms (<observable> or
+    <observable>_<region>, as in H4l_histos.bookHistos), one per observable.
+    """
+
+    def __init__(self, histoNames=H4l_histos.defaultHistos):
+        self.requested = [H4l_histos.parseHistoName(name) for name in histoNames]
+        regions = {}
+        for observable, region in self.requested:
+            regions.setdefault(observable, [])
+            if region not in regions[observable]:
+                regions[observable].append(region)
+        self.accumulators = {obs: Accumulator(obs, r) for obs, r in regions.items()}
+
+    def variables(self):
+        """
+        The candidate variables needed: filled variables and region variables.
+        """
+
+        variables = []
+        for acc in self.accumulators.values():
+            variables += [acc.x] + ([acc.y] if acc.y else [])
+            variables += [H4l_histos.regions[r]['var'] for r in acc.regions if r]
+        return list(dict.fromkeys(variables))
+
+    def fill(self, cands, weight):
+        """
+        Add a batch of candidates (arrays with the variables, Z1flav and Z2flav).
+        """
+
+        fsMask = H4l_columnar.finalStateMasks(np.asarray(cands["Z1flav"]), np.asarray(cands["Z2flav"]))
+        fsIndex = np.full(len(weight), -1, dtype=np.int64)
+        for i, fs in enumerate(H4l_histos.flavourStates):
+            fsIndex[fsMask[fs]] = i
+        for acc in self.accumulators.values():
+            acc.fill(cands, weight, fsIndex)
+
+    def histos(self, samplename):
+        """
+        The ROOT histograms, ordered as H4l_histos.bookHistos.
+        """
+
+        return [self.accumulators[obs].histo(region, fs, samplename)
+                for obs, region in self.requested for fs in H4l_histos.finalStates]
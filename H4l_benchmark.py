@@ -0,0 +1,351 @@
+#!/bin/env python3
+### Performance regression benchmarks, on synthetic inputs (see H4l_synth).
+# Times the production stages at several input sizes:
+#   fill   H4l_fill.fillHistos per sample, for each engine and number of cores
+#          (threads for rdf, chunk jobs for columnar), and for the loop engine
+#          each read strategy (see H4l_treecache), with the read calls
+#   yields ggZZ_yields.printYields
+#   draw   the histogram store (see H4l_histostore), read from the inputs
+#          and loaded back, Stack_full2022 and dataGraph of
+#          H4l_draw_mZZ_full2022, and its whole plot (plotM4l, exported to
+#          png as by the script)
+# Results are written as JSON with the git revision; they can be stored as
+# the baseline, and later runs report the cases slower than the baseline by
+# more than the tolerance (the exit code is then 1). Scaling curves (events vs
+# time and cores vs time, per engine) are drawn in the output directory.
+#
+# run with e.g.:
+#   python3 H4l_benchmark.py --sizes 10000 100000 1000000 --save-baseline
+#   python3 H4l_benchmark.py --sizes 10000 100000 1000000
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+ROOT.gROOT.SetBatch(True)
+
+import H4l_fill
+import H4l_histos
+import H4l_histostore
+import H4l_instrument
+import H4l_render
+import H4l_synth
+import H4l_treecache
+
+
+# the synthetic files: one per distinct shape, shared by the samples
+# that have it
+shapeSamples = ['ggH125', 'ZZTo4l', 'ggTo4mu', 'ggTo4e', 'ggTo2e2mu', 'Data']
+
+ggZZSamples = ['ggTo4e', 'ggTo4mu', 'ggTo4tau', 'ggTo2e2mu', 'ggTo2e2tau', 'ggTo2mu2tau']
+signalSamples = ['ggH125', 'VBF125', 'WplusH125', 'WHminus125', 'ZH125', 'ttH125', 'bbH125']
+backgroundSamples = ['ZZTo4l', 'WWZ', 'WZZ', 'ZZZ', 'TTWW', 'TTZZ']
+
+
+def gitRevision():
+    codeDir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=codeDir, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=codeDir, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision + ("-dirty" if dirty else "")
+
+
+def inputFile(workDir, size, samplename):
+    """
+    The synthetic file with the shape of a sample, written on first use.
+    """
+
+    shape = samplename if samplename in H4l_synth.fsFractions else \
+        {'signal': 'ggH125', 'ZZ': 'ZZTo4l', 'data': 'Data'}[H4l_synth.sampleProcess(samplename)]
+    filename = os.path.join(workDir, "inputs", str(size), shape, "ZZ4lAnalysis.root")
+    if not os.path.exists(filename):
+        H4l_synth.writeSample(filename, shape, size, seed=shapeSamples.index(shape))
+    return filename
+
+
+def timed(function, repeat=1):
+    """
+    Call function repeat times; the result of the last call and the wall and
+    CPU time of the fastest one.
+    """
+
+    best = None
+    for i in range(repeat):
+        start = H4l_instrument.now()
+        result = function()
+        end = H4l_instrument.now()
+        t = (end[0]-start[0], end[1]-start[1])
+        if best is None or t[0] < best[0]:
+            best = t
+    return result, best
+
+
+def setCores(engine, cores):
+    # the fill options that use the given number of cores
+    if engine == "rdf":
+        ROOT.DisableImplicitMT()
+        if cores > 1:
+            ROOT.EnableImplicitMT(cores)
+        return {}
+    if engine == "columnar" and cores > 1:
+        return dict(nChunks=cores, jobs=cores)
+    return {}
+
+
+def fillVariants(engines, cores, readStrategies):
+    # (label, engine, cores, read strategy) of the fill cases; the event loop
+    # is single-threaded, and the label of non-default strategies includes them
+    for engine in engines:
+        for strategy in (readStrategies if engine == "loop" else ["default"]):
+            for n in (cores if engine in ("columnar", "rdf") else [1]):
+                label = engine if strategy == "default" else engine + "+" + strategy
+                yield label, engine, n, strategy
+
+
+def benchFill(workDir, sizes, engines, cores, samples, repeat=1, readStrategies=("default",)):
+    results = {}
+    for size in sizes:
+        for label, engine, n, strategy in fillVariants(engines, cores, readStrategies):
+            options = setCores(engine, n)
+            if engine == "loop":
+                options["readStrategy"] = strategy
+            for samplename in samples:
+                filename = inputFile(workDir, size, samplename)
+                stats = {}
+                def fill():
+                    stats.clear()
+                    return H4l_fill.fillHistos(samplename, filename, engine, stats=stats, **options)
+                histos, (wall, cpu) = timed(fill, repeat)
+                case = "fill/{}/{}/{}/{}cores".format(label, samplename, size, n)
+                results[case] = dict(stage="fill", engine=label, sample=samplename, events=size, cores=n,
+                                     wall=wall, cpu=cpu, phases=stats.get("wall", {}),
+                                     bytesRead=stats.get("bytesRead"), readCalls=stats.get("readCalls"))
+    ROOT.DisableImplicitMT()
+    return results
+
+
+def benchYields(workDir, sizes, repeat=1):
+    import ggZZ_yields
+
+    results = {}
+    for size in sizes:
+        yieldsFile = os.path.join(workDir, "ggZZ_yields_{}.root".format(size))
+        of = ROOT.TFile.Open(yieldsFile, "recreate")
+        # the yields are filled with rdf (the fastest engine of ggZZ_yields),
+        # only printYields is timed
+        for samplename in ggZZSamples:
+            histos = ggZZ_yields.fillHistos(samplename, inputFile(workDir, size, samplename), 27.007, 'rdf')
+            for h in histos.values():
+                of.WriteObject(h, h.GetName())
+        of.Close()
+        _, (wall, cpu) = timed(lambda: ggZZ_yields.printYields(yieldsFile), repeat)
+        results["yields/printYields/{}".format(size)] = dict(stage="yields", events=size, wall=wall, cpu=cpu)
+    return results
+
+
+def writeDrawInputs(workDir, size):
+    """
+    The histogram files read by the draw scripts, filled from the synthetic
+    inputs with the columnar engine.
+    """
+
+    mcSamples = signalSamples + backgroundSamples + ggZZSamples
+    outFiles = dict(MC2018 = mcSamples, MC2022 = mcSamples, MC2022EE = mcSamples, Data_CD = ['Data'], Data_EFG = ['Data'])
+    histoFiles = {}
+    for name, samples in outFiles.items():
+        outFile = os.path.join(workDir, "H4l_{}_{}.root".format(name, size))
+        if not os.path.exists(outFile):
+            histos = []
+            for samplename in samples:
+                histos += H4l_fill.fillHistos(samplename, inputFile(workDir, size, samplename), "columnar")
+            H4l_histos.writeHistos(outFile, histos, isData=name.startswith("Data"))
+        histoFiles[name] = outFile
+    return histoFiles
+
+
+def renderPlot(draw, store, finalState, version, outDir):
+    # the plot function of the draw script, exported as by the script, with
+    # its printout and the ROOT info messages suppressed
+    ignoreLevel = ROOT.gErrorIgnoreLevel
+    ROOT.gErrorIgnoreLevel = ROOT.kWarning
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            H4l_render.RenderTracker(outDir).export(*draw.plotM4l(store, finalState, version))
+    finally:
+        ROOT.gErrorIgnoreLevel = ignoreLevel
+
+
+def benchDraw(workDir, outDir, size, repeat=1):
+    import H4l_draw_mZZ_full2022 as draw
+
+    histoFiles = writeDrawInputs(workDir, size)
+    results = {}
+    # reading the inputs, then loading the saved store
+    storeDir = os.path.join(workDir, "histostore")
+    shutil.rmtree(storeDir, ignore_errors=True)
+    for step in ("read", "load"):
+        store, (wall, cpu) = timed(lambda: H4l_histostore.HistoStore(histoFiles, cacheDir=storeDir), 1)
+        results["draw/store/" + step] = dict(stage="draw", events=size, wall=wall, cpu=cpu)
+    eras = {era: store.era(era) for era in histoFiles}
+
+    for fs in ['fs_4e', 'fs_4mu', 'fs_2e2mu', 'fs_4l']:
+        for version in ['_4GeV_', '_2GeV_']:
+            stack = lambda: draw.Stack_full2022(eras["MC2018"], eras["MC2022"], eras["MC2022EE"], version, fs)
+            data = lambda: draw.dataGraph(eras["Data_CD"], eras["Data_EFG"], version, fs, blind=draw.blindPlots)
+            _, tStack = timed(stack, repeat)
+            _, tData = timed(data, repeat)
+            _, tRender = timed(lambda: renderPlot(draw, store, fs, version, outDir), repeat)
+            for step, (wall, cpu) in (("Stack_full2022", tStack), ("dataGraph", tData), ("render", tRender)):
+                results["draw/{}/{}/{}".format(step, version.strip("_"), fs)] = dict(stage="draw", events=size, wall=wall, cpu=cpu)
+    return results
+
+
+def compare(results, baseline, tolerance, minDelta=0.05):
+    """
+    The cases slower than in the baseline by more than the tolerance (a
+    fraction) and by more than minDelta seconds, as (case, baseline, current).
+    """
+
+    regressions = []
+    for case, r in sorted(results.items()):
+        base = baseline["results"].get(case)
+        if base is None: continue
+        if r["wall"] > base["wall"]*(1+tolerance) and r["wall"]-base["wall"] > minDelta:
+            regressions.append((case, base["wall"], r["wall"]))
+    return regressions
+
+
+def scalingGraph(points, name, xtitle):
+    points = sorted(points)
+    graph = ROOT.TGraph(len(points))
+    for i, (x, y) in enumerate(points):
+        graph.SetPoint(i, x, y)
+    graph.SetName(name)
+    graph.SetTitle(name)
+    graph.SetMarkerStyle(20)
+    return graph
+
+
+def drawScaling(results, outDir):
+    """
+    Draw the fill time vs the number of events (1 core) and vs the number of
+    cores (largest size), summed over the samples, one curve per engine.
+    """
+
+    fills = [r for r in results.values() if r["stage"] == "fill"]
+    engines = sorted(set(r["engine"] for r in fills))
+    maxSize = max(r["events"] for r in fills)
+    curves = {}
+    for axis, xtitle in (("events", "events per sample"), ("cores", "cores")):
+        multi = ROOT.TMultiGraph("scaling_" + axis, ";{};fill time (s)".format(xtitle))
+        legend = ROOT.TLegend(0.15, 0.70, 0.40, 0.88)
+        for color, engine in enumerate(engines, start=1):
+            times = {}
+            for r in fills:
+                if r["engine"] != engine: continue
+                if axis == "events" and r["cores"] != 1: continue
+                if axis == "cores" and r["events"] != maxSize: continue
+                times[r[axis]] = times.get(r[axis], 0.) + r["wall"]
+            curves.setdefault(axis, {})[engine] = sorted(times.items())
+            if not times: continue
+            graph = scalingGraph(times.items(), engine, xtitle)
+            graph.SetMarkerColor(color)
+            graph.SetLineColor(color)
+            multi.Add(graph, "LP")
+            legend.AddEntry(graph, engine, "lp")
+        canvas = ROOT.TCanvas("c_scaling_" + axis, "scaling_" + axis, 800, 600)
+        if axis == "events":
+            canvas.SetLogx()
+            canvas.SetLogy()
+        multi.Draw("A")
+        legend.Draw()
+        canvas.Print(os.path.join(outDir, "scaling_{}.png".format(axis)))
+        canvas.Close()
+    return curves
+
+
+def printResults(results, baseline=None):
+    for case, r in sorted(results.items()):
+        line = "{:<50} {:9.3f} s".format(case, r["wall"])
+        if r.get("readCalls"):
+            line += "  {:6d} reads, {:7.1f} kB/read".format(r["readCalls"], r["bytesRead"]/r["readCalls"]/1e3)
+        base = baseline["results"].get(case) if baseline else None
+        if base:
+            line += "  (baseline {:.3f} s, {:+.0%})".format(base["wall"], r["wall"]/base["wall"]-1 if base["wall"] else 0.)
+        print(line)
+
+
+def main(args):
+
+    os.makedirs(args.outdir, exist_ok=True)
+    results = {}
+    if "fill" in args.stages:
+        samples = args.samples or ['ggH125', 'ZZTo4l', 'Data']
+        results.update(benchFill(args.work_dir, args.sizes, args.engines, args.cores, samples, args.repeat,
+                                 args.read_strategies))
+    if "yields" in args.stages:
+        results.update(benchYields(args.work_dir, args.sizes, args.repeat))
+    if "draw" in args.stages:
+        results.update(benchDraw(args.work_dir, args.outdir, min(args.sizes), args.repeat))
+
+    report = dict(revision = gitRevision(),
+                  created = time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  host = platform.node(),
+                  results = results)
+    if any(r["stage"] == "fill" for r in results.values()):
+        report["scaling"] = drawScaling(results, args.outdir)
+    with open(os.path.join(args.outdir, "benchmark_{}.json".format(report["revision"])), "w") as f:
+        json.dump(report, f, indent=1)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    printResults(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print("Baseline saved in", args.baseline, "for revision", report["revision"])
+        return 0
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for case, before, after in regressions:
+            print("SLOWER: {} {:.3f} s -> {:.3f} s (baseline revision {})".format(case, before, after, baseline["revision"]))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description='Benchmark the H4l fill, yields and draw stages on synthetic inputs')
+    parser.add_argument('--stages', nargs='+', choices=['fill', 'yields', 'draw'], default=['fill', 'yields', 'draw'])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000], help='events per synthetic sample (default: %(default)s)')
+    parser.add_argument('--engines', nargs='+', choices=['loop', 'columnar', 'rdf'], default=['loop', 'columnar', 'rdf'])
+    parser.add_argument('--cores', nargs='+', type=int, default=[1, 2, 4],
+                        help='numbers of cores for the columnar and rdf engines (default: %(default)s)')
+    parser.add_argument('--read-strategies', nargs='+', choices=H4l_treecache.strategies, default=['default'],
+                        help='read strategies of the loop engine, compared as separate cases (default: %(default)s)')
+    parser.add_argument('--samples', nargs='+', help='samples filled in the fill stage (default: ggH125 ZZTo4l Data)')
+    parser.add_argument('--repeat', type=int, default=1, help='repetitions of each case; the fastest is kept (default: %(default)s)')
+    parser.add_argument('--work-dir', default='benchmark_work', help='directory of the synthetic inputs (default: %(default)s)')
+    parser.add_argument('--outdir', default='benchmark_results', help='directory of the results and plots (default: %(default)s)')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fractional slowdown with respect to the baseline reported as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -0,0 +1,371 @@
+### Columnar fill engine for H4l nanoAODs.
+# Branches are read in bulk as NumPy arrays, the best candidate is gathered
+# with fancy indexing and histograms are filled in one batch operation per
+# histogram instead of one TH1::Fill call per event.
+#
+# The batch fills reproduce TH1::Fill exactly: bins are found with the same
+# arithmetic as TAxis::FindFixBin, weights are accumulated in event order
+# with the precision of the histogram storage (Float_t for TH1F/TH2F) and
+# Sumw2 in double precision.
+
+import concurrent.futures
+import multiprocessing
+
+import numpy as np
+import awkward as ak
+import uproot
+
+import H4l_instrument
+
+
+# Z flavour codes (product of the pdgIds of the two leptons)
+Zflav_mumu = -169
+Zflav_ee   = -121
+
+candBranches = ["mass", "Z1mass", "Z2mass", "KD", "Z1flav", "Z2flav"]
+
+
+eventIdBranches = ["run", "luminosityBlock", "event"]
+
+
+def candidateVariables(variables=candBranches):
+    """
+    The ZZCand variables to read: the requested ones plus the Z flavours,
+    which are always needed to split final states.
+    """
+
+    return list(dict.fromkeys(list(variables) + ["Z1flav", "Z2flav"]))
+
+
+def eventBranches(isMC, eventIds=False, variables=candBranches):
+    """
+    The Events branches read by readBestCandidates: only those needed for the
+    selection, the weight, and the requested ZZCand variables.
+    """
+
+    branches = ["bestCandIdx", "HLT_passZZ4l"] + ["ZZCand_"+b for b in candidateVariables(variables)]
+    if isMC:
+        branches += ["overallEventWeight", "ZZCand_dataMCWeight"]
+    if eventIds:
+        branches += eventIdBranches
+    return branches
+
+
+def readBestCandidates(filename, isMC, genEventSumw=1., entryStart=None, entryStop=None, eventIds=False,
+                       variables=candBranches, stats=None):
+    """
+    Read the best ZZ candidate of each selected event as flat NumPy arrays.
+
+    Parameters
+    ----------
+    filename : str
+        The nanoAOD file to read.
+    isMC : bool
+        If True, also read the weights and compute the per-event MC weight.
+    genEventSumw : float
+        The sum of generator weights used to normalize MC weights.
+    entryStart, entryStop : int, optional
+        Restrict the read to this range of entries of the Events tree.
+    eventIds : bool
+        If True, also return run, luminosityBlock and event.
+    variables : List[str]
+        The ZZCand variables to read (Z1flav and Z2flav are always read).
+    stats : dict, optional
+        If given, the bytes read and decompressed, the entries read and
+        selected and the time spent opening, reading and selecting are added
+        to it (see H4l_instrument).
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        One array per ZZCand variable read, plus `weight`,
+        with one element per event passing bestCandIdx != -1 and HLT_passZZ4l.
+    """
+
+    branches = eventBranches(isMC, eventIds, variables)
+    with H4l_instrument.phase(stats, "open"):
+        f = uproot.open(filename)
+    with f:
+        tree = f["Events"]
+        with H4l_instrument.phase(stats, "read"):
+            arrays = tree.arrays(branches, entry_start=entryStart, entry_stop=entryStop, library="ak")
+        if stats is not None:
+            start, stop = (entryStart or 0), min(entryStop or tree.num_entries, tree.num_entries)
+            H4l_instrument.add(stats, bytesRead = f.file.source.num_requested_bytes, readCalls = f.file.source.num_requests,
+                               entries = len(arrays),
+                               bytesDecompressed = H4l_instrument.uncompressedBytes(tree, branches, start, stop))
+
+    with H4l_instrument.phase(stats, "select"):
+        cands = bestCandidates(arrays, isMC, genEventSumw, eventIds, variables)
+    H4l_instrument.add(stats, selected = len(cands["weight"]))
+    return cands
+
+
+def gatherBest(arrays, idxBranch, collection, variables, sel):
+    """
+    Values of the variables of a collection (e.g. ZZCand) at the per-event
+    index stored in idxBranch (e.g. bestCandIdx), for the events in sel.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        One flat array per variable, with one element per selected event.
+    """
+
+    bestIdx = ak.to_numpy(arrays[idxBranch]).astype(np.int64)
+
+    # Position of the best object in the flattened collection arrays
+    nObjects = ak.to_numpy(ak.num(arrays[collection+"_"+variables[0]])).astype(np.int64)
+    offsets = np.cumsum(nObjects) - nObjects
+    flatIdx = offsets[sel] + bestIdx[sel]
+
+    return {var: ak.to_numpy(ak.flatten(arrays[collection+"_"+var]))[flatIdx] for var in variables}
+
+
+def bestCandidates(arrays, isMC, genEventSumw=1., eventIds=False, variables=candBranches):
+    """
+    Select events and gather their best candidate from Events arrays already
+    read (see readBestCandidates for the parameters and returned arrays).
+    """
+
+    bestCandIdx = ak.to_numpy(arrays["bestCandIdx"])
+    sel = (bestCandIdx != -1) & ak.to_numpy(arrays["HLT_passZZ4l"]).astype(bool)
+
+    cands = gatherBest(arrays, "bestCandIdx", "ZZCand",
+                       candidateVariables(variables) + (["dataMCWeight"] if isMC else []), sel)
+    if eventIds:
+        for b in eventIdBranches:
+            cands[b] = ak.to_numpy(arrays[b])[sel]
+
+    if isMC:
+        # Same operation order (and double precision) as the event loop
+        overallEventWeight = ak.to_numpy(arrays["overallEventWeight"])[sel].astype(np.float64)
+        dataMCWeight = cands.pop("dataMCWeight").astype(np.float64)
+        cands["weight"] = overallEventWeight*dataMCWeight/genEventSumw
+    else:
+        cands["weight"] = np.ones(np.count_nonzero(sel))
+
+    return cands
+
+
+def clusterRanges(filename, nChunks, isMC=True, variables=candBranches):
+    """
+    Split the Events tree into at most nChunks ranges of entries of similar
+    size, with boundaries on the entries where the baskets of all the read
+    branches start (i.e. on cluster boundaries), so that no basket is read
+    and decompressed by more than one chunk.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        The (entryStart, entryStop) of each chunk, in entry order.
+    """
+
+    with uproot.open(filename) as f:
+        tree = f["Events"]
+        boundaries = tree.common_entry_offsets(filter_name=eventBranches(isMC, variables=variables))
+
+    nEntries = boundaries[-1]
+    ranges = []
+    start = 0
+    for iChunk in range(1, nChunks+1):
+        # first cluster boundary at or after the ideal stop of this chunk
+        target = nEntries*iChunk/nChunks
+        stop = next(b for b in boundaries if b >= target)
+        if stop > start:
+            ranges.append((start, stop))
+            start = stop
+    return ranges or [(0, nEntries)]
+
+
+def _readChunk(filename, isMC, genEventSumw, entryStart, entryStop, eventIds, variables):
+    # Executed in a worker process: returns the arrays and the read statistics
+    stats = {}
+    cands = readBestCandidates(filename, isMC, genEventSumw, entryStart, entryStop, eventIds, variables, stats)
+    return cands, stats
+
+
+def readBestCandidatesChunked(filename, isMC, genEventSumw=1., nChunks=1, jobs=1, eventIds=False,
+                              variables=candBranches, stats=None):
+    """
+    Same as readBestCandidates, but the file is split with clusterRanges into
+    nChunks entry ranges read by a pool of jobs worker processes.
+
+    The per-chunk arrays are concatenated in entry order, so filling from
+    them gives exactly the same histograms as reading the file in one go.
+    genEventSumw is computed by the caller once per file and shared by all
+    chunks.
+    """
+
+    ranges = clusterRanges(filename, nChunks, isMC, variables)
+    args = [(filename, isMC, genEventSumw, start, stop, eventIds, variables) for start, stop in ranges]
+    if jobs <= 1 or len(ranges) <= 1:
+        results = [_readChunk(*a) for a in args]
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+            futures = [pool.submit(_readChunk, *a) for a in args]
+            results = [fut.result() for fut in futures]
+
+    parts = [cands for cands, chunkStats in results]
+    if stats is not None:
+        # times are summed over the chunks, i.e. over the workers
+        for cands, chunkStats in results:
+            H4l_instrument.merge(stats, chunkStats)
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def finalStateMasks(Z1flav, Z2flav):
+    """
+    Split candidates into final states, with the same logic as the event loop.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Boolean masks for '4mu', '4e', '2e2mu', and 'other' for candidates
+        with unexpected Z flavours.
+    """
+
+    mumu1 = Z1flav == Zflav_mumu
+    ee1   = Z1flav == Zflav_ee
+    mumu2 = Z2flav == Zflav_mumu
+    ee2   = Z2flav == Zflav_ee
+
+    masks = {'4mu':   mumu1 & mumu2,
+             '4e':    ee1 & ee2,
+             '2e2mu': (mumu1 & ee2) | (ee1 & mumu2)}
+    masks['other'] = ~(masks['4mu'] | masks['4e'] | masks['2e2mu'])
+    return masks
+
+
+def printZflavErrors(cands):
+    other = finalStateMasks(cands["Z1flav"], cands["Z2flav"])['other']
+    for Z1flav, Z2flav in zip(cands["Z1flav"][other], cands["Z2flav"][other]):
+        print('error in Zflav ',Z1flav,Z2flav)
+
+
+def checkZflav(cands, fsMask=None):
+    """
+    Check the Z flavours of candidates read with their event ids.
+
+    Raises
+    ------
+    ValueError
+        For the first candidate with unexpected Z flavours.
+    """
+
+    if fsMask is None:
+        fsMask = finalStateMasks(cands['Z1flav'], cands['Z2flav'])
+    if fsMask['other'].any():
+        i = np.flatnonzero(fsMask['other'])[0]
+        raise ValueError(f"Error in event {cands['run'][i]}:{cands['luminosityBlock'][i]}:{cands['event'][i]}: "
+                         f"found Z1flav={cands['Z1flav'][i]}, Z2flav={cands['Z2flav'][i]}!")
+
+
+def findFixBin(axis, x):
+    """
+    Vectorized TAxis::FindFixBin for an axis with fixed bin widths.
+    Underflows go to bin 0, overflows (and NaN) to bin nbins+1.
+    """
+
+    return findBin(axis.GetNbins(), axis.GetXmin(), axis.GetXmax(), x)
+
+
+def findBin(nbins, xmin, xmax, x):
+    """
+    findFixBin for an axis given by its binning.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    inRange = (x >= xmin) & (x < xmax)
+    bins = np.full(x.shape, nbins+1, dtype=np.int64)
+    bins[x < xmin] = 0
+    bins[inRange] = 1 + (nbins*(x[inRange]-xmin)/(xmax-xmin)).astype(np.int64)
+    np.clip(bins, 0, nbins+1, out=bins)
+    return bins
+
+
+def _storageType(h):
+    if h.InheritsFrom("TArrayF"):
+        return np.float32
+    return np.float64
+
+
+def _addToHisto(h, globalBins, w, stats):
+    """
+    Accumulate weights into the cells of h in event order, with the precision
+    of the histogram storage, and update Sumw2, statistics and entries.
+    """
+
+    nCells = h.GetNcells()
+    dtype = _storageType(h)
+
+    content = np.array([h.GetBinContent(i) for i in range(nCells)], dtype=dtype)
+    np.add.at(content, globalBins, w.astype(dtype))
+
+    sumw2 = h.GetSumw2()
+    if sumw2.GetSize() == 0:
+        h.Sumw2()
+        sumw2 = h.GetSumw2()
+    sumw2Array = np.array([sumw2.At(i) for i in range(nCells)], dtype=np.float64)
+    np.add.at(sumw2Array, globalBins, w*w)
+
+    oldStats = np.zeros(len(stats), dtype=np.float64)
+    h.GetStats(oldStats)
+    setHisto(h, content, sumw2Array, oldStats + np.array(stats, dtype=np.float64), h.GetEntries() + len(w))
+
+
+def setHisto(h, content, sumw2, stats, entries):
+    """
+    Set the cell contents, Sumw2, statistics and number of entries of h.
+    """
+
+    if h.GetSumw2().GetSize() == 0:
+        h.Sumw2()
+    h.SetContent(np.asarray(content, dtype=np.float64))
+    h.GetSumw2().Set(h.GetNcells(), np.asarray(sumw2, dtype=np.float64))
+    h.PutStats(np.asarray(stats, dtype=np.float64))
+    h.SetEntries(entries)
+
+
+def fillH1(h, x, w):
+    """
+    Fill a 1D histogram with arrays of values and weights.
+    Equivalent to calling h.Fill(x[i], w[i]) for each i, in order.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    if len(x) == 0: return
+
+    xbins = findFixBin(h.GetXaxis(), x)
+    inRange = (xbins >= 1) & (xbins <= h.GetNbinsX())
+    wi = w[inRange]
+    xi = x[inRange]
+    stats = [wi.sum(), (wi*wi).sum(), (wi*xi).sum(), (wi*xi*xi).sum()]
+    _addToHisto(h, xbins, w, stats)
+
+
+def fillH2(h, x, y, w):
+    """
+    Fill a 2D histogram with arrays of values and weights.
+    Equivalent to calling h.Fill(x[i], y[i], w[i]) for each i, in order.
+    """
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    if len(x) == 0: return
+
+    nbinsX = h.GetNbinsX()
+    nbinsY = h.GetNbinsY()
+    xbins = findFixBin(h.GetXaxis(), x)
+    ybins = findFixBin(h.GetYaxis(), y)
+    globalBins = xbins + (nbinsX+2)*ybins
+    inRange = (xbins >= 1) & (xbins <= nbinsX) & (ybins >= 1) & (ybins <= nbinsY)
+    wi = w[inRange]
+    xi = x[inRange]
+    yi = y[inRange]
+    stats = [wi.sum(), (wi*wi).sum(), (wi*xi).sum(), (wi*xi*xi).sum(),
+             (wi*yi).sum(), (wi*yi*yi).sum(), (wi*xi*yi).sum()]
+    _addToHisto(h, globalBins, w, stats)
@@ -0,0 +1,133 @@
+### Datasets made of several part files.
+# The filename of a sample can be a single file, a glob pattern (e.g.
+# .../ggH125/ZZ4lAnalysis_*.root) or a list of files. The parts of a dataset
+# are filled separately, one after the other or in the worker processes of
+# H4l_fill.py -j, with MC weights normalized to the sum of generator weights
+# of all the parts, and their histograms are added.
+#
+# A part that cannot be read is reported (on the output and in the
+# instrumentation report) and skipped instead of aborting the production;
+# MC histograms are then normalized to the parts that were filled. A dataset
+# none of whose parts could be filled is an error.
+
+import glob
+
+import H4l_instrument
+import H4l_sumw
+
+
+def expandFiles(filename):
+    """
+    The part files of a dataset: the files of a list, the files matching a
+    glob pattern (sorted), or a single (possibly remote) file.
+
+    Raises
+    ------
+    FileNotFoundError
+        If no file matches the pattern.
+    """
+
+    if isinstance(filename, (list, tuple)):
+        return list(filename)
+    if "://" not in filename and any(c in filename for c in "*?["):
+        parts = sorted(glob.glob(filename))
+        if not parts:
+            raise FileNotFoundError(f'No files match {filename}')
+        return parts
+    return [filename]
+
+
+def failure(part, error):
+    return dict(file = part, error = "{}: {}".format(type(error).__name__, error))
+
+
+def partSumw(parts, isMC, maxEntriesPerSample=None):
+    """
+    Sum of generator weights of each part (None for data).
+
+    Returns
+    -------
+    Tuple[Dict[str, float], List[dict]]
+        The sums of the parts that can be read, in part order, and the
+        failures of the others.
+    """
+
+    sumw = {}
+    failures = []
+    for part in parts:
+        if not isMC:
+            sumw[part] = None
+            continue
+        try:
+            sumw[part] = H4l_sumw.getGenEventSumw(part, maxEntriesPerSample)
+        except Exception as e:
+            failures.append(failure(part, e))
+    return sumw, failures
+
+
+def totalSumw(sumw, parts=None):
+    """
+    Sum of generator weights of the parts (all by default); None for data.
+    """
+
+    values = [sumw[p] for p in (sumw if parts is None else parts) if sumw.get(p) is not None]
+    return sum(values) if values else None
+
+
+def printFailures(samplename, nParts, failures):
+    if not failures: return
+    print(samplename, ": {} of {} parts failed and were skipped".format(len(failures), nParts))
+    for f in failures:
+        print("    {}: {}".format(f["file"], f["error"]))
+
+
+def mergeParts(samplename, nParts, results, sumw, failures, stats=None):
+    """
+    Add the histograms of the parts of a dataset.
+
+    Parameters
+    ----------
+    samplename : str
+        The sample name.
+    nParts : int
+        Number of parts of the dataset.
+    results : Dict[str, Tuple[list, dict]]
+        The histograms and instrumentation stats of the parts filled.
+    sumw : Dict[str, float]
+        Sum of generator weights of the parts (see partSumw).
+    failures : List[dict]
+        The parts that failed (see failure).
+    stats : dict
+        Receives the sum of the stats of the parts.
+
+    Returns
+    -------
+    list
+        The histograms, in the order of those of each part.
+
+    Raises
+    ------
+    IOError
+        If no part could be filled.
+    """
+
+    printFailures(samplename, nParts, failures)
+    for histos, partStats in results.values():
+        if stats is not None:
+            H4l_instrument.merge(stats, partStats)
+    if not results:
+        raise IOError(f'{samplename}: none of the {nParts} parts could be filled')
+
+    lists = [histos for histos, partStats in results.values()]
+    merged = lists[0]
+    for histos in lists[1:]:
+        for h, other in zip(merged, histos):
+            h.Add(other)
+
+    # weights were normalized to the sum of weights of all the parts
+    total = totalSumw(sumw)
+    filled = totalSumw(sumw, results)
+    if total and filled and filled != total:
+        for h in merged:
+            h.Scale(total/filled)
+    return merged
@@ -4,8 +4,11 @@
 #
 # run 
 # python3 H4l_draw_mZZ_periods2022.py
+# or, rendering the plots in 8 worker processes, as png and pdf:
+# python3 H4l_draw_mZZ_periods2022.py -j 8 --formats png pdf
 
 from __future__ import print_function
+import argparse
 import glob
 import optparse
 import os
@@ -16,6 +19,10 @@ import math
 import ctypes
 import ROOT
 import CMSGraphics, CMS_lumi
+import H4l_histos
+import H4l_histostore
+import H4l_render
+import H4l_zx
 import numpy as np
 from array import array
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -27,12 +34,6 @@ inFilenameData2022   = "H4l_Data_CD.root"
 inFilenameData2022EE = "H4l_Data_EFG.root"
 outFilename = "Plots.root"
 
-## output directory
-today = date.today()
-print('Creating output dir...')
-out_dir = str(today)+'_plots_mZZ'
-os.makedirs(out_dir, exist_ok=True) #check if output dir exist
-
 ### 2018 plots
 #Lum = 59.74 # 1/fb
 #pathMC = "/eos/user/n/namapane/H4lnano/220420/"
@@ -81,50 +82,13 @@ canvasSizeY=700
 
 #ZX estaimation parameters - taken from 2018 data - approx. normalization, just for visualization purposes
 def getZX(h_model, finalState) :
-    n_entries = 10000
-    bin_down  = 70.
-    bin_up    = 3000.
     lumi2018  = 59.7*1000. # to normalize
-   
-    f_4e_comb    = ROOT.TF1("f_4e_comb", "TMath::Landau(x, [0], [1])", bin_down, bin_up)
-    f_4mu_comb   = ROOT.TF1("f_4mu_comb","TMath::Landau(x, [0], [1])", bin_down, bin_up)
-    f_2e2mu_comb = ROOT.TF1("f_2e2mu_comb","[0]*TMath::Landau(x, [1], [2]) + [3]*TMath::Landau(x, [4], [5])", bin_down, bin_up)
-
-    f_4e_comb.SetParameters(141.9, 21.3)
-    f_4mu_comb.SetParameters(130.4, 15.6)
-    f_2e2mu_comb.SetParameters(0.45,131.1,18.1, 0.55,133.8,18.9)
-
-    yield_Comb_4e_2018    = 19.42/lumi2018
-    yield_Comb_4mu_2018   = 50.72/lumi2018
-    yield_Comb_2e2mu_2018 = 63.87/lumi2018
-
-    h_4e=h_model.Clone("ZX_4e")
-    h_4e.Reset()
-#    h_4e.SetFillColor(ROOT.TColor.GetColor("#0331B9"))
-    h_4mu=h_4e.Clone("ZX_4mu")
-    h_2e2mu=h_4e.Clone("ZX_2e2mu")
-    
-    h_4e.FillRandom("f_4e_comb"   , n_entries)
-    h_4mu.FillRandom("f_4mu_comb"  , n_entries)
-    h_2e2mu.FillRandom("f_2e2mu_comb", n_entries)
-
-    h_4e.Scale(yield_Comb_4e_2018/h_4e.Integral())
-    h_4mu.Scale(yield_Comb_4mu_2018/h_4mu.Integral())
-    h_2e2mu.Scale(yield_Comb_2e2mu_2018/h_2e2mu.Integral())
-    
-
-    if(finalState == 'fs_4e'):
-        h_total = h_4e
-    elif(finalState == 'fs_4mu'):
-        h_total = h_4mu
-    elif(finalState == 'fs_2e2mu'):
-        h_total = h_2e2mu
-    elif(finalState == 'fs_4l'):
-        h_total=h_4e.Clone("ZX_tot")
-        h_total.Add(h_4mu)
-        h_total.Add(h_2e2mu)
-    else:
-        raise ValueError('Error: wrong final state!')
+    yields = {
+        '4e':    19.42/lumi2018,
+        '4mu':   50.72/lumi2018,
+        '2e2mu': 63.87/lumi2018,
+    }
+    h_total = H4l_zx.zxHisto(h_model, finalState, yields)
 
     print('Final State:', finalState)
     print("Z+X integral", h_total.Integral())
@@ -132,11 +96,6 @@ def getZX(h_model, finalState) :
 
 
 #####################
-def printCanvases(type="png", path=".") :
-    canvases = ROOT.gROOT.GetListOfCanvases()
-    for c in canvases :
-        c.Print(path+"/"+c.GetTitle()+"."+type)
-
 def printCanvas(c, type="png", name=None, path="." ) :
     if name == None : name = c.GetTitle()
     name=name.replace(">","")
@@ -163,14 +122,17 @@ def Stack(f2018, f2022, lumi, version = "_4GeV_", finalState = 'fs_4l'):
     # define histo name
     name = "ZZMass" + version + fs_string
     print('hist name: ', name)
+    # inclusive (4l) histograms are summed from the three final states
+    observable = "ZZMass" + version.rstrip("_")
+    fs = fs_string.rstrip("_")
 
     
     #------------EW------------------#
-    WWZ  = f2022.Get(name+"WWZ")
-    WZZ  = f2022.Get(name+"WZZ")
-    ZZZ  = f2022.Get(name+"ZZZ")
-    TTWW = f2022.Get(name+"TTWW")
-    TTZZ = f2022.Get(name+"TTZZ")
+    WWZ  = f2022.readHisto(observable, fs, "WWZ")
+    WZZ  = f2022.readHisto(observable, fs, "WZZ")
+    ZZZ  = f2022.readHisto(observable, fs, "ZZZ")
+    TTWW = f2022.readHisto(observable, fs, "TTWW")
+    TTZZ = f2022.readHisto(observable, fs, "TTZZ")
     EWSamples = [WZZ, ZZZ, TTWW, TTZZ]
     EW = WWZ.Clone("h_EW")
     for i in EWSamples:
@@ -182,20 +144,20 @@ def Stack(f2018, f2022, lumi, version = "_4GeV_", finalState = 'fs_4l'):
 
     
     #-----------qqZZ---------------#
-    ZZTo4l = f2022.Get(name+"ZZTo4l")
+    ZZTo4l = f2022.readHisto(observable, fs, "ZZTo4l")
     ZZTo4l.Scale(lumi*1000.) 
        
     ZZTo4l.SetLineColor(ROOT.TColor.GetColor("#000099"))
     ZZTo4l.SetFillColor(ROOT.TColor.GetColor("#99ccff"))
     
     #-----------signal------------#
-    VBF125     = f2022.Get(name+"VBF125")
-    ggH125     = f2022.Get(name+"ggH125")
-    WplusH125  = f2022.Get(name+"WplusH125")
-    WminusH125 = f2022.Get(name+"WHminus125")
-    ZH125      = f2022.Get(name+"ZH125")
-    ttH125     = f2022.Get(name+"ttH125")
-    bbH125     = f2022.Get(name+"bbH125")
+    VBF125     = f2022.readHisto(observable, fs, "VBF125")
+    ggH125     = f2022.readHisto(observable, fs, "ggH125")
+    WplusH125  = f2022.readHisto(observable, fs, "WplusH125")
+    WminusH125 = f2022.readHisto(observable, fs, "WHminus125")
+    ZH125      = f2022.readHisto(observable, fs, "ZH125")
+    ttH125     = f2022.readHisto(observable, fs, "ttH125")
+    bbH125     = f2022.readHisto(observable, fs, "bbH125")
 
     signalSamples = [ggH125, WplusH125, WminusH125, ZH125, ttH125, bbH125]
     signal = VBF125.Clone("h_signal")
@@ -209,12 +171,12 @@ def Stack(f2018, f2022, lumi, version = "_4GeV_", finalState = 'fs_4l'):
     
     #------------ggTo-----------------#
     # from 2018 for now
-    ggTo4mu     = f2018.Get(name+"ggTo4mu") 
-    ggTo4e      = f2018.Get(name+"ggTo4e")
-    ggTo4tau    = f2018.Get(name+"ggTo4tau")
-    ggTo2e2mu   = f2018.Get(name+"ggTo2e2mu")
-    ggTo2e2tau  = f2018.Get(name+"ggTo2e2tau")
-    ggTo2mu2tau = f2018.Get(name+"ggTo2mu2tau")
+    ggTo4mu     = f2018.readHisto(observable, fs, "ggTo4mu") 
+    ggTo4e      = f2018.readHisto(observable, fs, "ggTo4e")
+    ggTo4tau    = f2018.readHisto(observable, fs, "ggTo4tau")
+    ggTo2e2mu   = f2018.readHisto(observable, fs, "ggTo2e2mu")
+    ggTo2e2tau  = f2018.readHisto(observable, fs, "ggTo2e2tau")
+    ggTo2mu2tau = f2018.readHisto(observable, fs, "ggTo2mu2tau")
 
     ggZZSamples = [ ggTo4e, ggTo4tau, ggTo2e2mu, ggTo2e2tau, ggTo2mu2tau]
     ggToZZ = ggTo4mu.Clone("h_ggTo")
@@ -233,12 +195,8 @@ def Stack(f2018, f2022, lumi, version = "_4GeV_", finalState = 'fs_4l'):
     
     
     #------------------Stack----------#
-    if version=="_4GeV_" :
-        hs = ROOT.THStack("Stack_4GeV", "; m_{#it{4l}} (GeV) ; Events / 4 GeV" )
-    elif version=="_10GeV_" :
-        hs = ROOT.THStack("Stack_10GeV", "; m_{#it{4l}} (GeV) ; Events / 10 GeV" )
-    else:
-        hs = ROOT.THStack("Stack_2GeV", "; m_{#it{4l}} (GeV) ; Events / 2 GeV" )
+    # axis titles from the histogram registry used by H4l_fill.py
+    hs = ROOT.THStack("Stack" + version.rstrip("_"), H4l_histos.axisTitles(observable))
 
     hs.Add(hzx,"HISTO")
     hs.Add(EW,"HISTO")
@@ -267,27 +225,26 @@ def dataGraph (f, version = "_4GeV_", finalState = 'fs_4l', blind = True):
     # define histo name
     name = "ZZMass"+ version + fs_string
     print(name)
-    hd = f.Get(name+"Data")
-    
-    nbinsIn = hd.GetNbinsX()
-    nbins = 0
+    observable = "ZZMass" + version.rstrip("_")
+    fs = fs_string.rstrip("_")
+    hd = f.readHisto(observable, fs, "Data")
     
-    x = np.array([0.]*nbinsIn, dtype='double')
-    y = np.array([0.]*nbinsIn, dtype='double')
-    errX = np.array([0.]*nbinsIn, dtype='double')  
-    UpErr = np.array([0.]*nbinsIn, dtype='double')
-    LowErr = np.array([0.]*nbinsIn, dtype='double')
-
-    for i in range (1, nbinsIn):
-        if blind and ((hd.GetBinCenter(i)>=blindHLow and hd.GetBinCenter(i)<=blindHHi) or hd.GetBinCenter(i)>=blindHM) : continue
-        if not addEmptyBins and hd.GetBinContent(i) == 0 : continue 
-        x[nbins]      = hd.GetBinCenter(i)
-        y[nbins]      = hd.GetBinContent(i)
-        UpErr[nbins]  = hd.GetBinErrorUp(i)
-        LowErr[nbins] = hd.GetBinErrorLow(i)
-        nbins += 1
-
-    Data = ROOT.TGraphAsymmErrors(nbins,x,y,errX,errX,LowErr,UpErr)
+    x, y = H4l_histos.binContents(hd)
+    # the blinded windows and (optionally) empty bins are masked; the last
+    # bin is not drawn
+    keep = np.ones(len(x), dtype=bool)
+    keep[-1] = False
+    if blind:
+        keep &= ~(((x>=blindHLow) & (x<=blindHHi)) | (x>=blindHM))
+    if not addEmptyBins:
+        keep &= (y != 0)
+    bins = np.flatnonzero(keep) + 1
+    LowErr, UpErr = H4l_histos.binErrors(hd, bins)
+    x = x[keep]
+    y = y[keep]
+    errX = np.zeros(len(x))
+
+    Data = ROOT.TGraphAsymmErrors(len(x),x,y,errX,errX,LowErr,UpErr)
     Data.SetMarkerStyle(20)
     Data.SetLineColor(ROOT.kBlack)
     Data.SetMarkerSize(0.9)
@@ -295,18 +252,14 @@ def dataGraph (f, version = "_4GeV_", finalState = 'fs_4l', blind = True):
 
 
 
-## --------------------------------
-if __name__ == "__main__" :
-    
-
-    fMC2018     = ROOT.TFile.Open(inFilenameMC2018,"READ")
-    fMC2022     = ROOT.TFile.Open(inFilenameMC2022,"READ")
-    fMC2022EE   = ROOT.TFile.Open(inFilenameMC2022EE,"READ")
-    fData2022   = ROOT.TFile.Open(inFilenameData2022,"READ")
-    fData2022EE = ROOT.TFile.Open(inFilenameData2022EE,"READ")
-    of = ROOT.TFile.Open(outFilename,"recreate")
+def openStore():
+    # all the input histograms are read once (see H4l_histostore)
+    return H4l_histostore.HistoStore(dict(MC2018 = inFilenameMC2018, MC2022 = inFilenameMC2022, MC2022EE = inFilenameMC2022EE,
+                                          Data_CD = inFilenameData2022, Data_EFG = inFilenameData2022EE),
+                                     observables = ["ZZMass_4GeV", "ZZMass_2GeV"])
 
 
+def logLabels():
     # Labels for log plots
     xlabelsv = [80, 100, 200, 300, 400, 500]
     label_margin = -0.1
@@ -316,136 +269,127 @@ if __name__ == "__main__" :
         xlabels[i].SetTextAlign(23)
         xlabels[i].SetTextFont(42)
         xlabels[i].SetTextSize(0.04)
+    return xlabels
+
+
+### Draw the m4l plot of a data-taking period and final state: full range
+### with log x axis for "_4GeV_", zoomed for "_2GeV_". Returns the canvas and
+### the objects drawn on it, to be kept until the canvas is printed.
+def plotM4l(store, period = '2022CD', finalState = 'fs_4l', version = "_4GeV_"):
+    if(period == '2022CD'):
+        fMC_2 = store.era("MC2022")
+        fData = store.era("Data_CD")
+        lumi = lumi_CD
+        lumiText = '8.1 fb-1'
+    elif(period == '2022EFG'):
+        fMC_2 = store.era("MC2022EE")
+        fData = store.era("Data_EFG")
+        lumi = lumi_EFG
+        lumiText = '27.0 fb-1'
+    else:
+        raise ValueError('Error: wrong data-taking period!')
+
+    zoom = (version == "_2GeV_")
+    HStack, h_list = Stack(store.era("MC2018"), fMC_2, lumi, version, finalState)
+    HData = dataGraph(fData, version, finalState, blind=blindPlots)
+    drawn = [HStack, HData] + h_list
+
+    name = ('M4l_z_' if zoom else 'M4l_')+period+'_'+finalState
+    Canvas = ROOT.TCanvas(name,name, canvasSizeX,canvasSizeY)
+    Canvas.SetTicks()
+    if not zoom:
+        Canvas.SetLogx()
+    #ymaxd=HData.GetMaximum()
+    xmin=ctypes.c_double(0.)
+    ymin=ctypes.c_double(0.)
+    xmax=ctypes.c_double(0.)
+    ymax=ctypes.c_double(0.)
+    HData.ComputeRange(xmin,ymin,xmax,ymax)
+    yhmax=math.ceil(max(HStack.GetMaximum(), ymax.value))
+    HStack.SetMaximum(yhmax)
+    HStack.Draw("histo")
+    HStack.GetXaxis().SetRangeUser(70., 170. if zoom else 300.)
+    if blindPlots:
+        ROOT.gPad.GetRangeAxis(xmin,ymin,xmax,ymax)
+        bblind = ROOT.TBox(blindHLow, 0, blindHHi, ymax.value-epsilon)
+        bblind.SetFillColor(ROOT.kGray)
+        bblind.SetFillStyle(3002)
+        bblind.Draw()
+        drawn.append(bblind)
+    HData.Draw("samePE1")
+    if not zoom:
+        # Hide labels and rewrite them
+        HStack.GetXaxis().SetLabelSize(0)
+        xlabels = logLabels()
+        for label in xlabels :
+            label.Draw()
+        drawn += xlabels
+    ROOT.gPad.RedrawAxis()
+
+    legend = ROOT.TLegend(0.72,0.70,0.94,0.92)
+    legend.AddEntry(h_list[4],"H(125)","f")
+    legend.AddEntry(h_list[3],"q#bar{q}#rightarrow ZZ,Z#gamma*","f")
+    legend.AddEntry(h_list[2],"gg#rightarrow ZZ,Z#gamma*","f")
+    legend.AddEntry(h_list[1],"EW","f")
+    legend.AddEntry(h_list[0],"Z+X","f")
+    legend.AddEntry(HData,"Data", "p")
+    legend.SetFillColor(ROOT.kWhite)
+    legend.SetLineColor(ROOT.kWhite)
+    legend.SetTextFont(43)
+    legend.SetTextSize(20)
+    legend.Draw()
+    drawn.append(legend)
+
+    #draw CMS and lumi text
+    CMS_lumi.writeExtraText = True
+    CMS_lumi.extraText      = "Preliminary"
+    CMS_lumi.lumi_sqrtS     = lumiText + " (13.6 TeV)"
+    CMS_lumi.cmsTextSize    = 1 #0.6
+    CMS_lumi.lumiTextSize   = 0.7 #0.46
+    CMS_lumi.extraOverCmsTextSize = 0.75
+    CMS_lumi.relPosX = 0.12
+    CMS_lumi.CMS_lumi(Canvas, 0, 0)
+
+    Canvas.Update() #very important!!!
+    #Canvas.Write()
+    return Canvas, drawn
+
+
+
+## --------------------------------
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description='Draw the m4l plots of the 2022 data-taking periods')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='render the plots in this number of worker processes (ROOT batch mode)')
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=H4l_render.fileTypes,
+                        help='formats of the output plots, all exported from the same drawing')
+    args = parser.parse_args()
+
+    ## output directory
+    today = date.today()
+    print('Creating output dir...')
+    out_dir = str(today)+'_plots_mZZ'
+    os.makedirs(out_dir, exist_ok=True) #check if output dir exist
+
+
+    store = openStore()
+    of = ROOT.TFile.Open(outFilename,"recreate")
+
 
     ## --- plots     
     periods = ['2022CD', '2022EFG']
     finalStates = ['fs_4e', 'fs_4mu', 'fs_2e2mu', 'fs_4l']
-    for p in periods:
-        for fs in finalStates:
-            print(p, fs)
-            
-            if(p == '2022CD'):
-                fMC_2 = fMC2022
-                fData = fData2022
-                lumi = lumi_CD
-                lumiText = '8.1 fb-1'
-            elif(p == '2022EFG'):
-                fMC_2 = fMC2022EE
-                fData = fData2022EE
-                lumi = lumi_EFG
-                lumiText = '27.0 fb-1'
-            else:
-                raise ValueError('Error: wrong data-taking period!')
-
-            ### m4l plot - full range
-            HStack, h_list = Stack(fMC2018, fMC_2, lumi, '_4GeV_', fs)
-            HData = dataGraph(fData, '_4GeV_', fs, blind=blindPlots)
-            HStack_hm = HStack.Clone()
-            HData_hm = HData.Clone()
-          
-            Canvas = ROOT.TCanvas('M4l_'+p+'_'+fs,'M4l_'+p+'_'+fs, canvasSizeX,canvasSizeY)
-            Canvas.SetTicks()
-            Canvas.SetLogx()
-            #ymaxd=HData.GetMaximum()
-            xmin=ctypes.c_double(0.)
-            ymin=ctypes.c_double(0.)
-            xmax=ctypes.c_double(0.)
-            ymax=ctypes.c_double(0.)
-            HData.ComputeRange(xmin,ymin,xmax,ymax)
-            yhmax=math.ceil(max(HStack.GetMaximum(), ymax.value))
-            HStack.SetMaximum(yhmax)
-            HStack.Draw("histo")
-            HStack.GetXaxis().SetRangeUser(70., 300.)
-            if blindPlots:
-                ROOT.gPad.GetRangeAxis(xmin,ymin,xmax,ymax)
-                bblind = ROOT.TBox(blindHLow, 0, blindHHi, ymax.value-epsilon)
-                bblind.SetFillColor(ROOT.kGray)
-                bblind.SetFillStyle(3002)
-                bblind.Draw()
-            HData.Draw("samePE1")
-            # Hide labels and rewrite them
-            HStack.GetXaxis().SetLabelSize(0)
-            for label in xlabels :
-                label.Draw()
-            ROOT.gPad.RedrawAxis()
-        
-            legend = ROOT.TLegend(0.72,0.70,0.94,0.92)
-            legend.AddEntry(h_list[4],"H(125)","f")
-            legend.AddEntry(h_list[3],"q#bar{q}#rightarrow ZZ,Z#gamma*","f")
-            legend.AddEntry(h_list[2],"gg#rightarrow ZZ,Z#gamma*","f")
-            legend.AddEntry(h_list[1],"EW","f")
-            legend.AddEntry(h_list[0],"Z+X","f")
-            legend.AddEntry(HData,"Data", "p")
-            legend.SetFillColor(ROOT.kWhite)
-            legend.SetLineColor(ROOT.kWhite)
-            legend.SetTextFont(43)
-            legend.SetTextSize(20)
-            legend.Draw()
-        
-            #draw CMS and lumi text
-            CMS_lumi.writeExtraText = True
-            CMS_lumi.extraText      = "Preliminary"
-            CMS_lumi.lumi_sqrtS     = lumiText + " (13.6 TeV)"
-            CMS_lumi.cmsTextSize    = 1 #0.6
-            CMS_lumi.lumiTextSize   = 0.7 #0.46
-            CMS_lumi.extraOverCmsTextSize = 0.75
-            CMS_lumi.relPosX = 0.12
-            CMS_lumi.CMS_lumi(Canvas, 0, 0)
-            
-            Canvas.Update() #very important!!!
-            #Canvas.Write()
-
-
-            ### Zoomed m4l
-            HStack_z, h_list = Stack(fMC2018, fMC_2, lumi, "_2GeV_", fs)
-            HData_z = dataGraph(fData, "_2GeV_", fs, blind=blindPlots)
-            Canvas_z = ROOT.TCanvas('M4l_z_'+p+'_'+fs,'M4l_z_'+p+'_'+fs,canvasSizeX,canvasSizeY)
-            Canvas_z.SetTicks()
-            HData_z.ComputeRange(xmin,ymin,xmax,ymax)
-            yhmax=math.ceil(max(HStack_z.GetMaximum(), ymax.value))
-            HStack_z.SetMaximum(yhmax)
-            HStack_z.Draw("histo")
-            HStack_z.GetXaxis().SetRangeUser(70., 170.)
-            if blindPlots:
-                 ROOT.gPad.GetRangeAxis(xmin,ymin,xmax,ymax)
-                 bblind_z = ROOT.TBox(blindHLow, 0, blindHHi, ymax.value-epsilon)
-                 bblind_z.SetFillColor(ROOT.kGray)
-                 bblind_z.SetFillStyle(3002)
-                 bblind_z.Draw()
-            HData_z.Draw("samePE1")
-            ROOT.gPad.RedrawAxis()
-            
-            legend_z = ROOT.TLegend(0.72,0.70,0.94,0.92)
-            legend_z.AddEntry(h_list[4],"H(125)","f")
-            legend_z.AddEntry(h_list[3],"q#bar{q}#rightarrow ZZ,Z#gamma*","f")
-            legend_z.AddEntry(h_list[2],"gg#rightarrow ZZ,Z#gamma*","f")
-            legend_z.AddEntry(h_list[1],"EW","f")
-            legend_z.AddEntry(h_list[0],"Z+X","f")
-            legend_z.AddEntry(HData,"Data", "p")
-            legend_z.SetFillColor(ROOT.kWhite)
-            legend_z.SetLineColor(ROOT.kWhite)
-            legend_z.SetTextFont(43)
-            legend_z.SetTextSize(20)
-            legend_z.Draw()
-            
-            #draw CMS and lumi text
-            CMS_lumi.writeExtraText = True
-            CMS_lumi.extraText      = "Preliminary"
-            CMS_lumi.lumi_sqrtS     = lumiText + " (13.6 TeV)"
-            CMS_lumi.cmsTextSize    = 1 #0.6
-            CMS_lumi.lumiTextSize   = 0.7 #0.46
-            CMS_lumi.extraOverCmsTextSize = 0.75
-            CMS_lumi.relPosX = 0.12
-            CMS_lumi.CMS_lumi(Canvas_z, 0, 0)
-            
-            Canvas_z.Update()
-    
-    
-            printCanvases(path=out_dir)
-    
-    
-    
-    
-    
-    
-    
+    versions = ['_4GeV_', '_2GeV_']
+
+    if args.jobs > 1:
+        H4l_render.renderParallel(openStore, plotM4l, [(p, fs, v) for p in periods for fs in finalStates for v in versions],
+                                  out_dir, args.jobs, args.formats)
+    else:
+        # each canvas is exported when drawn, then freed
+        tracker = H4l_render.RenderTracker(out_dir, args.formats)
+        for p in periods:
+            for fs in finalStates:
+                print(p, fs)
+                for version in versions:
+                    tracker.export(*plotM4l(store, p, fs, version))
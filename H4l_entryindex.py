@@ -0,0 +1,87 @@
+### Persistent index of the selected entries of H4l nanoAODs.
+# The Events entries with a best candidate that passes the trigger
+# (bestCandIdx != -1 and HLT_passZZ4l) are found once per file, reading only
+# these two branches, and stored in $H4L_CACHE_DIR/entries (see H4l_sumw),
+# keyed by file path. An index is rebuilt when the size or modification time
+# of its file change. The event loops then call GetEntry only for these
+# entries instead of every entry of the file.
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import uproot
+
+import H4l_sumw
+
+
+indexDir = os.path.join(H4l_sumw.cacheDir, "entries")
+selectionBranches = ["bestCandIdx", "HLT_passZZ4l"]
+
+
+def indexPath(filename):
+    # <indexDir>/<hash of the path>, with .npy (entries) and .json (metadata)
+    return os.path.join(indexDir, hashlib.sha1(os.path.abspath(filename).encode()).hexdigest())
+
+
+def buildIndex(filename):
+    """
+    Entries of the Events tree that pass the candidate and trigger selection,
+    and the number of entries of the tree.
+    """
+
+    with uproot.open(filename) as f:
+        arrays = f["Events"].arrays(selectionBranches, library="np")
+    passed = (arrays["bestCandIdx"] != -1) & arrays["HLT_passZZ4l"]
+    return np.flatnonzero(passed), len(passed)
+
+
+def _replace(path, write):
+    # Write through a temporary file, replaced atomically, so that
+    # concurrent jobs never read a partial index
+    fd, tmpName = tempfile.mkstemp(dir=indexDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        write(f)
+    os.replace(tmpName, path)
+
+
+def _saveIndex(filename, stamp, entries, nEntries):
+    os.makedirs(indexDir, exist_ok=True)
+    path = indexPath(filename)
+    _replace(path + ".npy", lambda f: np.save(f, entries))
+    meta = dict(filename = os.path.abspath(filename), stamp = stamp, nEntries = nEntries, nSelected = len(entries))
+    # written last: an index without up-to-date metadata is rebuilt
+    _replace(path + ".json", lambda f: f.write(json.dumps(meta, indent=1).encode()))
+
+
+def selectedEntries(filename, inputFile=None):
+    """
+    The selected entries of a file, from its index if the file did not change
+    since it was built; otherwise the index is built (from inputFile, a local
+    copy of filename, if given) and stored.
+
+    Returns
+    -------
+    np.ndarray
+        The entry numbers, in increasing order; None if the file cannot be
+        stat'ed (e.g. a root:// URL), in which case all entries should be read.
+    """
+
+    stamp = H4l_sumw.fileStamp(filename)
+    if stamp is None:
+        return None
+    path = indexPath(filename)
+    try:
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        if meta["stamp"] == stamp:
+            return np.load(path + ".npy")
+    except (OSError, ValueError, KeyError):
+        pass
+
+    entries, nEntries = buildIndex(inputFile or filename)
+    _saveIndex(filename, stamp, entries, nEntries)
+    print(filename, ": indexed {} selected entries of {}".format(len(entries), nEntries))
+    return entries
@@ -3,11 +3,29 @@
 ### Histograms are stored on a file and can then be plotted with
 
 from __future__ import print_function
+import argparse
+import concurrent.futures
 import math
+import multiprocessing
+import time
+import numpy as np
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection
-from ZZAnalysis.NanoAnalysis.tools import getLeptons, get_genEventSumw
+from ZZAnalysis.NanoAnalysis.tools import getLeptons
+import H4l_accumulator
+import H4l_columnar
+import H4l_dataset
+import H4l_entryindex
+import H4l_histocache
+import H4l_histos
+import H4l_instrument
+import H4l_prefetch
+import H4l_preview
+import H4l_rdf
+import H4l_skim
+import H4l_sumw
+import H4l_treecache
 
 
 pathMC2018 = "/eos/cms/store/group/phys_higgs/cmshzz4l/cjlst/RunIII/231209_nano/MC2018/" # FIXME: Use 2018 MC for the time being
@@ -27,368 +45,156 @@ maxEntriesPerSample = 1e12 # Use only up to this number of events in each MC sam
 ROOT.TH1.SetDefaultSumw2()
 
 ####################################
-def fillHistos(samplename, filename) :
-
-    ### ---------------------
-    ## ZZMass
-    h_ZZMass2 = ROOT.TH1F("ZZMass_2GeV_"+samplename,
-                          "ZZMass_2GeV_"+samplename,65,70.,200.)
-    h_ZZMass2.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_ZZMass2_4mu = ROOT.TH1F("ZZMass_2GeV_4mu_"+samplename,
-                              "ZZMass_2GeV_4mu_"+samplename,65,70.,200.)
-    h_ZZMass2_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_ZZMass2_4e = ROOT.TH1F("ZZMass_2GeV_4e_"+samplename,
-                             "ZZMass_2GeV_4e_"+samplename,65,70.,200.)
-    h_ZZMass2_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_ZZMass2_2e2mu = ROOT.TH1F("ZZMass_2GeV_2e2mu_"+samplename,
-                                "ZZMass_2GeV_2e2mu_"+samplename,65,70.,200.)
-    h_ZZMass2_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------    
-    h_ZZMass4 = ROOT.TH1F("ZZMass_4GeV_"+samplename,
-                          "ZZMass_4GeV_"+samplename,233,70.,1002.)
-    h_ZZMass4.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4.GetYaxis().SetTitle("Events / 4 GeV")
-    #4mu
-    h_ZZMass4_4mu = ROOT.TH1F("ZZMass_4GeV_4mu_"+samplename,
-                              "ZZMass_4GeV_4mu_"+samplename,233,70.,1002.)
-    h_ZZMass4_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_4mu.GetYaxis().SetTitle("Events / 4 GeV")
-    #4e
-    h_ZZMass4_4e = ROOT.TH1F("ZZMass_4GeV_4e_"+samplename,
-                             "ZZMass_4GeV_4e_"+samplename,233,70.,1002.)
-    h_ZZMass4_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_4e.GetYaxis().SetTitle("Events / 4 GeV")
-    #2e2mu
-    h_ZZMass4_2e2mu = ROOT.TH1F("ZZMass_4GeV_2e2mu_"+samplename,
-                                "ZZMass_4GeV_2e2mu_"+samplename,233,70.,1002.)
-    h_ZZMass4_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_2e2mu.GetYaxis().SetTitle("Events / 4 GeV")
-
-    # h_ZZMass10 = ROOT.TH1F("ZZMass_10GeV_"+samplename,
-    #                        "ZZMass_10GeV_"+samplename,93,70.,1000.)
-    # h_ZZMass10.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    # h_ZZMass10.GetYaxis().SetTitle("Events / 10 GeV")
-
-    ### ---------------------    
-    ## Z1 and Z2 masses
-    # Z1
-    h_Z1Mass = ROOT.TH1F("Z1Mass_"+samplename,
-                         "Z1Mass_"+samplename,40,40.,120.)
-    h_Z1Mass.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_Z1Mass_4mu = ROOT.TH1F("Z1Mass_4mu_"+samplename,
-                             "Z1Mass_4mu_"+samplename,40,40.,120.)
-    h_Z1Mass_4mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_Z1Mass_4e = ROOT.TH1F("Z1Mass_4e_"+samplename,
-                            "Z1Mass_4e_"+samplename,40,40.,120.)
-    h_Z1Mass_4e.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_Z1Mass_2e2mu = ROOT.TH1F("Z1Mass_2e2mu_"+samplename,
-                               "Z1Mass_2e2mu_"+samplename,40,40.,120.)
-    h_Z1Mass_2e2mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------    
-    # Z2
-    h_Z2Mass = ROOT.TH1F("Z2Mass_"+samplename,
-                         "Z2Mass_"+samplename,54,12.,120.)
-    h_Z2Mass.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_Z2Mass_4mu = ROOT.TH1F("Z2Mass_4mu_"+samplename,
-                             "Z2Mass_4mu_"+samplename,54,12.,120.)
-    h_Z2Mass_4mu.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_Z2Mass_4e = ROOT.TH1F("Z2Mass_4e_"+samplename,
-                            "Z2Mass_4e_"+samplename,54,12.,120.)
-    h_Z2Mass_4e.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_Z2Mass_2e2mu = ROOT.TH1F("Z2Mass_2e2mu_"+samplename,
-                               "Z2Mass_2e2mu_"+samplename,54,12.,120.)
-    h_Z2Mass_2e2mu.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------    
-    ## KD
-    h_KD = ROOT.TH1F("KD_"+samplename,
-                     "KD_"+samplename,10,0.,1.)
-    h_KD.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD.GetYaxis().SetTitle("Events / 0.1")
-    #4mu
-    h_KD_4mu = ROOT.TH1F("KD_4mu_"+samplename,
-                         "KD_4mu_"+samplename,10,0.,1.)
-    h_KD_4mu.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_4mu.GetYaxis().SetTitle("Events / 0.1")
-    #4e
-    h_KD_4e = ROOT.TH1F("KD_4e_"+samplename,
-                        "KD_4e_"+samplename,10,0.,1.)
-    h_KD_4e.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_4e.GetYaxis().SetTitle("Events / 0.1")
-    #2e2mu
-    h_KD_2e2mu = ROOT.TH1F("KD_2e2mu_"+samplename,
-                           "KD_2e2mu_"+samplename,10,0.,1.)
-    h_KD_2e2mu.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_2e2mu.GetYaxis().SetTitle("Events / 0.1")
-
-    ### ---------------------    
-    # 2D plots: Z1mass vs Z2mass
-    h2_Z1Mass_Z2Mass = ROOT.TH2F("Z1MassVsZ2Mass_"+samplename,
-                                 "Z1MassVsZ2Mass_"+samplename,
-                                 40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #4mu
-    h2_Z1Mass_Z2Mass_4mu = ROOT.TH2F("Z1MassVsZ2Mass_4mu_"+samplename,
-                                     "Z1MassVsZ2Mass_4mu_"+samplename,
-                                     40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_4mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_4mu.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #4e
-    h2_Z1Mass_Z2Mass_4e = ROOT.TH2F("Z1MassVsZ2Mass_4e_"+samplename,
-                                    "Z1MassVsZ2Mass_4e_"+samplename,
-                                    40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_4e.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_4e.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #2e2mu
-    h2_Z1Mass_Z2Mass_2e2mu = ROOT.TH2F("Z1MassVsZ2Mass_2e2mu_"+samplename,
-                                       "Z1MassVsZ2Mass_2e2mu_"+samplename,
-                                       40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_2e2mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_2e2mu.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-
-    ### ---------------------    
-    # 2D plots: ZZMass vs KD
-    h2_ZZMass_KD = ROOT.TH2F("ZZMassVsKD_"+samplename,
-                             "ZZMassVsKD_"+samplename,
-                             65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #4mu
-    h2_ZZMass_KD_4mu = ROOT.TH2F("ZZMassVsKD_4mu_"+samplename,
-                                 "ZZMassVsKD_4mu_"+samplename,
-                                 65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_4mu.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #4e
-    h2_ZZMass_KD_4e = ROOT.TH2F("ZZMassVsKD_4e_"+samplename,
-                                "ZZMassVsKD_4e_"+samplename,
-                                65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_4e.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #2e2mu
-    h2_ZZMass_KD_2e2mu = ROOT.TH2F("ZZMassVsKD_2e2mu_"+samplename,
-                                   "ZZMassVsKD_2e2mu_"+samplename,
-                                   65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_2e2mu.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    
-    ### ---------------------    
-    ### BLIND plots
-    ## ZZMass
-    h_ZZMass2_blind = ROOT.TH1F("ZZMass_2GeV_blind_"+samplename,
-                                "ZZMass_2GeV_blind_"+samplename,65,70.,200.)
-    h_ZZMass2_blind.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_blind.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_ZZMass2_blind_4mu = ROOT.TH1F("ZZMass_2GeV_blind_4mu_"+samplename,
-                                    "ZZMass_2GeV_blind_4mu_"+samplename,65,70.,200.)
-    h_ZZMass2_blind_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_blind_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_ZZMass2_blind_4e = ROOT.TH1F("ZZMass_2GeV_blind_4e_"+samplename,
-                                   "ZZMass_2GeV_blind_4e_"+samplename,65,70.,200.)
-    h_ZZMass2_blind_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_blind_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_ZZMass2_blind_2e2mu = ROOT.TH1F("ZZMass_2GeV_blind_2e2mu_"+samplename,
-                                      "ZZMass_2GeV_blind_2e2mu_"+samplename,65,70.,200.)
-    h_ZZMass2_blind_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass2_blind_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------   
-    h_ZZMass4_blind = ROOT.TH1F("ZZMass_4GeV_blind_"+samplename,
-                                "ZZMass_4GeV_blind_"+samplename,233,70.,1002.)
-    h_ZZMass4_blind.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_blind.GetYaxis().SetTitle("Events / 4 GeV")
-    #4mu
-    h_ZZMass4_blind_4mu = ROOT.TH1F("ZZMass_4GeV_blind_4mu_"+samplename,
-                                    "ZZMass_4GeV_blind_4mu_"+samplename,233,70.,1002.)
-    h_ZZMass4_blind_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_blind_4mu.GetYaxis().SetTitle("Events / 4 GeV")
-    #4e
-    h_ZZMass4_blind_4e = ROOT.TH1F("ZZMass_4GeV_blind_4e_"+samplename,
-                                   "ZZMass_4GeV_blind_4e_"+samplename,233,70.,1002.)
-    h_ZZMass4_blind_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_blind_4e.GetYaxis().SetTitle("Events / 4 GeV")
-    #2e2mu
-    h_ZZMass4_blind_2e2mu = ROOT.TH1F("ZZMass_4GeV_blind_2e2mu_"+samplename,
-                                      "ZZMass_4GeV_blind_2e2mu_"+samplename,233,70.,1002.)
-    h_ZZMass4_blind_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h_ZZMass4_blind_2e2mu.GetYaxis().SetTitle("Events / 4 GeV")
-
-    ### ---------------------   
-    ## Z1 and Z2 masses
-    # Z1
-    h_Z1Mass_blind = ROOT.TH1F("Z1Mass_blind_"+samplename,
-                               "Z1Mass_blind_"+samplename,40,40.,120.)
-    h_Z1Mass_blind.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_blind.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_Z1Mass_blind_4mu = ROOT.TH1F("Z1Mass_blind_4mu_"+samplename,
-                                   "Z1Mass_blind_4mu_"+samplename,40,40.,120.)
-    h_Z1Mass_blind_4mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_blind_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_Z1Mass_blind_4e = ROOT.TH1F("Z1Mass_blind_4e_"+samplename,
-                                  "Z1Mass_blind_4e_"+samplename,40,40.,120.)
-    h_Z1Mass_blind_4e.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_blind_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_Z1Mass_blind_2e2mu = ROOT.TH1F("Z1Mass_blind_2e2mu_"+samplename,
-                                     "Z1Mass_blind_2e2mu_"+samplename,40,40.,120.)
-    h_Z1Mass_blind_2e2mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h_Z1Mass_blind_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------   
-    # Z2
-    h_Z2Mass_blind = ROOT.TH1F("Z2Mass_blind_"+samplename,
-                               "Z2Mass_blind_"+samplename,54,12.,120.)
-    h_Z2Mass_blind.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_blind.GetYaxis().SetTitle("Events / 2 GeV")
-    #4mu
-    h_Z2Mass_blind_4mu = ROOT.TH1F("Z2Mass_blind_4mu_"+samplename,
-                                   "Z2Mass_blind_4mu_"+samplename,54,12.,120.)
-    h_Z2Mass_blind_4mu.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_blind_4mu.GetYaxis().SetTitle("Events / 2 GeV")
-    #4e
-    h_Z2Mass_blind_4e = ROOT.TH1F("Z2Mass_blind_4e_"+samplename,
-                                  "Z2Mass_blind_4e_"+samplename,54,12.,120.)
-    h_Z2Mass_blind_4e.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_blind_4e.GetYaxis().SetTitle("Events / 2 GeV")
-    #2e2mu
-    h_Z2Mass_blind_2e2mu = ROOT.TH1F("Z2Mass_blind_2e2mu_"+samplename,
-                                     "Z2Mass_blind_2e2mu_"+samplename,54,12.,120.)
-    h_Z2Mass_blind_2e2mu.GetXaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    h_Z2Mass_blind_2e2mu.GetYaxis().SetTitle("Events / 2 GeV")
-
-    ### ---------------------   
-    ## KD
-    h_KD_blind = ROOT.TH1F("KD_blind_"+samplename,
-                           "KD_blind_"+samplename,10,0.,1.)
-    h_KD_blind.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_blind.GetYaxis().SetTitle("Events / 0.1")
-    #4mu
-    h_KD_blind_4mu = ROOT.TH1F("KD_blind_4mu_"+samplename,
-                               "KD_blind_4mu_"+samplename,10,0.,1.)
-    h_KD_blind_4mu.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_blind_4mu.GetYaxis().SetTitle("Events / 0.1")
-    #4e
-    h_KD_blind_4e = ROOT.TH1F("KD_blind_4e_"+samplename,
-                              "KD_blind_4e_"+samplename,10,0.,1.)
-    h_KD_blind_4e.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_blind_4e.GetYaxis().SetTitle("Events / 0.1")
-    #2e2mu
-    h_KD_blind_2e2mu = ROOT.TH1F("KD_blind_2e2mu_"+samplename,
-                                 "KD_blind_2e2mu_"+samplename,10,0.,1.)
-    h_KD_blind_2e2mu.GetXaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    h_KD_blind_2e2mu.GetYaxis().SetTitle("Events / 0.1")
-
-    ### ---------------------   
-    # 2D plots: Z1mass vs Z2mass
-    h2_Z1Mass_Z2Mass_blind = ROOT.TH2F("Z1MassVsZ2Mass_blind_"+samplename,
-                                       "Z1MassVsZ2Mass_blind_"+samplename,
-                                       40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_blind.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_blind.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #4mu
-    h2_Z1Mass_Z2Mass_blind_4mu = ROOT.TH2F("Z1MassVsZ2Mass_blind_4mu_"+samplename,
-                                           "Z1MassVsZ2Mass_blind_4mu_"+samplename,
-                                           40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_blind_4mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_blind_4mu.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #4e
-    h2_Z1Mass_Z2Mass_blind_4e = ROOT.TH2F("Z1MassVsZ2Mass_blind_4e_"+samplename,
-                                          "Z1MassVsZ2Mass_blind_4e_"+samplename,
-                                          40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_blind_4e.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_blind_4e.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-    #2e2mu
-    h2_Z1Mass_Z2Mass_blind_2e2mu = ROOT.TH2F("Z1MassVsZ2Mass_blind_2e2mu_"+samplename,
-                                             "Z1MassVsZ2Mass_blind_2e2mu_"+samplename,
-                                             40,40.,120.,54,12.,120.)
-    h2_Z1Mass_Z2Mass_blind_2e2mu.GetXaxis().SetTitle("m_{#it{Z1}} (GeV)")
-    h2_Z1Mass_Z2Mass_blind_2e2mu.GetYaxis().SetTitle("m_{#it{Z2}} (GeV)")
-
-    ### ---------------------   
-    # 2D plots: ZZMass vs KD
-    h2_ZZMass_KD_blind = ROOT.TH2F("ZZMassVsKD_blind_"+samplename,
-                                   "ZZMassVsKD_blind_"+samplename,
-                                   65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_blind.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_blind.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #4mu
-    h2_ZZMass_KD_blind_4mu = ROOT.TH2F("ZZMassVsKD_blind_4mu_"+samplename,
-                                       "ZZMassVsKD_blind_4mu_"+samplename,
-                                       65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_blind_4mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_blind_4mu.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #4e
-    h2_ZZMass_KD_blind_4e = ROOT.TH2F("ZZMassVsKD_blind_4e_"+samplename,
-                                      "ZZMassVsKD_blind_4e_"+samplename,
-                                      65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_blind_4e.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_blind_4e.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-    #2e2mu
-    h2_ZZMass_KD_blind_2e2mu = ROOT.TH2F("ZZMassVsKD_blind_2e2mu_"+samplename,
-                                         "ZZMassVsKD_blind_2e2mu_"+samplename,
-                                         65,70.,200.,10,0.,1.)
-    h2_ZZMass_KD_blind_2e2mu.GetXaxis().SetTitle("m_{#it{4l}} (GeV)")
-    h2_ZZMass_KD_blind_2e2mu.GetYaxis().SetTitle("#it{D}_{bkg}^{kin}")
-
-
-
-    f = ROOT.TFile.Open(filename)
-
-    event = f.Events
-    event.SetBranchStatus("*", 0)
-    event.SetBranchStatus("run", 1)
-    event.SetBranchStatus("luminosityBlock", 1)
-    event.SetBranchStatus("*Muon*", 1)
-    event.SetBranchStatus("*Electron*", 1)
-    event.SetBranchStatus("*ZZCand*", 1)
-    event.SetBranchStatus("bestCandIdx", 1)
-    event.SetBranchStatus("HLT_passZZ4l", 1)
-    nEntries = event.GetEntries() 
-
-    isMC = False
+def fillHistos(samplename, filename, engine="loop", nChunks=1, jobs=1, histoNames=H4l_histos.defaultHistos,
+               skimDir="skims", writeSkim=False, inputFile=None, preview=None, previewSeed=0, stats=None,
+               readStrategy="default", datasetSumw=None, entryIndex=False) :
+
+    # inputFile: a local copy of filename to read events from (see H4l_prefetch);
+    # filename still identifies the sample for the skims and the sumw cache
+    inputFile = inputFile or filename
+    # stats: filled with the time spent in each phase, entries and bytes read
+    # (see H4l_instrument)
+    readStats = {} if stats is None else stats
+    # datasetSumw: when filename is a part of a dataset (see H4l_dataset), the
+    # sum of generator weights of all the parts, which MC weights are normalized to
+
+    # Accumulate only the requested histograms (see H4l_histos for the
+    # available observables and regions), in all final states
+    accumulator = H4l_accumulator.HistoAccumulator(histoNames)
+    # Only the branches needed for these histograms are read
+    candVars = H4l_columnar.candidateVariables(accumulator.variables())
+    if writeSkim:
+        candVars = H4l_columnar.candidateVariables(H4l_columnar.candBranches)
+
+    isMC = (samplename != "Data")
+    if engine in ("columnar", "rdf") and isMC:
+        # previews read clusters from the whole file, and the rdf engine reads
+        # all entries (Range does not work with implicit MT): both use the
+        # full sum of weights, not scaled to maxEntriesPerSample
+        fullSumw = preview or engine == "rdf"
+        with H4l_instrument.phase(readStats, "runs"):
+            genEventSumw = datasetSumw or H4l_sumw.getGenEventSumw(filename, None if fullSumw else maxEntriesPerSample)
+    else:
+        genEventSumw = 1.
+
+    if engine in ("columnar", "skim"):
+        # Read the best candidates of all selected events at once (from the
+        # nanoAOD or from its skim) and add them to all histograms with a
+        # single batch operation
+        if engine == "skim":
+            with H4l_instrument.phase(readStats, "read"):
+                cands = H4l_skim.readSkim(skimDir, samplename, filename)
+            H4l_instrument.add(readStats, entries = len(cands["weight"]), selected = len(cands["weight"]))
+        elif preview:
+            # a random subset of clusters, with weights scaled to the full sample
+            cands = H4l_preview.readPreview(inputFile, isMC, genEventSumw, preview, seed=previewSeed,
+                                            variables=candVars, stats=readStats)
+            H4l_preview.printPrecision(samplename, cands, readStats)
+        elif nChunks > 1:
+            cands = H4l_columnar.readBestCandidatesChunked(inputFile, isMC, genEventSumw, nChunks, jobs, eventIds=writeSkim,
+                                                           variables=candVars, stats=readStats)
+        else:
+            cands = H4l_columnar.readBestCandidates(inputFile, isMC, genEventSumw, entryStop=int(maxEntriesPerSample),
+                                                    eventIds=writeSkim, variables=candVars, stats=readStats)
+        print(samplename, ": selected=", len(cands["weight"]))
+        if engine == "columnar":
+            printBytesRead(samplename, readStats["bytesRead"], readStats.get("readCalls"))
+        if writeSkim and engine == "columnar":
+            H4l_skim.writeSkim(skimDir, samplename, filename, cands, genEventSumw)
+
+        H4l_columnar.printZflavErrors(cands)
+
+        with H4l_instrument.phase(readStats, "fill"):
+            accumulator.fill(cands, cands["weight"])
+            return accumulator.histos(samplename)
+
+    if engine == "rdf":
+        # Book all histograms on the same dataframe; they are filled together
+        # in a single (multithreaded) event loop when the first one is read,
+        # so read, selection and fill are timed together (eventLoop)
+        with H4l_instrument.phase(readStats, "open"):
+            booked = H4l_histos.bookHistos(samplename, histoNames)
+            df = H4l_rdf.selectedCandidates(inputFile, isMC, genEventSumw)
+            dfs = H4l_rdf.splitFinalStates(df)
+            nOther = dfs['other'].Count()
+            nSelected = df.Count()
+            nEntries = H4l_rdf.countEntries(inputFile)
+
+            # only the flavour final states are filled, '' is their sum
+            dfRegions = {}
+            results = {}
+            for b in booked:
+                if not b.finalState : continue
+                key = (b.finalState, b.region)
+                if key not in dfRegions:
+                    dfRegions[key] = dfs[b.finalState].Filter(H4l_histos.regionCut(b.region))
+                results[b.histo.GetName()] = H4l_rdf.bookHisto(dfRegions[key], b.histo, b.x, b.y)
+
+        bytesRead = ROOT.TFile.GetFileBytesRead()
+        readCalls = ROOT.TFile.GetFileReadCalls()
+        with H4l_instrument.phase(readStats, "eventLoop"):
+            filled = {b.histo.GetName(): H4l_rdf.getHisto(results[b.histo.GetName()], b.histo)
+                      for b in booked if b.finalState}
+        bytesRead = ROOT.TFile.GetFileBytesRead() - bytesRead
+        readCalls = ROOT.TFile.GetFileReadCalls() - readCalls
+        printBytesRead(samplename, bytesRead, readCalls)
+        H4l_instrument.add(readStats, entries = nEntries, selected = nSelected.GetValue(), bytesRead = bytesRead,
+                           readCalls = readCalls)
+
+        with H4l_instrument.phase(readStats, "fill"):
+            histos = []
+            for b in booked:
+                if b.finalState:
+                    histos.append(filled[b.histo.GetName()])
+                else:
+                    flavours = [H4l_histos.histoName(b.observable, b.region, fs, samplename) for fs in H4l_histos.flavourStates]
+                    histos.append(H4l_histos.inclusiveHisto(b.histo.GetName(), [filled[name] for name in flavours]))
+        if nOther.GetValue() > 0 : print('error in Zflav for', nOther.GetValue(), 'events')
+        return histos
+
+    with H4l_instrument.phase(readStats, "open"):
+        f = ROOT.TFile.Open(inputFile)
+
+        event = f.Events
+        event.SetBranchStatus("*", 0)
+        branches = ["nZZCand"] + H4l_columnar.eventBranches(isMC, variables=candVars)
+        for branch in branches:
+            event.SetBranchStatus(branch, 1)
+        nEntries = min(event.GetEntries(), int(maxEntriesPerSample))
+        # TTreeCache setup (see H4l_treecache)
+        cacheInfo = H4l_treecache.configure(event, branches, nEntries, readStrategy)
+
     if(samplename == "Data"):
         print("Data: sel=", nEntries)
     else:
-        isMC = True
-        event.SetBranchStatus("overallEventWeight",1)
-
         # Get sum of weights
-        genEventSumw = get_genEventSumw(f, maxEntriesPerSample)
+        with H4l_instrument.phase(readStats, "runs"):
+            genEventSumw = datasetSumw or H4l_sumw.getGenEventSumw(filename, maxEntriesPerSample)
 
         
-    # loop over events
+    # The values of the selected candidates are collected during the loop
+    # and added to all final states and regions at once at the end
+    selected = {var: [] for var in candVars}
+    weights = []
+
+    # entries read: all, or only those with a selected candidate passing the
+    # trigger, from the index of the file (see H4l_entryindex)
+    entries = None
+    if entryIndex:
+        with H4l_instrument.phase(readStats, "index"):
+            entries = H4l_entryindex.selectedEntries(filename, inputFile)
+        if entries is not None:
+            entries = entries[entries < nEntries]
+    nRead = nEntries if entries is None else len(entries)
+
+    # loop over events; the time spent in GetEntry (timed on a sample of the
+    # entries) is the read time, the rest of the loop the selection time
     iEntry=0
-    printEntries=max(5000,nEntries/10)
-    while iEntry<nEntries and event.GetEntry(iEntry):
+    printEntries=max(5000,nRead/10)
+    loopStats = {}
+    reads = H4l_instrument.SampledPhase("read")
+    loopStart = H4l_instrument.now()
+    while iEntry<nRead and reads.call(event.GetEntry, iEntry if entries is None else int(entries[iEntry])):
         iEntry+=1
         if iEntry%printEntries == 0 : print("Processing", iEntry)
 
@@ -403,117 +209,51 @@ def fillHistos(samplename, filename) :
             theZZ = ZZs[bestCandIdx]        
             if isMC : 
                 weight = (event.overallEventWeight*theZZ.dataMCWeight/genEventSumw)
-            ## ZZmass
-            m4l=theZZ.mass
-            h_ZZMass2.Fill(m4l,weight)
-            h_ZZMass4.Fill(m4l,weight)
-            # h_ZZMass10.Fill(m4l,weight)
-            # ## Z1Mass
-            # mZ1=theZZ.Z1mass
-            # h_Z1Mass.Fill(mZ1,weight)
-            # ## Z2Mass
-            # mZ2=theZZ.Z2mass
-            # h_Z2Mass.Fill(mZ2,weight)
-            # ## KD
-            # KD=theZZ.KD
-            # h_KD.Fill(KD,weight)
-
-            # # 2D histo
-            # h2_Z1Mass_Z2Mass.Fill(mZ1,mZ2,weight)
-            # h2_ZZMass_KD.Fill(m4l,KD,weight)
-
-            # plots per final state
-            Z1flav = theZZ.Z1flav
-            Z2flav = theZZ.Z2flav
-            if(Z1flav==-169 and Z2flav==-169):
-                h_ZZMass2_4mu.Fill(m4l,weight)
-                h_ZZMass4_4mu.Fill(m4l,weight)
-                # h_Z1Mass_4mu.Fill(mZ1,weight)
-                # h_Z2Mass_4mu.Fill(mZ2,weight)
-                # h_KD_4mu.Fill(KD,weight)
-                # h2_Z1Mass_Z2Mass_4mu.Fill(mZ1,mZ2,weight)
-                # h2_ZZMass_KD_4mu.Fill(m4l,KD,weight)
-            elif(Z1flav==-121 and Z2flav==-121):
-                h_ZZMass2_4e.Fill(m4l,weight)
-                h_ZZMass4_4e.Fill(m4l,weight)
-                # h_Z1Mass_4e.Fill(mZ1,weight)
-                # h_Z2Mass_4e.Fill(mZ2,weight)
-                # h_KD_4e.Fill(KD,weight)
-                # h2_Z1Mass_Z2Mass_4e.Fill(mZ1,mZ2,weight)
-                # h2_ZZMass_KD_4e.Fill(m4l,KD,weight) 
-            elif((Z1flav==-169 and Z2flav==-121) or 
-                 (Z1flav==-121 and Z2flav==-169)):
-                h_ZZMass2_2e2mu.Fill(m4l,weight)
-                h_ZZMass4_2e2mu.Fill(m4l,weight)
-                # h_Z1Mass_2e2mu.Fill(mZ1,weight)
-                # h_Z2Mass_2e2mu.Fill(mZ2,weight)
-                # h_KD_2e2mu.Fill(KD,weight)
-                # h2_Z1Mass_Z2Mass_2e2mu.Fill(mZ1,mZ2,weight)
-                # h2_ZZMass_KD_2e2mu.Fill(m4l,KD,weight) 
-            else:
-                print('error in Zflav ',Z1flav,Z2flav)
-
-
-            # ### BLIND plots
-            # if m4l < 105. or m4l > 140.:
-            #     h_Z1Mass_blind.Fill(mZ1,weight)
-            #     h_Z2Mass_blind.Fill(mZ2,weight)
-            #     h_KD_blind.Fill(KD,weight)
-            #     h2_Z1Mass_Z2Mass_blind.Fill(mZ1,mZ2,weight)
-            #     h2_ZZMass_KD_blind.Fill(m4l,KD,weight)
-
-            #     # plots per final state
-            #     if(Z1flav==-169 and Z2flav==-169):
-            #         h_Z1Mass_blind_4mu.Fill(mZ1,weight)
-            #         h_Z2Mass_blind_4mu.Fill(mZ2,weight)
-            #         h_KD_blind_4mu.Fill(KD,weight)
-            #         h2_Z1Mass_Z2Mass_blind_4mu.Fill(mZ1,mZ2,weight)
-            #         h2_ZZMass_KD_blind_4mu.Fill(m4l,KD,weight)
-            #     elif(Z1flav==-121 and Z2flav==-121):
-            #         h_Z1Mass_blind_4e.Fill(mZ1,weight)
-            #         h_Z2Mass_blind_4e.Fill(mZ2,weight)
-            #         h_KD_blind_4e.Fill(KD,weight)
-            #         h2_Z1Mass_Z2Mass_blind_4e.Fill(mZ1,mZ2,weight)
-            #         h2_ZZMass_KD_blind_4e.Fill(m4l,KD,weight) 
-            #     elif((Z1flav==-169 and Z2flav==-121) or 
-            #          (Z1flav==-121 and Z2flav==-169)):
-            #         h_Z1Mass_blind_2e2mu.Fill(mZ1,weight)
-            #         h_Z2Mass_blind_2e2mu.Fill(mZ2,weight)
-            #         h_KD_blind_2e2mu.Fill(KD,weight)
-            #         h2_Z1Mass_Z2Mass_blind_2e2mu.Fill(mZ1,mZ2,weight)
-            #         h2_ZZMass_KD_blind_2e2mu.Fill(m4l,KD,weight) 
-            #     else:
-            #         print('error in Zflav ',Z1flav,Z2flav)
+
+            for var in candVars:
+                selected[var].append(getattr(theZZ, var))
+            weights.append(weight)
 
             # Example on how to get the four leptons of the candidates, ordered as
             # [Z1l1, Z2l2, Z2l1, Z2l2]
             #leps = getLeptons(theZZ, event)
             #print(leps[3].pt)
-        
+    H4l_instrument.addSince(loopStats, "select", loopStart)
+    reads.addTo(loopStats)
+    for key in ("wall", "cpu"):
+        loopStats[key]["select"] -= loopStats[key].get("read", 0.)
+    H4l_instrument.merge(readStats, loopStats)
+
+    fileStats = H4l_treecache.readStats(f)
+    bytesDecompressed = H4l_instrument.treeUncompressedBytes(event, branches, iEntry,
+                                                             None if entries is None else entries[:iEntry])
+    H4l_instrument.add(readStats, entries = iEntry, selected = len(weights),
+                       bytesDecompressed = bytesDecompressed, **fileStats)
+    if cacheInfo:
+        print(samplename, ": TTreeCache of {:.1f} MB for {} clusters".format(cacheInfo["cacheSize"]/1e6, cacheInfo["clusters"]))
+    printBytesRead(samplename, fileStats["bytesRead"], fileStats["readCalls"])
     f.Close()
-    
-    histos = [h_ZZMass2, h_ZZMass2_4mu, h_ZZMass2_4e, h_ZZMass2_2e2mu,
-              h_ZZMass4, h_ZZMass4_4mu, h_ZZMass4_4e, h_ZZMass4_2e2mu,
-              # h_Z1Mass, h_Z1Mass_4mu, h_Z1Mass_4e, h_Z1Mass_2e2mu,
-              # h_Z2Mass, h_Z2Mass_4mu, h_Z2Mass_4e, h_Z2Mass_2e2mu,  
-              # h_KD, h_KD_4mu, h_KD_4e, h_KD_2e2mu, 
-              # h2_Z1Mass_Z2Mass, h2_Z1Mass_Z2Mass_4mu, h2_Z1Mass_Z2Mass_4e, h2_Z1Mass_Z2Mass_2e2mu,
-              # h2_ZZMass_KD, h2_ZZMass_KD_4mu, h2_ZZMass_KD_4e, h2_ZZMass_KD_2e2mu,
-              # h_Z1Mass_blind, h_Z1Mass_blind_4mu, h_Z1Mass_blind_4e, h_Z1Mass_blind_2e2mu,
-              # h_Z2Mass_blind, h_Z2Mass_blind_4mu, h_Z2Mass_blind_4e, h_Z2Mass_blind_2e2mu,
-              # h_KD_blind, h_KD_blind_4mu, h_KD_blind_4e, h_KD_blind_2e2mu,
-              # h2_Z1Mass_Z2Mass_blind, h2_Z1Mass_Z2Mass_blind_4mu, h2_Z1Mass_Z2Mass_blind_4e, h2_Z1Mass_Z2Mass_blind_2e2mu,
-              # h2_ZZMass_KD_blind, h2_ZZMass_KD_blind_4mu, h2_ZZMass_KD_blind_4e, h2_ZZMass_KD_blind_2e2mu
-              ]
-
-    return histos
-
-
-def runMC(outFile): 
-
-    if '2018' in outFile:
-        pathMC = pathMC2018
-    elif 'ggZZ_2022EE' in outfile:
+
+    cands = {var: np.array(v) for var, v in selected.items()}
+    H4l_columnar.printZflavErrors(cands)
+
+    with H4l_instrument.phase(readStats, "fill"):
+        accumulator.fill(cands, np.array(weights))
+        return accumulator.histos(samplename)
+
+
+def printBytesRead(samplename, nBytes, readCalls=None):
+    if readCalls:
+        print(samplename, ": read {:.1f} MB in {} calls ({:.1f} kB/call)".format(nBytes/1e6, readCalls, nBytes/readCalls/1e3))
+    else:
+        print(samplename, ": read {:.1f} MB".format(nBytes/1e6))
+
+
+def getMCSamples(outFile):
+
+    # filename: a file, a glob pattern or a list of files (see H4l_dataset)
+    pathMC = pathMC2018
+    if 'ggZZ_2022EE' in outFile:
         pathMC = pathggZZMC2022EE
     samples = [
         # ggZZ from 2018
@@ -525,7 +265,9 @@ def runMC(outFile):
         dict(name = "ggTo2mu2tau",filename = pathMC + "ggTo2mu2tau_Contin_MCFM701/ZZ4lAnalysis.root"),
     ]
     
-    if '2022EE' in outFile:
+    if 'ggZZ' in outFile:
+        pass # ggZZ samples defined above
+    elif '2022EE' in outFile:
         samples = [
             dict(name = "ggH125",filename = pathMC2022EE+
                         "ggH125/ZZ4lAnalysis.root"),
@@ -589,43 +331,318 @@ def runMC(outFile):
         ]
 
 
-    of = ROOT.TFile.Open(outFile,"recreate") 
-    
-    for s in samples:
-         histos = fillHistos(s["name"], s["filename"])
-         for h in histos:
-             of.WriteObject(h,h.GetName())
-
-    of.Close()
-
-def runData(outFile):
+    return samples
 
-    of = ROOT.TFile.Open(outFile,"recreate") 
+def getDataSamples(outFile):
 
     if 'CD' in outFile:
-        hs_data = fillHistos("Data", pathDATA_CD + "ZZ4lAnalysis.root")
+        return [dict(name = "Data", filename = pathDATA_CD + "ZZ4lAnalysis.root")]
     elif 'EFG' in outFile:
-        hs_data = fillHistos("Data", pathDATA_EFG + "ZZ4lAnalysis.root")
-
-    for h in hs_data:
-        h.SetBinErrorOption(ROOT.TH1.kPoisson)
-        of.WriteObject(h,h.GetName())
-
-    of.Close()
+        return [dict(name = "Data", filename = pathDATA_EFG + "ZZ4lAnalysis.root")]
+
+def sampleKey(s, engine="loop", histoNames=H4l_histos.defaultHistos, skimDir="skims", writeSkim=False, **otherOptions):
+    """
+    Key of the cached histograms of a sample (see H4l_histocache); None if
+    they cannot be cached. Chunks and jobs do not change the histograms.
+    """
+
+    if writeSkim:
+        return None
+    fingerprint = H4l_histocache.inputFingerprint(s["filename"], engine, skimDir, s["name"])
+    if fingerprint is None:
+        return None
+    definitions = H4l_histocache.definitionHash(histoNames, engine=engine, maxEntriesPerSample=maxEntriesPerSample,
+                                                preview=otherOptions.get("preview"), previewSeed=otherOptions.get("previewSeed", 0))
+    return H4l_histocache.bundleKey(s["name"], fingerprint, definitions)
+
+def cachedSample(s, histoCache, fillOptions):
+    # (key, histograms from the cache or None)
+    key = sampleKey(s, **fillOptions) if histoCache else None
+    histos = histoCache.get(key) if key else None
+    if histos is not None:
+        print(s["name"], ": histograms from cache")
+    return key, histos
+
+def datasetParts(s, engine="loop", preview=None, **otherOptions):
+    # (parts, sum of generator weights of each part, failures) of the dataset
+    # of a sample (see H4l_dataset); the sums are only needed to normalize the
+    # parts of multi-file MC datasets read from the nanoAODs
+    parts = H4l_dataset.expandFiles(s["filename"])
+    if len(parts) == 1:
+        return parts, {parts[0]: None}, []
+    isMC = (s["name"] != "Data" and engine != "skim")
+    fullSumw = preview or engine == "rdf"
+    sumw, failures = H4l_dataset.partSumw(parts, isMC, None if fullSumw else maxEntriesPerSample)
+    return parts, sumw, failures
+
+def fillPart(samplename, part, datasetSumw=None, prefetcher=None, **fillOptions):
+    # (histograms, stats) of one file of a sample
+    stats = {}
+    with H4l_instrument.phase(stats, "prefetch"):
+        inputFile = prefetcher.get(part) if prefetcher else None
+    histos = fillHistos(samplename, part, inputFile=inputFile, stats=stats, datasetSumw=datasetSumw, **fillOptions)
+    return histos, stats
+
+def instrumentedFill(s, prefetcher=None, **fillOptions):
+    # (histograms, instrumentation report) of a sample; the parts of a
+    # multi-file dataset are filled one after the other, and those that fail
+    # are skipped
+    start = H4l_instrument.now()
+    parts, sumw, failures = datasetParts(s, **fillOptions)
+    if len(parts) == 1:
+        histos, stats = fillPart(s["name"], parts[0], None, prefetcher, **fillOptions)
+    else:
+        results = {}
+        for part in sumw:
+            try:
+                results[part] = fillPart(s["name"], part, H4l_dataset.totalSumw(sumw), prefetcher, **fillOptions)
+            except Exception as e:
+                failures.append(H4l_dataset.failure(part, e))
+        stats = {}
+        histos = H4l_dataset.mergeParts(s["name"], len(parts), results, sumw, failures, stats)
+    wall, cpu = H4l_instrument.now()
+    report = H4l_instrument.sampleReport(s["name"], s["filename"], fillOptions.get("engine", "loop"), stats,
+                                         wall-start[0], cpu-start[1], failures=failures)
+    return histos, report
+
+def fillSample(s, prefetcher=None, histoCache=None, **fillOptions):
+
+    key, histos = cachedSample(s, histoCache, fillOptions)
+    if histos is not None:
+        return histos, H4l_instrument.sampleReport(s["name"], s["filename"], fillOptions.get("engine", "loop"),
+                                                   {}, 0., 0., cached=True)
+    histos, report = instrumentedFill(s, prefetcher, **fillOptions)
+    # incomplete datasets are filled again next time
+    if key and not report["failedFiles"]:
+        histoCache.put(key, s["name"], histos)
+    return histos, report
+
+def runSamples(outFile, samples, isData, prefetcher=None, histoCache=None, **fillOptions):
+
+    histos = []
+    reports = []
+    for s in samples:
+        hs, report = fillSample(s, prefetcher, histoCache, **fillOptions)
+        histos += hs
+        reports.append(report)
+    H4l_histos.writeHistos(outFile, histos, isData)
+    H4l_instrument.writeReport(outFile, reports)
+
+def runMC(outFile, prefetcher=None, histoCache=None, **fillOptions): 
+
+    runSamples(outFile, getMCSamples(outFile), False, prefetcher, histoCache, **fillOptions)
+
+def runData(outFile, prefetcher=None, histoCache=None, **fillOptions):
+
+    runSamples(outFile, getDataSamples(outFile), True, prefetcher, histoCache, **fillOptions)
+
+
+def _fillJob(s, fillOptions):
+    # Executed in a worker process: histograms are sent back pickled, with
+    # the instrumentation report (peak RSS is that of the worker so far)
+    histos, report = instrumentedFill(s, **fillOptions)
+    for h in histos:
+        h.SetDirectory(0)
+    return histos, report
+
+def _fillPartJob(samplename, part, datasetSumw, fillOptions):
+    # Executed in a worker process, for one part of a multi-file dataset:
+    # (histograms, stats, (wall, cpu) time of the job)
+    start = H4l_instrument.now()
+    histos, stats = fillPart(samplename, part, datasetSumw, **fillOptions)
+    for h in histos:
+        h.SetDirectory(0)
+    wall, cpu = H4l_instrument.now()
+    return histos, stats, (wall-start[0], cpu-start[1])
+
+def collectParts(s, nParts, sumw, failures, partJobs, fillOptions):
+    # (histograms, report) of a multi-file dataset, from the jobs of its
+    # parts; the time is the sum of the job times
+    results = {}
+    wall = cpu = 0.
+    for part, fut in partJobs.items():
+        try:
+            histos, stats, elapsed = fut.result()
+        except Exception as e:
+            failures.append(H4l_dataset.failure(part, e))
+            continue
+        results[part] = (histos, stats)
+        wall += elapsed[0]
+        cpu += elapsed[1]
+    stats = {}
+    histos = H4l_dataset.mergeParts(s["name"], nParts, results, sumw, failures, stats)
+    return histos, H4l_instrument.sampleReport(s["name"], s["filename"], fillOptions.get("engine", "loop"),
+                                               stats, wall, cpu, failures=failures)
+
+def runParallel(outFiles, jobs=1, histoCache=None, **fillOptions):
+    """
+    Fill all (output file, sample) jobs in a pool of worker processes, then
+    write the output files from this process, in the order of outFiles and of
+    the sample lists, so that outputs do not depend on job completion order.
+    Multi-file datasets are split in one job per part. Samples found in
+    histoCache are not filled again.
+    """
+
+    tasks = []
+    for outFile, isData in outFiles:
+        samples = getDataSamples(outFile) if isData else getMCSamples(outFile)
+        tasks += [(outFile, s) for s in samples]
+
+    start = time.time()
+    # spawn rather than fork, to start each worker with a clean ROOT state
+    ctx = multiprocessing.get_context("spawn")
+    cached = [cachedSample(s, histoCache, fillOptions) for outFile, s in tasks]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        futures = []
+        for (outFile, s), (key, histos) in zip(tasks, cached):
+            if histos is not None:
+                futures.append(None)
+                continue
+            parts, sumw, failures = datasetParts(s, **fillOptions)
+            if len(parts) == 1:
+                futures.append(pool.submit(_fillJob, s, fillOptions))
+            else:
+                partJobs = {part: pool.submit(_fillPartJob, s["name"], part, H4l_dataset.totalSumw(sumw), fillOptions)
+                            for part in sumw}
+                futures.append((len(parts), sumw, failures, partJobs))
+        results = []
+        for (outFile, s), (key, histos), fut in zip(tasks, cached, futures):
+            if fut is None:
+                results.append((histos, H4l_instrument.sampleReport(s["name"], s["filename"], fillOptions.get("engine", "loop"),
+                                                                    {}, 0., 0., cached=True)))
+                continue
+            if isinstance(fut, tuple):
+                results.append(collectParts(s, *fut, fillOptions))
+            else:
+                results.append(fut.result())
+            if key and not results[-1][1]["failedFiles"]:
+                histoCache.put(key, s["name"], results[-1][0])
+    wallTime = time.time()-start
+
+    for outFile, isData in outFiles:
+        histos = []
+        reports = []
+        for (taskFile, s), (hs, report) in zip(tasks, results):
+            if taskFile == outFile:
+                histos += hs
+                reports.append(report)
+        H4l_histos.writeHistos(outFile, histos, isData)
+        H4l_instrument.writeReport(outFile, reports)
+
+    print("\n{:<24} {:<12} {:>10}".format("output", "sample", "time (s)"))
+    for (outFile, s), (hs, report) in zip(tasks, results):
+        print("{:<24} {:<12} {:>10.1f}".format(outFile, s["name"], report["wall"]["total"]))
+    print("{} jobs on {} workers: total job time {:.1f} s, wall time {:.1f} s".format(
+        len(tasks), jobs, sum(r[1]["wall"]["total"] for r in results), wallTime))
 
 if __name__ == "__main__" :
 
-    print('Running 2018')
-    runMC('H4l_MC2018.root')
-    print('Running 2022')
-    runMC('H4l_MC2022.root')
-    print('Running 2022EE')
-    runMC('H4l_MC2022EE.root')
-    print('Running C-D data')
-    
-    runData('H4l_Data_CD.root')
-    print('Running E-F-G data')
-    runData('H4l_Data_EFG.root')
-
-    print('Running ggZZ 2022EE')
-    runMC('H4l_ggZZ_2022EE.root')
+    parser = argparse.ArgumentParser(description='Fill H4l histograms from nanoAODs')
+    parser.add_argument('--engine', choices=['loop', 'columnar', 'rdf', 'skim'], default='loop',
+                        help='fill engine: event loop (default), columnar NumPy batch fills, RDataFrame, '
+                             'or columnar fills from the skims written with --write-skim')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='number of threads for the rdf engine (default: all cores)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes, each filling one sample at a time (default: 1, serial)')
+    parser.add_argument('--read-strategy', choices=H4l_treecache.strategies, default='default',
+                        help='loop engine: TTreeCache setup; "tuned" sizes the cache from the active branches, adds them '
+                             'up front and aligns it to the clusters read (default: %(default)s, ROOT defaults)')
+    parser.add_argument('--entry-index', action='store_true',
+                        help='loop engine: read only the entries with a selected candidate passing the trigger, from a '
+                             'per-file index built on first use and rebuilt when the file changes')
+    parser.add_argument('--chunks', type=int, default=1,
+                        help='columnar engine: split each input file into this many cluster-aligned entry ranges, '
+                             'read by --jobs worker processes (samples are then processed one at a time)')
+    parser.add_argument('--histos', nargs='+', default=H4l_histos.defaultHistos,
+                        help='histograms to fill, as <observable> or <observable>_<region> (default: %(default)s). '
+                             'Observables: ' + ', '.join(H4l_histos.observables) + '; regions: ' + ', '.join(H4l_histos.regions))
+    parser.add_argument('--skim-dir', default='skims',
+                        help='directory of the per-sample skims (default: %(default)s)')
+    parser.add_argument('--write-skim', action='store_true',
+                        help='columnar engine: also write the best-candidate skim of each sample to --skim-dir')
+    parser.add_argument('--prefetch-dir', default=None,
+                        help='copy the next input files to this local directory while the current sample is filled '
+                             '(serial processing only)')
+    parser.add_argument('--prefetch-size', type=float, default=100.,
+                        help='size limit of the prefetch directory in GB (default: %(default)s)')
+    parser.add_argument('--prefetch-depth', type=int, default=2,
+                        help='number of input files prefetched ahead (default: %(default)s)')
+    parser.add_argument('--preview', type=float, default=None, metavar='FRACTION',
+                        help='columnar engine: quick preview from a stratified random FRACTION of the clusters of each '
+                             'sample (e.g. 0.02), with weights scaled to the full sample; prints the precision reached')
+    parser.add_argument('--preview-seed', type=int, default=0,
+                        help='random seed of the preview (default: %(default)s)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='reuse the histograms of samples whose input, histogram definitions and code did not '
+                             'change since they were last filled, from this directory')
+    parser.add_argument('--cache-size', type=float, default=10.,
+                        help='size limit of the histogram cache in GB (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.prefetch_dir and args.jobs > 1 and args.chunks == 1:
+        parser.error('--prefetch-dir cannot be used with parallel sample processing (--jobs without --chunks)')
+
+    if args.write_skim and args.engine != 'columnar':
+        parser.error('--write-skim requires --engine columnar')
+
+    for name in args.histos:
+        try:
+            H4l_histos.parseHistoName(name)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.read_strategy != 'default' and args.engine != 'loop':
+        parser.error('--read-strategy requires --engine loop')
+
+    if args.entry_index and args.engine != 'loop':
+        parser.error('--entry-index requires --engine loop')
+
+    if args.chunks > 1 and args.engine != 'columnar':
+        parser.error('--chunks requires --engine columnar')
+
+    if args.preview is not None:
+        if args.engine != 'columnar' or args.write_skim or args.chunks > 1:
+            parser.error('--preview requires --engine columnar, without --write-skim and --chunks')
+        if not 0 < args.preview <= 1:
+            parser.error('--preview must be a fraction in (0, 1]')
+
+    if args.engine == 'rdf':
+        H4l_rdf.enableMT(args.threads)
+
+    outFiles = [('H4l_MC2018.root', False),
+                ('H4l_MC2022.root', False),
+                ('H4l_MC2022EE.root', False),
+                ('H4l_Data_CD.root', True),
+                ('H4l_Data_EFG.root', True),
+                ('H4l_ggZZ_2022EE.root', False)]
+
+    fillOptions = dict(engine=args.engine, histoNames=args.histos,
+                       skimDir=args.skim_dir, writeSkim=args.write_skim,
+                       preview=args.preview, previewSeed=args.preview_seed, readStrategy=args.read_strategy,
+                       entryIndex=args.entry_index)
+
+    histoCache = None
+    if args.cache_dir:
+        histoCache = H4l_histocache.HistoCache(args.cache_dir, args.cache_size*1e9)
+
+    if args.jobs > 1 and args.chunks == 1:
+        runParallel(outFiles, args.jobs, histoCache, **fillOptions)
+    else:
+        if args.chunks > 1:
+            fillOptions.update(nChunks=args.chunks, jobs=args.jobs)
+        prefetcher = None
+        if args.prefetch_dir and args.engine != 'skim':
+            cache = H4l_prefetch.FileCache(args.prefetch_dir, args.prefetch_size*1e9)
+            inputFiles = [part for outFile, isData in outFiles
+                          for s in (getDataSamples(outFile) if isData else getMCSamples(outFile))
+                          for part in H4l_dataset.expandFiles(s["filename"])]
+            prefetcher = H4l_prefetch.Prefetcher(cache, inputFiles, args.prefetch_depth)
+        for outFile, isData in outFiles:
+            print('Running', outFile)
+            if isData:
+                runData(outFile, prefetcher, histoCache, **fillOptions)
+            else:
+                runMC(outFile, prefetcher, histoCache, **fillOptions)
+        if prefetcher:
+            prefetcher.close()
@@ -0,0 +1,205 @@
+### Cache of filled histograms, per sample.
+# The histograms filled for a sample are stored as a bundle (a small ROOT
+# file) under a key made of the sample name, the fingerprint of its input
+# (path, size and modification time), a hash of the histogram definitions
+# (H4l_histos registry entries and fill options) and a hash of the code of
+# the fillers. Reruns of H4l_fill.py then only fill the samples whose inputs,
+# definitions or code changed, and assemble the output files from the cached
+# bundles.
+#
+# The cache directory is bounded in size: least recently used bundles are
+# evicted. Inputs that cannot be fingerprinted (e.g. root:// URLs) are not
+# cached.
+#
+# The cache can be shared by concurrent runs: every index update holds an
+# exclusive lock on index.json.lock, reloads the index, and replaces it
+# atomically (as H4l_sumw does for its index). A bundle that cannot be read
+# back completely is dropped and treated as a miss.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import ROOT
+
+import H4l_dataset
+import H4l_histos
+import H4l_skim
+import H4l_sumw
+
+
+# the modules whose code determines the filled histograms
+codeFiles = ["H4l_fill.py", "H4l_accumulator.py", "H4l_columnar.py", "H4l_dataset.py", "H4l_histos.py",
+             "H4l_preview.py", "H4l_rdf.py", "H4l_skim.py", "H4l_sumw.py"]
+
+
+def _hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+_codeVersion = None
+
+def codeVersion():
+    """
+    Hash of the source of the modules in codeFiles.
+    """
+
+    global _codeVersion
+    if _codeVersion is None:
+        sha = hashlib.sha1()
+        codeDir = os.path.dirname(os.path.abspath(__file__))
+        for name in codeFiles:
+            with open(os.path.join(codeDir, name), "rb") as f:
+                sha.update(f.read())
+        _codeVersion = sha.hexdigest()
+    return _codeVersion
+
+
+def definitionHash(histoNames, **options):
+    """
+    Hash of the requested histograms (with their registry definitions) and of
+    the fill options that change their contents.
+    """
+
+    definitions = []
+    for name in histoNames:
+        observable, region = H4l_histos.parseHistoName(name)
+        definitions.append([name, H4l_histos.observables[observable], H4l_histos.regions.get(region)])
+    return _hash(dict(histos = definitions, finalStates = H4l_histos.finalStates, options = options))
+
+
+def inputFingerprint(filename, engine="loop", skimDir="skims", samplename=""):
+    """
+    Fingerprint of the input of a sample: the nanoAOD, or its skim for the
+    skim engine; for multi-file datasets, those of all the parts. None if
+    the input cannot be stat'ed.
+    """
+
+    try:
+        parts = H4l_dataset.expandFiles(filename)
+    except FileNotFoundError:
+        return None
+    if len(parts) > 1:
+        fingerprints = [inputFingerprint(part, engine, skimDir, samplename) for part in parts]
+        return None if None in fingerprints else fingerprints
+    filename = parts[0]
+    if engine == "skim":
+        filename = os.path.join(H4l_skim.skimPath(skimDir, samplename, filename), "skim.json")
+    stamp = H4l_sumw.fileStamp(filename)
+    if stamp is None:
+        return None
+    return [os.path.abspath(filename)] + stamp
+
+
+def bundleKey(samplename, fingerprint, definitions):
+    return _hash([samplename, fingerprint, definitions, codeVersion()])
+
+
+class HistoCache:
+    """
+    A size-bounded directory of histogram bundles, with LRU eviction. The
+    index (sample, histogram names, size, last use) is kept in index.json.
+    """
+
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.lock     = threading.RLock()
+        os.makedirs(cacheDir, exist_ok=True)
+        self.indexFile = os.path.join(cacheDir, "index.json")
+        self.lockFile  = self.indexFile + ".lock"
+        self.index     = self._loadIndex()
+
+    def _loadIndex(self):
+        try:
+            with open(self.indexFile) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _saveIndex(self):
+        fd, tmpName = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmpName, self.indexFile)
+
+    @contextlib.contextmanager
+    def _lockedIndex(self):
+        # The up-to-date index, locked against the other threads and
+        # processes, and saved at the end of the block
+        with self.lock, open(self.lockFile, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.index = self._loadIndex()
+            yield self.index
+            self._saveIndex()
+
+    def bundlePath(self, key):
+        return os.path.join(self.cacheDir, key + ".root")
+
+    def get(self, key):
+        """
+        The histograms of a bundle, in the order they were stored; None if the
+        bundle is not in the cache, or cannot be read completely (it is then
+        dropped).
+        """
+
+        with self._lockedIndex() as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+            f = ROOT.TFile.Open(self.bundlePath(key))
+            if not f or f.IsZombie():
+                self._remove(key)
+                return None
+            histos = []
+            for name in entry["histos"]:
+                h = f.Get(name)
+                if not h:
+                    print("HistoCache: histogram", name, "missing from", self.bundlePath(key), ", dropping the bundle")
+                    f.Close()
+                    self._remove(key)
+                    return None
+                h.SetDirectory(0)
+                histos.append(h)
+            f.Close()
+            entry["lastUsed"] = time.time()
+        return histos
+
+    def put(self, key, samplename, histos):
+        # the bundle is written under a unique name, then published with the
+        # index entry
+        path = self.bundlePath(key)
+        fd, tmpName = tempfile.mkstemp(dir=self.cacheDir, suffix=".root.part")
+        os.close(fd)
+        f = ROOT.TFile.Open(tmpName, "recreate")
+        for h in histos:
+            f.WriteObject(h, h.GetName())
+        f.Close()
+        size = os.path.getsize(tmpName)
+        with self._lockedIndex() as index:
+            if key in index:
+                self._remove(key)
+            self._evict(size)
+            os.replace(tmpName, path)
+            index[key] = dict(sample = samplename, histos = [h.GetName() for h in histos],
+                              size = size, lastUsed = time.time())
+
+    def _evict(self, neededBytes):
+        # Drop least recently used bundles until neededBytes fit
+        used = sum(e["size"] for e in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]["lastUsed"]):
+            if used + neededBytes <= self.maxBytes:
+                break
+            used -= self.index[key]["size"]
+            self._remove(key)
+
+    def _remove(self, key):
+        path = self.bundlePath(key)
+        if os.path.exists(path):
+            os.remove(path)
+        del self.index[key]
@@ -0,0 +1,231 @@
+### Registry of the histograms that can be filled by H4l_fill.py.
+# Each observable is declared once (filled variables, binning, axis titles);
+# fillers book only the histograms they are asked for, in every final state,
+# and the draw scripts read binning and titles from the same table.
+#
+# Histogram names are <observable>[_<region>][_<final state>]_<sample>,
+# e.g. ZZMass_2GeV_4mu_ggH125 or Z1Mass_blind_2e2mu_Data.
+#
+# Only the flavour final states are filled; the inclusive histogram (no final
+# state in the name) is always derived as their sum, when writing and when
+# loading a store (H4l_histostore).
+
+import numpy as np
+import ROOT
+
+
+# observable: variables filled (y only for 2D), binning, axis titles
+observables = {
+    'ZZMass_2GeV':    dict(x='mass',   bins=(65,70.,200.),   xtitle="m_{#it{4l}} (GeV)", ytitle="Events / 2 GeV"),
+    'ZZMass_4GeV':    dict(x='mass',   bins=(233,70.,1002.), xtitle="m_{#it{4l}} (GeV)", ytitle="Events / 4 GeV"),
+    'ZZMass_10GeV':   dict(x='mass',   bins=(93,70.,1000.),  xtitle="m_{#it{4l}} (GeV)", ytitle="Events / 10 GeV"),
+    'Z1Mass':         dict(x='Z1mass', bins=(40,40.,120.),   xtitle="m_{#it{Z1}} (GeV)", ytitle="Events / 2 GeV"),
+    'Z2Mass':         dict(x='Z2mass', bins=(54,12.,120.),   xtitle="m_{#it{Z2}} (GeV)", ytitle="Events / 2 GeV"),
+    'KD':             dict(x='KD',     bins=(10,0.,1.),      xtitle="#it{D}_{bkg}^{kin}", ytitle="Events / 0.1"),
+    'Z1MassVsZ2Mass': dict(x='Z1mass', y='Z2mass', bins=(40,40.,120.,54,12.,120.),
+                           xtitle="m_{#it{Z1}} (GeV)", ytitle="m_{#it{Z2}} (GeV)"),
+    'ZZMassVsKD':     dict(x='mass',   y='KD',     bins=(65,70.,200.,10,0.,1.),
+                           xtitle="m_{#it{4l}} (GeV)", ytitle="#it{D}_{bkg}^{kin}"),
+}
+
+# regions: events with `var` outside the [low, high] window
+regions = {
+    'blind': dict(var='mass', low=105., high=140.),
+}
+
+finalStates = ['', '4mu', '4e', '2e2mu']
+# the final states that are filled; '' is their sum
+flavourStates = finalStates[1:]
+
+# histograms filled by default: <observable> or <observable>_<region>
+defaultHistos = ['ZZMass_2GeV', 'ZZMass_4GeV']
+
+
+def parseHistoName(histoName):
+    """
+    Split a requested histogram name into (observable, region); region is ''
+    for histograms filled with all selected events.
+    """
+
+    if histoName in observables:
+        return histoName, ''
+    observable, _, region = histoName.rpartition('_')
+    if observable not in observables or region not in regions:
+        raise ValueError('Unknown histogram ' + histoName + '; available observables: '
+                         + ', '.join(observables) + '; regions: ' + ', '.join(regions))
+    return observable, region
+
+
+def histoName(observable, region='', finalState='', samplename=''):
+    return "_".join(p for p in [observable, region, finalState, samplename] if p)
+
+
+def splitHistoName(name):
+    """
+    Split the name of a filled histogram (see histoName) into (observable,
+    region, final state, sample); None if it is not a registry histogram.
+    """
+
+    for observable in sorted(observables, key=len, reverse=True):
+        if not name.startswith(observable + '_'): continue
+        rest = name[len(observable)+1:]
+        region = ''
+        for r in regions:
+            if rest.startswith(r + '_'):
+                region, rest = r, rest[len(r)+1:]
+                break
+        finalState = ''
+        for fs in flavourStates:
+            if rest.startswith(fs + '_'):
+                finalState, rest = fs, rest[len(fs)+1:]
+                break
+        return (observable, region, finalState, rest) if rest else None
+    return None
+
+
+def axisTitles(observable):
+    """
+    Titles in THStack/TH1 format: "; xtitle ; ytitle".
+    """
+
+    obs = observables[observable]
+    return "; " + obs['xtitle'] + " ; " + obs['ytitle']
+
+
+def inRegion(region, values):
+    """
+    Region selection for a candidate (scalars) or an array of candidates
+    (NumPy arrays), given a mapping from variable names to values.
+    """
+
+    if not region:
+        return True
+    r = regions[region]
+    v = values[r['var']]
+    return (v < r['low']) | (v > r['high'])
+
+
+def regionCut(region):
+    """
+    Region selection as an RDataFrame/TTree cut expression.
+    """
+
+    if not region:
+        return "true"
+    r = regions[region]
+    return "%s < %r || %s > %r" % (r['var'], r['low'], r['var'], r['high'])
+
+
+def inclusiveHisto(name, histos):
+    """
+    The inclusive histogram, as the sum of the histograms of the flavour final
+    states.
+    """
+
+    h = histos[0].Clone(name)
+    h.SetTitle(name)
+    h.SetDirectory(0)
+    for other in histos[1:]:
+        h.Add(other)
+    return h
+
+
+def writeHistos(outFile, histos, isData=False):
+    """
+    Write histograms to a new file; data histograms get Poisson errors.
+    """
+
+    of = ROOT.TFile.Open(outFile,"recreate")
+    for h in histos:
+        if isData:
+            h.SetBinErrorOption(ROOT.TH1.kPoisson)
+        of.WriteObject(h,h.GetName())
+    of.Close()
+
+
+def binEdges(axis):
+    n = axis.GetNbins()
+    if axis.GetXbins().GetSize():
+        return np.array([axis.GetXbins()[i] for i in range(n+1)])
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), n+1)
+
+
+def binContents(h):
+    """
+    Bin centers and contents of a TH1F or TH1D, as arrays over bins 1 to N.
+    """
+
+    n = h.GetNbinsX()
+    edges = binEdges(h.GetXaxis())
+    dtype = np.float32 if isinstance(h, ROOT.TArrayF) else np.float64
+    contents = np.frombuffer(h.GetArray(), dtype=dtype, count=n+2)[1:-1].astype(np.float64)
+    return (edges[:-1]+edges[1:])/2, contents
+
+
+def binErrors(h, bins):
+    """
+    Lower and upper errors of some bins (an array of bin numbers), as given
+    by GetBinErrorLow/Up. With the default error option they are the square
+    root of the sum of squared weights (of the contents if it is not stored);
+    Poisson intervals (TH1::kPoisson) are computed bin by bin by ROOT.
+    """
+
+    bins = np.asarray(bins, dtype=int)
+    if h.GetBinErrorOption() != ROOT.TH1.kNormal:
+        return (np.array([h.GetBinErrorLow(int(i)) for i in bins], dtype=np.float64),
+                np.array([h.GetBinErrorUp(int(i)) for i in bins], dtype=np.float64))
+    n = h.GetNbinsX()
+    if h.GetSumw2N():
+        sumw2 = np.frombuffer(h.GetSumw2().GetArray(), dtype=np.float64, count=n+2)
+    else:
+        sumw2 = np.abs(binContents(h)[1])
+        sumw2 = np.concatenate([[0.], sumw2, [0.]])
+    errors = np.sqrt(sumw2[bins])
+    return errors, errors.copy()
+
+
+class BookedHisto:
+    """
+    A histogram booked for a sample, with what is needed to fill it.
+    """
+
+    def __init__(self, observable, region, finalState, samplename):
+        obs = observables[observable]
+        self.observable = observable
+        self.region     = region
+        self.finalState = finalState
+        self.x          = obs['x']
+        self.y          = obs.get('y')
+
+        name = histoName(observable, region, finalState, samplename)
+        if self.y is None:
+            self.histo = ROOT.TH1F(name, name, *obs['bins'])
+        else:
+            self.histo = ROOT.TH2F(name, name, *obs['bins'])
+        self.histo.GetXaxis().SetTitle(obs['xtitle'])
+        self.histo.GetYaxis().SetTitle(obs['ytitle'])
+
+
+def bookHistos(samplename, histoNames=defaultHistos):
+    """
+    Book the requested histograms for all final states.
+
+    Parameters
+    ----------
+    samplename : str
+        The sample name, appended to the histogram names.
+    histoNames : List[str]
+        Histograms to book, as <observable> or <observable>_<region>.
+
+    Returns
+    -------
+    List[BookedHisto]
+        The booked histograms, ordered as the requested names and, for each
+        of them, as finalStates.
+    """
+
+    booked = []
+    for name in histoNames:
+        observable, region = parseHistoName(name)
+        booked += [BookedHisto(observable, region, fs, samplename) for fs in finalStates]
+    return booked
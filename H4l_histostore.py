@@ -0,0 +1,165 @@
+### In-memory store of the histograms read by the draw scripts.
+# The registry histograms (see H4l_histos) of all the input files of a plot
+# set are read once, keyed by era (a label for each input file) and name,
+# and the inclusive final state is derived from the flavours at load time.
+# The stacking code gets detached copies, which it can scale and add to
+# without changing the store, so no histogram is read twice whatever the
+# number of plots made from it.
+#
+# The store is also saved to a single file in $H4L_CACHE_DIR/histostore
+# with an index of its inputs (path, size and modification time); as long as
+# the inputs do not change, later runs load it from there, without opening
+# the input files or summing final states again.
+
+import hashlib
+import json
+import os
+
+import ROOT
+
+import H4l_histos
+import H4l_sumw
+
+
+storeDir = os.path.join(H4l_sumw.cacheDir, "histostore")
+
+
+class EraView:
+    """
+    The histograms of one era of a store, read by observable, final state
+    ('' for the inclusive one) and sample.
+    """
+
+    def __init__(self, store, era):
+        self.store = store
+        self.era   = era
+
+    def readHisto(self, observable, finalState, samplename, region=''):
+        return self.store.get(self.era, observable, finalState, samplename, region)
+
+
+class HistoStore:
+    """
+    The histograms of a set of input files.
+
+    Parameters
+    ----------
+    files : Dict[str, str]
+        Input file of each era, e.g. dict(MC2022 = 'H4l_MC2022.root', ...).
+    observables : List[str]
+        Observables loaded (default: all).
+    cacheDir : str
+        Directory of the saved stores; None to always read the input files.
+    """
+
+    def __init__(self, files, observables=None, cacheDir=storeDir):
+        self.files       = dict(files)
+        self.observables = observables
+        self.cacheDir    = cacheDir
+        self.histos      = {}
+        self.load()
+
+    def _inputs(self):
+        # [path, size, mtime] of each input, None if one cannot be stat'ed
+        inputs = {}
+        for era, filename in self.files.items():
+            stamp = H4l_sumw.fileStamp(filename)
+            if stamp is None:
+                return None
+            inputs[era] = [os.path.abspath(filename)] + stamp
+        return inputs
+
+    def _storePath(self):
+        key = json.dumps([sorted((era, os.path.abspath(f)) for era, f in self.files.items()),
+                          sorted(self.observables or [])])
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode()).hexdigest())
+
+    def load(self):
+        inputs = self._inputs() if self.cacheDir else None
+        if inputs is not None:
+            path = self._storePath()
+            try:
+                with open(path + ".json") as f:
+                    index = json.load(f)
+                if index["inputs"] == inputs:
+                    self._readStore(path + ".root")
+                    return
+            except (OSError, ValueError, KeyError):
+                pass
+
+        for era, filename in self.files.items():
+            self._readInput(era, filename)
+        if inputs is not None:
+            self._writeStore(path, inputs)
+
+    def _add(self, era, name, h):
+        h.SetDirectory(0)
+        self.histos[(era, name)] = h
+
+    def _readInput(self, era, filename):
+        f = ROOT.TFile.Open(filename)
+        if not f or f.IsZombie():
+            raise OSError(f'Cannot open {filename}')
+        inclusive = set()
+        for key in f.GetListOfKeys():
+            name = key.GetName()
+            parsed = H4l_histos.splitHistoName(name)
+            # the highest cycle comes first; inclusive histograms are derived
+            if parsed is None or (era, name) in self.histos: continue
+            observable, region, finalState, samplename = parsed
+            if self.observables is not None and observable not in self.observables: continue
+            if not finalState: continue
+            self._add(era, name, key.ReadObj())
+            inclusive.add((observable, region, samplename))
+        f.Close()
+
+        for observable, region, samplename in inclusive:
+            flavours = [self.histos.get((era, H4l_histos.histoName(observable, region, fs, samplename)))
+                        for fs in H4l_histos.flavourStates]
+            if None in flavours: continue
+            name = H4l_histos.histoName(observable, region, '', samplename)
+            self._add(era, name, H4l_histos.inclusiveHisto(name, flavours))
+
+    def _writeStore(self, path, inputs):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmpName = path + ".part.root"
+        f = ROOT.TFile.Open(tmpName, "recreate")
+        for era in self.files:
+            d = f.mkdir(era)
+            for (e, name), h in self.histos.items():
+                if e == era:
+                    d.WriteObject(h, name)
+        f.Close()
+        os.replace(tmpName, path + ".root")
+        # written last: a store without an up-to-date index is rebuilt
+        with open(path + ".json.tmp", "w") as f:
+            json.dump(dict(inputs = inputs, observables = self.observables, nHistos = len(self.histos)), f, indent=1)
+        os.replace(path + ".json.tmp", path + ".json")
+
+    def _readStore(self, filename):
+        f = ROOT.TFile.Open(filename)
+        for era in self.files:
+            for key in f.Get(era).GetListOfKeys():
+                self._add(era, key.GetName(), key.ReadObj())
+        f.Close()
+
+    def get(self, era, observable, finalState, samplename, region=''):
+        """
+        A detached copy of a histogram.
+
+        Raises
+        ------
+        KeyError
+            If the histogram is not in the input file of the era.
+        """
+
+        name = H4l_histos.histoName(observable, region, finalState, samplename)
+        h = self.histos.get((era, name))
+        if h is None:
+            raise KeyError(f'{name} not found in {self.files[era]} ({era})')
+        h = h.Clone()
+        h.SetDirectory(0)
+        return h
+
+    def era(self, era):
+        return EraView(self, era)
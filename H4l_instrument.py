@@ -0,0 +1,219 @@
+### Instrumentation of the fill jobs.
+# The fillers record in a stats dict, per sample, the wall and CPU time of
+# each phase (prefetch: waiting for the local copy, open, runs: sum of
+# weights, index: selected entries, read, select, fill, plus eventLoop for
+# engines where read, selection and fill cannot be separated), the entries
+# read and selected, the bytes read and decompressed, the read calls, and the
+# peak RSS. The read time of the event loop is estimated from a random
+# sample of its GetEntry calls (SampledPhase). The reports of all samples of
+# an output file are written as JSON next to it (H4l_MC2022.root ->
+# H4l_MC2022.perf.json), to be compared across productions.
+
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import time
+
+import numpy as np
+
+
+phases = ["prefetch", "open", "runs", "index", "read", "select", "fill", "eventLoop"]
+
+
+def addTime(stats, name, wall, cpu):
+    for key, t in (("wall", wall), ("cpu", cpu)):
+        times = stats.setdefault(key, {})
+        times[name] = times.get(name, 0.) + t
+
+
+def now():
+    return time.perf_counter(), time.process_time()
+
+
+def addSince(stats, name, start):
+    """
+    Add the wall and CPU time elapsed since start (from now()) to a phase.
+    """
+
+    wall, cpu = now()
+    addTime(stats, name, wall-start[0], cpu-start[1])
+
+
+@contextlib.contextmanager
+def phase(stats, name):
+    """
+    Add the wall and CPU time spent in the block to stats["wall"][name] and
+    stats["cpu"][name]; does nothing if stats is None.
+    """
+
+    if stats is None:
+        yield
+        return
+    start = now()
+    try:
+        yield
+    finally:
+        addSince(stats, name, start)
+
+
+def add(stats, **counters):
+    if stats is None: return
+    for key, value in counters.items():
+        stats[key] = stats.get(key, 0) + value
+
+
+class SampledPhase:
+    """
+    Time a phase made of many short calls (e.g. TTree::GetEntry in an event
+    loop) on a random sample of about one call in `every`, with random gaps
+    so that the sample does not follow the basket boundaries, instead of
+    reading the clocks around each call.
+
+    Parameters
+    ----------
+    name : str
+        The phase.
+    every : int
+        Mean gap between timed calls.
+    seed : int
+        Seed of the gaps.
+    """
+
+    def __init__(self, name, every=64, seed=0):
+        self.name  = name
+        self.every = every
+        self.rng   = random.Random(seed)
+        self.stats = {}
+        self.calls = 0
+        self.timed = 0
+        self.countdown = self.rng.randint(1, every)
+
+    def call(self, func, *args):
+        self.calls += 1
+        self.countdown -= 1
+        if self.countdown:
+            return func(*args)
+        self.countdown = self.rng.randint(1, 2*self.every-1)
+        self.timed += 1
+        with phase(self.stats, self.name):
+            return func(*args)
+
+    def addTo(self, stats):
+        """
+        Add the time of the timed calls, scaled to all the calls, to stats
+        (nothing if no call was timed).
+        """
+
+        if not self.timed: return
+        scale = self.calls/self.timed
+        addTime(stats, self.name, self.stats["wall"][self.name]*scale, self.stats["cpu"][self.name]*scale)
+
+
+def merge(stats, other):
+    """
+    Add the counters and phase times of a sub-job (e.g. a chunk) to stats.
+    """
+
+    for key, value in other.items():
+        if isinstance(value, dict):
+            for name, t in value.items():
+                stats.setdefault(key, {})
+                stats[key][name] = stats[key].get(name, 0.) + t
+        else:
+            stats[key] = stats.get(key, 0) + value
+
+
+def peakRSS():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+def uncompressedBytes(tree, branches, entryStart=0, entryStop=None):
+    """
+    Uncompressed size of the baskets of an uproot TTree's branches that
+    overlap a range of entries, i.e. the bytes decompressed to read them.
+    """
+
+    if entryStop is None:
+        entryStop = tree.num_entries
+    total = 0
+    for name in branches:
+        branch = tree[name]
+        for i in range(branch.num_baskets):
+            start, stop = branch.basket_entry_start_stop(i)
+            if start < entryStop and stop > entryStart:
+                total += branch.basket_uncompressed_bytes(i)
+    return total
+
+
+def treeUncompressedBytes(tree, branches, entryStop, entries=None):
+    """
+    Uncompressed size of the baskets of a ROOT TTree's branches that contain
+    the entries read (the entries below entryStop, or the entry numbers in
+    entries), i.e. the bytes decompressed to read them. The uncompressed size
+    of a basket is not known without reading it, so that of each branch
+    (TBranch::GetTotBytes) is split between its baskets by number of entries.
+    """
+
+    total = 0.
+    for name in branches:
+        branch = tree.GetBranch(name)
+        nEntries = branch.GetEntries()
+        nBaskets = branch.GetWriteBasket()
+        if not nEntries:
+            continue
+        basketEntry = branch.GetBasketEntry()
+        starts = np.array([basketEntry[i] for i in range(nBaskets)] or [0], dtype=np.int64)
+        ends = np.append(starts[1:], nEntries)
+        if entries is None:
+            touched = starts < entryStop
+        else:
+            touched = np.zeros(len(starts), dtype=bool)
+            touched[np.searchsorted(starts, entries, side="right")-1] = True
+        total += branch.GetTotBytes()*(ends-starts)[touched].sum()/nEntries
+    return int(total)
+
+
+def sampleReport(samplename, filename, engine, stats, wall, cpu, cached=False, failures=()):
+    """
+    The report of one sample, from the stats filled by the fillers and the
+    total wall and CPU time of the job; failures are the files of a
+    multi-file dataset that were skipped (see H4l_dataset).
+    """
+
+    entries = stats.get("entries", 0)
+    return dict(sample = samplename,
+                filename = filename,
+                engine = engine,
+                cached = cached,
+                wall = dict(stats.get("wall", {}), total = wall),
+                cpu = dict(stats.get("cpu", {}), total = cpu),
+                entries = entries,
+                selected = stats.get("selected", 0),
+                eventsPerSecond = entries/wall if wall > 0 else None,
+                bytesRead = stats.get("bytesRead"),
+                readCalls = stats.get("readCalls"),
+                bytesPerCall = stats["bytesRead"]/stats["readCalls"] if stats.get("readCalls") else None,
+                bytesDecompressed = stats.get("bytesDecompressed"),
+                peakRSS = peakRSS(),
+                failedFiles = list(failures))
+
+
+def reportPath(outFile):
+    return os.path.splitext(outFile)[0] + ".perf.json"
+
+
+def writeReport(outFile, reports):
+    """
+    Write the reports of the samples of an output file next to it.
+    """
+
+    report = dict(output = outFile,
+                  created = time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  host = platform.node(),
+                  samples = reports)
+    with open(reportPath(outFile), "w") as f:
+        json.dump(report, f, indent=1)
@@ -0,0 +1,308 @@
+#!/bin/env python3
+### Shared pass over the events of H4l nanoAODs.
+# H4l_fill.py (ZZ histograms), ggZZ_yields.py (yields) and yellowPlots.py
+# (Z peak) read the same Events trees. Here they are consumers registered
+# with a single SharedPass: the union of the branches they need is read and
+# decompressed once, in steps of entries, the best ZZ candidate is gathered
+# once per step, and every consumer is fed from the same arrays.
+#
+# A consumer provides:
+#   variables          candidate (ZZCand) variables it needs
+#   eventIds           True if it needs run/luminosityBlock/event
+#   branches(isMC)     any other Events branches it needs
+#   process(cands, arrays, genEventSumw)
+#                      fill from one step: cands are the best candidates
+#                      (see H4l_columnar.bestCandidates), arrays all branches
+#   results()          the filled histograms
+#
+# The consumers are also the columnar engines of ggZZ_yields.py and
+# yellowPlots.py. The main fills the outputs of the three scripts, with their own sample
+# lists, in one pass over each distinct input file. Samples can be multi-file
+# datasets (see H4l_dataset): a consumer is then fed by the passes over all
+# the parts, with MC weights normalized to the sum of generator weights of
+# the dataset; parts whose sum of weights cannot be read are skipped.
+#
+# run with e.g.:
+#   python3 H4l_pass.py H4l_ggZZ_2022EE.root --yields ggZZ_2022EE.root --zhistos hist_MC.root
+
+import argparse
+
+import awkward as ak
+import numpy as np
+import uproot
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+import H4l_accumulator
+import H4l_columnar
+import H4l_dataset
+import H4l_histos
+import H4l_sumw
+
+
+ROOT.TH1.SetDefaultSumw2()
+
+
+class ZZHistos:
+    """
+    The registry histograms of H4l_fill.py (see H4l_histos).
+    """
+
+    eventIds = False
+
+    def __init__(self, samplename, histoNames=H4l_histos.defaultHistos):
+        self.samplename = samplename
+        self.accumulator = H4l_accumulator.HistoAccumulator(histoNames)
+        self.variables = self.accumulator.variables()
+
+    def branches(self, isMC):
+        return []
+
+    def process(self, cands, arrays, genEventSumw):
+        H4l_columnar.printZflavErrors(cands)
+        self.accumulator.fill(cands, cands["weight"])
+
+    def results(self):
+        return self.accumulator.histos(self.samplename)
+
+
+def fillYields(h_yield, cands, weight):
+    """
+    Fill the yield histograms of the final states (see Yields) with the best
+    candidates, read with their event ids.
+
+    Raises
+    ------
+    ValueError
+        If the flavour of the Z bosons is not correct.
+    """
+
+    fsMask = H4l_columnar.finalStateMasks(cands['Z1flav'], cands['Z2flav'])
+    H4l_columnar.checkZflav(cands, fsMask)
+    for fs, h in h_yield.items():
+        w = weight[fsMask[fs]]
+        H4l_columnar.fillH1(h, np.full(len(w), 0.5), w)
+
+
+class Yields:
+    """
+    The yield histograms of ggZZ_yields.py: h_yield_<fs>_<sample>, with MC
+    weights scaled to the luminosity (in fb-1).
+
+    Raises
+    ------
+    ValueError
+        From process(), if the flavour of the Z bosons is not correct.
+    """
+
+    variables = []
+    eventIds = True
+    finalStates = ['4mu', '4e', '2e2mu']
+
+    def __init__(self, samplename, lumi):
+        self.samplename = samplename
+        self.lumiScale = 1. if samplename == "Data" else lumi*1000.
+        self.h_yield = {fs: ROOT.TH1F(f'h_yield_{fs}_{samplename}', f'h_yield_{fs}_{samplename}', 1, 0.0, 1.0)
+                        for fs in self.finalStates}
+
+    def branches(self, isMC):
+        return []
+
+    def process(self, cands, arrays, genEventSumw):
+        fillYields(self.h_yield, cands, cands["weight"]*self.lumiScale)
+
+    def results(self):
+        # the 4l yield is the sum of the final states
+        h_4l = H4l_histos.inclusiveHisto(f'h_yield_4l_{self.samplename}', list(self.h_yield.values()))
+        return list(self.h_yield.values()) + [h_4l]
+
+
+class ZHistos:
+    """
+    The Z peak histogram of yellowPlots.py, ZMass_<sample>, filled with the
+    best Z candidate (bestZIdx) of events passing the trigger.
+    """
+
+    variables = []
+    eventIds = False
+
+    def __init__(self, samplename):
+        self.h_ZMass = ROOT.TH1F("ZMass_"+samplename,"ZMass_"+samplename,60,60.,120.)
+
+    def branches(self, isMC):
+        return ["bestZIdx", "ZCand_mass"] + (["overallEventWeight"] if isMC else [])
+
+    def process(self, cands, arrays, genEventSumw):
+        # for now, ZCand has the same selection as ZZCand (fullsel)
+        sel = (ak.to_numpy(arrays["bestZIdx"]) != -1) & ak.to_numpy(arrays["HLT_passZZ4l"]).astype(bool)
+        mZ = H4l_columnar.gatherBest(arrays, "bestZIdx", "ZCand", ["mass"], sel)["mass"]
+        if "overallEventWeight" in arrays.fields:
+            # ideally we need also dataMCWeight, but it is not defined for ZCand
+            weight = ak.to_numpy(arrays["overallEventWeight"])[sel].astype(np.float64)/genEventSumw
+        else:
+            weight = np.ones(len(mZ))
+        H4l_columnar.fillH1(self.h_ZMass, mZ, weight)
+
+    def results(self):
+        return [self.h_ZMass]
+
+
+class SharedPass:
+    """
+    Read the Events of one file once and feed all registered consumers.
+
+    Parameters
+    ----------
+    samplename : str
+        The sample name ("Data" for data).
+    filename : str
+        The nanoAOD file of the sample.
+    inputFile : str
+        A local copy of filename to read instead (see H4l_prefetch).
+    stepSize : int or str
+        Entries (or memory size, e.g. "100 MB") decoded at a time.
+    datasetSumw : float
+        When filename is a part of a dataset, the sum of generator weights of
+        all the parts, which MC weights are normalized to.
+    """
+
+    def __init__(self, samplename, filename, inputFile=None, stepSize="100 MB", datasetSumw=None):
+        self.samplename  = samplename
+        self.filename    = filename
+        self.inputFile   = inputFile or filename
+        self.stepSize    = stepSize
+        self.datasetSumw = datasetSumw
+        self.isMC       = (samplename != "Data")
+        self.consumers  = []
+
+    def add(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def variables(self):
+        # the flavours are always read, for the final states
+        return H4l_columnar.candidateVariables([v for c in self.consumers for v in c.variables])
+
+    def eventIds(self):
+        return any(c.eventIds for c in self.consumers)
+
+    def branches(self):
+        branches = H4l_columnar.eventBranches(self.isMC, self.eventIds(), self.variables())
+        for c in self.consumers:
+            branches += c.branches(self.isMC)
+        return list(dict.fromkeys(branches))
+
+    def run(self, maxEntries=None):
+        """
+        Read the file and fill all consumers.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of entries, selected candidates and bytes read.
+        """
+
+        genEventSumw = 1.
+        if self.isMC:
+            genEventSumw = self.datasetSumw or H4l_sumw.getGenEventSumw(self.filename, maxEntries)
+        variables = self.variables()
+        eventIds = self.eventIds()
+        if maxEntries is not None:
+            maxEntries = int(maxEntries)
+
+        stats = dict(entries = 0, selected = 0)
+        with uproot.open(self.inputFile) as f:
+            for arrays in f["Events"].iterate(self.branches(), step_size=self.stepSize,
+                                              entry_stop=maxEntries, library="ak"):
+                cands = H4l_columnar.bestCandidates(arrays, self.isMC, genEventSumw, eventIds, variables)
+                for c in self.consumers:
+                    c.process(cands, arrays, genEventSumw)
+                stats["entries"] += len(arrays)
+                stats["selected"] += len(cands["weight"])
+            stats["bytesRead"] = f.file.source.num_requested_bytes
+
+        print(self.samplename, ": entries=", stats["entries"], "selected=", stats["selected"],
+              "read {:.1f} MB".format(stats["bytesRead"]/1e6))
+        return stats
+
+
+def datasetParts(samplename, filename, maxEntries=None):
+    """
+    The part files of a sample (see H4l_dataset) and the sum of generator
+    weights of the dataset (None for data and single files); the parts whose
+    sum of weights cannot be read are reported and skipped.
+
+    Raises
+    ------
+    FileNotFoundError
+        If no file matches the pattern of the sample.
+    IOError
+        If the sum of weights of no part can be read.
+    """
+
+    parts = H4l_dataset.expandFiles(filename)
+    if len(parts) == 1 or samplename == "Data":
+        return parts, None
+    sumw, failures = H4l_dataset.partSumw(parts, True, maxEntries)
+    H4l_dataset.printFailures(samplename, len(parts), failures)
+    if not sumw:
+        raise IOError(f'{samplename}: none of the {len(parts)} parts could be read')
+    return list(sumw), H4l_dataset.totalSumw(sumw)
+
+
+if __name__ == "__main__" :
+
+    import H4l_fill
+    import ggZZ_yields
+    import yellowPlots
+
+    parser = argparse.ArgumentParser(description='Fill the outputs of H4l_fill.py, ggZZ_yields.py and yellowPlots.py '
+                                                 'in a single pass over each input file')
+    parser.add_argument('histoFiles', nargs='*',
+                        help='H4l_fill.py output files (e.g. H4l_MC2022EE.root, H4l_Data_CD.root); select the samples')
+    parser.add_argument('--histos', nargs='+', default=H4l_histos.defaultHistos,
+                        help='ZZ histograms to fill, as in H4l_fill.py (default: %(default)s)')
+    parser.add_argument('--yields', nargs='+', default=[],
+                        help='ggZZ_yields.py output files (e.g. ggZZ_2022EE.root), with its samples and luminosity')
+    parser.add_argument('--zhistos', nargs='+', default=[],
+                        help='yellowPlots.py output files (hist_MC.root, hist_Data.root), with its samples')
+    args = parser.parse_args()
+
+    if not (args.histoFiles or args.yields or args.zhistos):
+        parser.error('no output requested')
+
+    for name in args.histos:
+        try:
+            H4l_histos.parseHistoName(name)
+        except ValueError as e:
+            parser.error(str(e))
+
+    # one pass per input file (each part of a dataset), feeding the consumers
+    # of all the outputs that read it
+    passes = {}
+    outputs = {}
+    def consume(outFile, s, consumer):
+        parts, datasetSumw = datasetParts(s["name"], s["filename"], H4l_fill.maxEntriesPerSample)
+        for part in parts:
+            key = (part, s["name"] == "Data", datasetSumw)
+            if key not in passes:
+                passes[key] = SharedPass(s["name"], part, datasetSumw=datasetSumw)
+            passes[key].add(consumer)
+        outputs.setdefault(outFile, []).append(consumer)
+
+    for outFile in args.histoFiles:
+        isData = 'Data' in outFile
+        for s in (H4l_fill.getDataSamples(outFile) if isData else H4l_fill.getMCSamples(outFile)):
+            consume(outFile, s, ZZHistos(s["name"], args.histos))
+    for outFile in args.yields:
+        samples, lumi = ggZZ_yields.getSamples(outFile)
+        for s in samples:
+            consume(outFile, s, Yields(s["name"], lumi))
+    for outFile in args.zhistos:
+        for s in yellowPlots.getSamples(outFile):
+            consume(outFile, s, ZHistos(s["name"]))
+
+    for shared in passes.values():
+        shared.run(H4l_fill.maxEntriesPerSample)
+    for outFile, consumers in outputs.items():
+        H4l_histos.writeHistos(outFile, [h for c in consumers for h in c.results()], 'Data' in outFile)
@@ -0,0 +1,249 @@
+### Prefetching of input files to a local scratch cache.
+# While a sample is being filled, the next input files are copied in
+# background threads to a local directory, so that the event loop of the
+# next sample does not wait for its baskets to arrive from EOS.
+#
+# The cache is bounded in size: least recently used files are evicted to
+# make room for new ones. Copies are checked against the source size and
+# their adler32 checksum is recorded. A copy is reused while the (size,
+# mtime) stamp of its source is unchanged, and its checksum is verified on
+# its first reuse by a process (outside the lock, so that other fetches do
+# not wait for it). Sources that cannot be stat'ed are copied at each use.
+#
+# The bytes of the copies in flight are reserved, so that concurrent
+# prefetches do not overfill the cache. The cache directory can be shared by
+# concurrent runs: index updates hold an exclusive lock on index.json.lock,
+# reload the index and replace it atomically (as H4l_histocache does).
+#
+# Sources can be local/FUSE paths (e.g. /eos/...) or root:// URLs; a local
+# directory can stand in for the remote store for tests.
+
+import concurrent.futures
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import ROOT
+
+
+def adler32(filename, blockSize=1<<24):
+    checksum = 1
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(blockSize), b""):
+            checksum = zlib.adler32(block, checksum)
+    return "%08x" % checksum
+
+
+def sourceStamp(filename):
+    """
+    (size, mtime) of a source file, local or remote (stat'ed through the
+    ROOT plugin of the protocol); None if it cannot be stat'ed.
+    """
+
+    if "://" in filename:
+        st = ROOT.FileStat_t()
+        if ROOT.gSystem.GetPathInfo(filename, st) != 0:
+            return None
+        return [st.fSize, st.fMtime]
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+class FileCache:
+    """
+    A size-bounded directory of local copies of input files, with LRU
+    eviction. The index (source, size, checksum, last use) is kept in
+    index.json inside the cache directory.
+    """
+
+    def __init__(self, cacheDir, maxBytes, verify=True):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.verify   = verify
+        self.pinned   = set()
+        # sources whose copy was written or verified by this process
+        self.verified = set()
+        # bytes reserved for the copies in flight, by source
+        self.pending  = {}
+        self.lock     = threading.RLock()
+        os.makedirs(cacheDir, exist_ok=True)
+        self.indexFile = os.path.join(cacheDir, "index.json")
+        self.lockFile  = self.indexFile + ".lock"
+        self.index     = self._loadIndex()
+
+    def _loadIndex(self):
+        try:
+            with open(self.indexFile) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _saveIndex(self):
+        fd, tmpName = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmpName, self.indexFile)
+
+    @contextlib.contextmanager
+    def _lockedIndex(self):
+        # The up-to-date index, locked against the other threads and
+        # processes, and saved at the end of the block
+        with self.lock, open(self.lockFile, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.index = self._loadIndex()
+            yield self.index
+            self._saveIndex()
+
+    def localPath(self, source):
+        key = hashlib.sha1(source.encode()).hexdigest()[:16]
+        return os.path.join(self.cacheDir, key + "_" + os.path.basename(source))
+
+    def _isValid(self, source, entry, stamp):
+        local = self.localPath(source)
+        if entry is None or not os.path.isfile(local):
+            return False
+        if os.path.getsize(local) != entry["size"]:
+            return False
+        if stamp is None or stamp != entry["stamp"]:
+            return False
+        if self.verify and source not in self.verified and adler32(local) != entry["adler32"]:
+            print("Prefetch: checksum mismatch for", local, ", fetching again")
+            return False
+        return True
+
+    def _evict(self, neededBytes):
+        # Drop least recently used, unpinned files until neededBytes fit, next
+        # to the copies in flight
+        used = sum(e["size"] for e in self.index.values()) + sum(self.pending.values())
+        for source in sorted(self.index, key=lambda s: self.index[s]["lastUsed"]):
+            if used + neededBytes <= self.maxBytes:
+                break
+            if source in self.pinned:
+                continue
+            used -= self.index[source]["size"]
+            self._remove(source)
+        if used + neededBytes > self.maxBytes:
+            print("Prefetch: cache over its size limit ({:.1f} GB)".format((used+neededBytes)/1e9))
+
+    def _remove(self, source):
+        local = self.localPath(source)
+        if os.path.exists(local):
+            os.remove(local)
+        del self.index[source]
+
+    def _copy(self, source, local):
+        # unique to the process and thread, as other runs can fetch the same source
+        tmpName = "{}.{}.{}.part".format(local, os.getpid(), threading.get_ident())
+        if "://" in source:
+            if not ROOT.TFile.Cp(source, tmpName, False):
+                raise IOError("Could not copy " + source)
+        else:
+            shutil.copyfile(source, tmpName)
+        os.replace(tmpName, local)
+
+    def fetch(self, source):
+        """
+        Return the path of a valid local copy of source, copying it first if
+        needed. The file is pinned (never evicted) until release() is called.
+        """
+
+        with self.lock:
+            self.pinned.add(source)
+        entry = self._loadIndex().get(source)
+        # stat and checksum outside the lock: the pinned copy is not evicted
+        stamp = sourceStamp(source)
+        local = self.localPath(source)
+        if self._isValid(source, entry, stamp):
+            with self._lockedIndex() as index:
+                current = index.get(source)
+                if current is not None and current["stamp"] == entry["stamp"] and current["adler32"] == entry["adler32"]:
+                    self.verified.add(source)
+                    current["lastUsed"] = time.time()
+                    return local
+
+        with self._lockedIndex() as index:
+            if source in index:
+                self._remove(source)
+            self.verified.discard(source)
+            if stamp is not None:
+                self._evict(stamp[0])
+                self.pending[source] = stamp[0]
+
+        try:
+            start = time.time()
+            self._copy(source, local)
+            size = os.path.getsize(local)
+            if stamp is not None and size != stamp[0]:
+                os.remove(local)
+                raise IOError("Incomplete copy of {}: {} bytes instead of {}".format(source, size, stamp[0]))
+            print("Prefetch: copied {} ({:.1f} MB) in {:.1f} s".format(source, size/1e6, time.time()-start))
+            checksum = adler32(local)
+        except BaseException:
+            with self.lock:
+                self.pending.pop(source, None)
+            raise
+
+        with self._lockedIndex() as index:
+            self.pending.pop(source, None)
+            if stamp is None:
+                self._evict(size)
+            index[source] = dict(size = size, stamp = stamp, adler32 = checksum, lastUsed = time.time())
+            self.verified.add(source)
+        return local
+
+    def release(self, source):
+        with self.lock:
+            self.pinned.discard(source)
+
+
+class Prefetcher:
+    """
+    Serve local copies of a known sequence of input files, prefetching the
+    next `depth` files in background threads while the current one is used.
+    """
+
+    def __init__(self, cache, filenames, depth=2):
+        self.cache     = cache
+        self.filenames = list(dict.fromkeys(filenames))
+        self.depth     = depth
+        self.pool      = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, depth))
+        self.futures   = {}
+        self.current   = None
+
+    def _schedule(self, filename):
+        if filename not in self.futures:
+            self.futures[filename] = self.pool.submit(self.cache.fetch, filename)
+
+    def get(self, filename):
+        """
+        Return a local copy of filename (waiting for it if still in flight)
+        and start prefetching the following files.
+        """
+
+        if self.current is not None:
+            self.cache.release(self.current)
+        self._schedule(filename)
+        if filename in self.filenames:
+            i = self.filenames.index(filename)
+            for nextFile in self.filenames[i+1:i+1+self.depth]:
+                self._schedule(nextFile)
+        self.current = filename
+        return self.futures.pop(filename).result()
+
+    def close(self):
+        for filename, future in self.futures.items():
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        for filename in list(self.futures) + [self.current]:
+            if filename is not None:
+                self.cache.release(filename)
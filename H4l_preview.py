@@ -0,0 +1,171 @@
+### Fast preview of H4l samples from a random subset of clusters.
+# The clusters of the Events tree (entry ranges where the baskets of all the
+# read branches start) are split into contiguous strata, and the requested
+# fraction of the clusters is read, chosen at random evenly across strata. Weights are scaled by
+# the ratio of the entries of each stratum to those read from it, so that
+# yields and histogram normalizations are unbiased estimates of the full
+# sample; stratification keeps periods with different conditions (e.g. runs
+# in data) represented in proportion.
+#
+# The precision printed includes the sampling variance of reading whole
+# clusters, estimated from the spread of the per-cluster yields within each
+# stratum.
+
+import numpy as np
+import uproot
+
+import H4l_columnar
+import H4l_instrument
+
+
+finalStates = ['4mu', '4e', '2e2mu']
+
+
+def sampleClusters(filename, fraction, nStrata=20, seed=0, isMC=True, variables=H4l_columnar.candBranches):
+    """
+    Choose a stratified random subset of the clusters of a file.
+
+    Parameters
+    ----------
+    filename : str
+        The nanoAOD file.
+    fraction : float
+        Fraction of the clusters read (at least one).
+    nStrata : int
+        Maximum number of strata of consecutive clusters; there are at most
+        half as many strata as clusters read, so that at least two clusters
+        are read from each stratum (see samplingVariance).
+    seed : int
+        Seed of the random choice, for reproducible previews.
+
+    Returns
+    -------
+    List[Tuple[int, int, float, int]]
+        (entryStart, entryStop, weight scale, stratum) of the chosen
+        clusters, in entry order; empty if the tree has no entries.
+    """
+
+    with uproot.open(filename) as f:
+        boundaries = f["Events"].common_entry_offsets(filter_name=H4l_columnar.eventBranches(isMC, variables=variables))
+
+    clusters = np.array(list(zip(boundaries[:-1], boundaries[1:])), dtype=np.int64).reshape(-1, 2)
+    clusters = clusters[clusters[:, 1] > clusters[:, 0]]
+    if len(clusters) == 0:
+        return []
+    nChosen = max(1, int(round(fraction*len(clusters))))
+    nStrata = max(1, min(nStrata, nChosen//2))
+    rng = np.random.default_rng(seed)
+    chosen = []
+    # as many clusters from each stratum as its share of the clusters read
+    # (both are split as evenly as possible, the larger ones first)
+    counts = [len(c) for c in np.array_split(np.arange(nChosen), nStrata)]
+    for iStratum, (stratum, n) in enumerate(zip(np.array_split(clusters, nStrata), counts)):
+        sample = stratum[np.sort(rng.choice(len(stratum), min(n, len(stratum)), replace=False))]
+        scale = (stratum[:, 1]-stratum[:, 0]).sum()/(sample[:, 1]-sample[:, 0]).sum()
+        chosen += [(int(start), int(stop), scale, iStratum) for start, stop in sample]
+    return chosen
+
+
+def samplingVariance(chosen, clusterYields):
+    """
+    Variance of the estimated yield due to reading a sample of the clusters,
+    from the spread of the per-cluster yields (unscaled weights) within each
+    stratum (ratio estimator to the entries, with finite population
+    correction).
+
+    Returns
+    -------
+    Tuple[float, int]
+        The variance, and the number of strata with a single cluster read,
+        whose contribution cannot be estimated (the variance is then a lower
+        bound).
+    """
+
+    variance = 0.
+    unestimated = 0
+    strata = np.array([c[3] for c in chosen])
+    entries = np.array([c[1]-c[0] for c in chosen], dtype=np.float64)
+    scales = np.array([c[2] for c in chosen])
+    for h in np.unique(strata):
+        inStratum = strata == h
+        n = inStratum.sum()
+        if n < 2:
+            unestimated += 1
+            continue
+        t = clusterYields[inStratum]
+        e = entries[inStratum]
+        scale = scales[inStratum][0]
+        d = t - t.sum()/e.sum()*e
+        variance += scale*scale*n*(1-1/scale)*(d*d).sum()/(n-1)
+    return variance, unestimated
+
+
+def readPreview(filename, isMC, genEventSumw=1., fraction=0.02, nStrata=20, seed=0, eventIds=False,
+                variables=H4l_columnar.candBranches, stats=None):
+    """
+    Same as H4l_columnar.readBestCandidates, for the clusters chosen with
+    sampleClusters; the weights include the scale of their stratum.
+    stats also receives the number of entries of the file (fileEntries).
+    """
+
+    with H4l_instrument.phase(stats, "open"):
+        chosen = sampleClusters(filename, fraction, nStrata, seed, isMC, variables)
+    branches = H4l_columnar.eventBranches(isMC, eventIds, variables)
+    parts = []
+    # per final state, the yield of each cluster read (unscaled weights)
+    clusterYields = {fs: np.zeros(len(chosen)) for fs in finalStates}
+    with uproot.open(filename) as f:
+        tree = f["Events"]
+        if not chosen:
+            # no entries: empty arrays
+            parts.append(H4l_columnar.bestCandidates(tree.arrays(branches, entry_stop=0, library="ak"),
+                                                     isMC, genEventSumw, eventIds, variables))
+        for i, (start, stop, scale, stratum) in enumerate(chosen):
+            with H4l_instrument.phase(stats, "read"):
+                arrays = tree.arrays(branches, entry_start=start, entry_stop=stop, library="ak")
+            with H4l_instrument.phase(stats, "select"):
+                cands = H4l_columnar.bestCandidates(arrays, isMC, genEventSumw, eventIds, variables)
+                fsMask = H4l_columnar.finalStateMasks(cands["Z1flav"], cands["Z2flav"])
+                for fs in finalStates:
+                    clusterYields[fs][i] = cands["weight"][fsMask[fs]].sum()
+                cands["weight"] = cands["weight"]*scale
+            parts.append(cands)
+            if stats is not None:
+                H4l_instrument.add(stats, entries = stop-start, selected = len(cands["weight"]),
+                                   bytesDecompressed = H4l_instrument.uncompressedBytes(tree, branches, start, stop))
+        if stats is not None:
+            H4l_instrument.add(stats, bytesRead = f.file.source.num_requested_bytes, readCalls = f.file.source.num_requests)
+            stats["fileEntries"] = tree.num_entries
+            # added over the parts of a dataset, as the counters
+            for fs in finalStates:
+                variance, unestimated = samplingVariance(chosen, clusterYields[fs])
+                H4l_instrument.add(stats.setdefault("samplingVariance", {}), **{fs: variance})
+            H4l_instrument.add(stats, unestimatedStrata = unestimated)
+
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def printPrecision(samplename, cands, stats):
+    """
+    Print the fraction of the sample read and, per final state, the estimated
+    yield with its statistical uncertainty (from the sum of squared scaled
+    weights) and its sampling uncertainty (from the spread of the per-cluster
+    yields, see samplingVariance), i.e. the precision reached by the preview.
+    """
+
+    entries = stats.get("entries", 0)
+    print(samplename, ": preview of {} / {} entries ({:.1%})".format(
+        entries, stats["fileEntries"], entries/max(1, stats["fileEntries"])))
+    weight = cands["weight"]
+    fsMask = H4l_columnar.finalStateMasks(cands["Z1flav"], cands["Z2flav"])
+    for fs in finalStates:
+        w = weight[fsMask[fs]]
+        total = w.sum()
+        stat = np.sqrt((w*w).sum())
+        sampling = np.sqrt(stats["samplingVariance"][fs])
+        error = np.hypot(stat, sampling)
+        print("    {:<6} yield {:.4g} +/- {:.2g} (stat) +/- {:.2g} (sampling) ({:.1%})".format(
+            fs, total, stat, sampling, error/total if total else 0.))
+    if stats["unestimatedStrata"]:
+        print("    sampling uncertainty is a lower bound: {} strata with a single cluster read".format(
+            stats["unestimatedStrata"]))
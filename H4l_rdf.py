@@ -0,0 +1,119 @@
+### RDataFrame fill engine for H4l nanoAODs.
+# The candidate selection, the event weight and the final-state categories
+# are declared once on an RDataFrame; all histograms are booked lazily on it
+# and filled in a single event loop, which runs on all cores once implicit
+# multithreading is enabled with enableMT().
+
+import ROOT
+
+
+finalStates = ['4mu', '4e', '2e2mu']
+
+# Z flavour codes (product of the pdgIds of the two leptons)
+fsCuts = {'4mu':   "Z1flav==-169 && Z2flav==-169",
+          '4e':    "Z1flav==-121 && Z2flav==-121",
+          '2e2mu': "(Z1flav==-169 && Z2flav==-121) || (Z1flav==-121 && Z2flav==-169)"}
+
+
+def enableMT(nThreads=0):
+    """
+    Enable ROOT implicit multithreading; nThreads=0 uses all available cores.
+    """
+
+    ROOT.EnableImplicitMT(nThreads)
+    print("RDataFrame: using", ROOT.GetThreadPoolSize(), "threads")
+
+
+def countEntries(filename):
+    """
+    Number of entries of the Events tree, from the file metadata.
+    """
+
+    f = ROOT.TFile.Open(filename)
+    nEntries = f.Events.GetEntries()
+    f.Close()
+    return nEntries
+
+
+def selectedCandidates(filename, isMC, genEventSumw=1., weightScale=1.):
+    """
+    Build the RDataFrame of events with a best candidate passing the trigger.
+
+    Parameters
+    ----------
+    filename : str
+        The nanoAOD file to read.
+    isMC : bool
+        If True, define the MC event weight, otherwise use unit weights.
+    genEventSumw : float
+        The sum of generator weights used to normalize MC weights.
+    weightScale : float
+        Extra factor applied to MC weights (e.g. the luminosity).
+
+    Returns
+    -------
+    ROOT.RDF.RNode
+        The filtered dataframe with the best candidate's mass, Z1mass, Z2mass,
+        KD, Z1flav, Z2flav and the event weight defined as columns.
+    """
+
+    df = ROOT.RDataFrame("Events", filename)
+    df = df.Filter("bestCandIdx != -1 && HLT_passZZ4l", "bestCand")
+    for var in ["mass", "Z1mass", "Z2mass", "KD", "Z1flav", "Z2flav"]:
+        df = df.Define(var, "ZZCand_"+var+"[bestCandIdx]")
+
+    if isMC:
+        # repr of a float is a double literal (e.g. 1.0, not 1), so that the
+        # weight is computed in double precision, as in the event loop
+        df = df.Define("weight", "%r*overallEventWeight*ZZCand_dataMCWeight[bestCandIdx]/%r"
+                       % (float(weightScale), float(genEventSumw)))
+    else:
+        df = df.Define("weight", "1.")
+    return ROOT.RDF.AsRNode(df)
+
+
+def splitFinalStates(df):
+    """
+    Return the dataframes for each final state, plus '' for the inclusive one
+    and 'other' for candidates with unexpected Z flavours.
+    """
+
+    dfs = {'': df}
+    for fs in finalStates:
+        dfs[fs] = df.Filter(fsCuts[fs], fs)
+    anyFs = " || ".join("(" + fsCuts[fs] + ")" for fs in finalStates)
+    dfs['other'] = df.Filter("!(" + anyFs + ")", "other")
+    return dfs
+
+
+def bookHisto(df, h, x, y=None):
+    """
+    Lazily book on df a histogram with the same name, title and binning as
+    the template h, filled with column x (and y for 2D) and the event weight.
+    """
+
+    xaxis = h.GetXaxis()
+    if y is None:
+        model = ROOT.RDF.TH1DModel(h.GetName(), h.GetTitle(),
+                                   xaxis.GetNbins(), xaxis.GetXmin(), xaxis.GetXmax())
+        result = df.Histo1D(model, x, "weight")
+    else:
+        yaxis = h.GetYaxis()
+        model = ROOT.RDF.TH2DModel(h.GetName(), h.GetTitle(),
+                                   xaxis.GetNbins(), xaxis.GetXmin(), xaxis.GetXmax(),
+                                   yaxis.GetNbins(), yaxis.GetXmin(), yaxis.GetXmax())
+        result = df.Histo2D(model, x, y, "weight")
+    return result
+
+
+def getHisto(result, h):
+    """
+    Trigger the event loop if needed and return the filled histogram of a
+    booked result, with the axis titles of the template h.
+    """
+
+    hout = result.GetValue().Clone(h.GetName())
+    hout.SetDirectory(0)
+    hout.GetXaxis().SetTitle(h.GetXaxis().GetTitle())
+    hout.GetYaxis().SetTitle(h.GetYaxis().GetTitle())
+    return hout
@@ -0,0 +1,116 @@
+### Batch rendering of the plots of the draw scripts.
+# A plot job is a call of a plot function of a draw script, which draws one
+# canvas from the histograms of a store (see H4l_histostore) and returns it
+# with the objects drawn on it. The jobs are independent: they are run in a
+# pool of worker processes in ROOT batch mode, each worker importing the draw
+# script (and so setting its style), opening the store once (from the copy
+# saved by the main process) and printing its canvases to the output
+# directory.
+#
+# Each canvas is exported once, as soon as it is drawn, in all the requested
+# formats (RenderTracker), and then freed, so that the number of canvases in
+# memory and the number of prints do not grow with the number of plots.
+
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import ROOT
+
+
+fileTypes = ["png", "pdf", "root", "svg"]
+
+
+class RenderTracker:
+    """
+    Export complete canvases to an output directory, each once, named after
+    its title.
+
+    Parameters
+    ----------
+    outDir : str
+        The output directory.
+    types : List[str]
+        The formats exported, among fileTypes.
+    """
+
+    def __init__(self, outDir, types=("png",)):
+        for t in types:
+            if t not in fileTypes:
+                raise ValueError(f'Unknown format {t}; available formats: ' + ', '.join(fileTypes))
+        self.outDir   = outDir
+        self.types    = list(types)
+        self.exported = set()
+        self.files    = []
+
+    def export(self, canvas, drawn=()):
+        """
+        Print a canvas in all formats, from the same drawing, and free it
+        with the objects drawn on it.
+
+        Raises
+        ------
+        ValueError
+            If a canvas with the same title was already exported.
+        """
+
+        name = canvas.GetTitle()
+        if name in self.exported:
+            raise ValueError(f'Canvas {name} already exported')
+        files = [os.path.join(self.outDir, name + "." + t) for t in self.types]
+        for filename in files:
+            canvas.Print(filename)
+        canvas.Close()
+        self.exported.add(name)
+        self.files += files
+        return files
+
+
+# the store of each worker process, by store function
+_stores = {}
+
+
+def _renderJob(openStore, plot, args, outDir, types):
+    ROOT.gROOT.SetBatch(True)
+    if openStore not in _stores:
+        _stores[openStore] = openStore()
+    return RenderTracker(outDir, types).export(*plot(_stores[openStore], *args))
+
+
+def renderParallel(openStore, plot, jobs, outDir, workers, types=("png",)):
+    """
+    Render plots in a pool of worker processes.
+
+    Parameters
+    ----------
+    openStore : Callable[[], H4l_histostore.HistoStore]
+        Module-level function of the draw script that opens its store; it
+        should be called once in the main process before, so that the workers
+        load the saved store instead of reading the input files.
+    plot : Callable
+        Module-level plot function of the draw script, called as
+        plot(store, *args) and returning (canvas, drawn objects).
+    jobs : List[tuple]
+        The arguments of each plot.
+    outDir : str
+        Directory of the output images, named after the canvas titles.
+    workers : int
+        Number of worker processes.
+    types : List[str]
+        The formats exported (see RenderTracker).
+
+    Returns
+    -------
+    List[str]
+        The output files, in the order of the jobs.
+    """
+
+    start = time.time()
+    # spawn rather than fork, to start each worker with a clean ROOT state
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(_renderJob, openStore, plot, args, outDir, list(types)) for args in jobs]
+        files = [filename for f in futures for filename in f.result()]
+    print("{} plots on {} workers: wall time {:.1f} s".format(len(jobs), workers, time.time()-start))
+    return files
@@ -0,0 +1,100 @@
+### Compact skims of the best ZZ candidate of each selected event.
+# A skim holds, for one sample, the best candidate's mass, Z1mass, Z2mass,
+# KD, Z1flav, Z2flav, the final event weight (normalized to genEventSumw, as
+# in H4l_fill.py) and run/luminosityBlock/event, with one .npy file per
+# column so that it can be memory-mapped. Refilling with new binnings or
+# categories from a skim does not need the original nanoAODs.
+#
+# Layout: <skimDir>/<samplename>_<hash of the input path>/{<column>.npy, skim.json}
+#
+# skim.json records the (size, mtime) stamp of the input file: a skim whose
+# input was changed since (rewritten at the same path) is treated as missing.
+# If the input cannot be stat'ed any more (removed, or a root:// URL), the
+# skim is used as is.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import H4l_sumw
+
+
+columns = ["mass", "Z1mass", "Z2mass", "KD", "Z1flav", "Z2flav", "weight",
+           "run", "luminosityBlock", "event"]
+
+
+def skimPath(skimDir, samplename, filename):
+    """
+    Directory of the skim of a sample; the same sample name is used in
+    several eras, so the input path is part of the key.
+    """
+
+    key = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:10]
+    return os.path.join(skimDir, samplename + "_" + key)
+
+
+def writeSkim(skimDir, samplename, filename, cands, genEventSumw=1.):
+    """
+    Write a skim from the arrays returned by
+    H4l_columnar.readBestCandidates(..., eventIds=True).
+    """
+
+    path = skimPath(skimDir, samplename, filename)
+    os.makedirs(path, exist_ok=True)
+    # an overwritten skim is incomplete until its new metadata is written
+    try:
+        os.remove(os.path.join(path, "skim.json"))
+    except FileNotFoundError:
+        pass
+    for c in columns:
+        np.save(os.path.join(path, c + ".npy"), np.ascontiguousarray(cands[c]))
+
+    meta = dict(samplename = samplename,
+                filename = filename,
+                stamp = H4l_sumw.fileStamp(filename),
+                genEventSumw = genEventSumw,
+                nSelected = len(cands["weight"]),
+                columns = {c: str(cands[c].dtype) for c in columns})
+    # written last: a skim without its metadata is incomplete
+    with open(os.path.join(path, "skim.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    print(samplename, ": skim written to", path)
+
+
+def hasSkim(skimDir, samplename, filename):
+    """
+    Whether a complete skim of the current input file exists.
+    """
+
+    try:
+        with open(os.path.join(skimPath(skimDir, samplename, filename), "skim.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    stamp = H4l_sumw.fileStamp(filename)
+    return stamp is None or meta.get("stamp") == stamp
+
+
+def readSkim(skimDir, samplename, filename):
+    """
+    Open the skim of a sample, with memory-mapped columns.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        The same keys as H4l_columnar.readBestCandidates(..., eventIds=True).
+
+    Raises
+    ------
+    FileNotFoundError
+        If no complete skim exists for this sample and input file, or if
+        the input file changed since the skim was written.
+    """
+
+    path = skimPath(skimDir, samplename, filename)
+    if not hasSkim(skimDir, samplename, filename):
+        raise FileNotFoundError(f'No up-to-date skim for {samplename} ({filename}) in {skimDir}; '
+                                'create it with --write-skim')
+    return {c: np.load(os.path.join(path, c + ".npy"), mmap_mode="r") for c in columns}
@@ -0,0 +1,120 @@
+### Cached sum of generator weights of H4l nanoAOD files.
+# The sums over the Runs tree (genEventSumw, genEventCount) and the number
+# of Events entries are stored in a small JSON index keyed by file path and
+# invalidated when the file size or modification time change, so that
+# reruns of the fillers do not rescan the Runs tree of every input.
+#
+# The index lives in $H4L_CACHE_DIR (default: ~/.cache/H4l). Updates hold an
+# exclusive lock on genEventSumw.json.lock while they re-read, modify and
+# replace the index, so that concurrent jobs do not lose each other's
+# entries; reads need no lock, since the index is replaced atomically.
+
+import fcntl
+import json
+import os
+import tempfile
+
+import ROOT
+
+
+cacheDir = os.environ.get("H4L_CACHE_DIR", os.path.expanduser("~/.cache/H4l"))
+cacheFile = os.path.join(cacheDir, "genEventSumw.json")
+lockFile = cacheFile + ".lock"
+
+
+def fileStamp(filename):
+    """
+    (size, mtime) of a local (or FUSE-mounted) file, None if it cannot be
+    stat'ed (e.g. a root:// URL), in which case nothing is cached.
+    """
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def _loadCache():
+    try:
+        with open(cacheFile) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _saveEntry(key, entry):
+    os.makedirs(cacheDir, exist_ok=True)
+    with open(lockFile, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = _loadCache()
+        cache[key] = entry
+        fd, tmpName = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmpName, cacheFile)
+
+
+def scanRuns(filename):
+    """
+    Sum genEventSumw and genEventCount over the Runs tree, and count the
+    entries of the Events tree.
+    """
+
+    f = ROOT.TFile.Open(filename)
+    runs = f.Runs
+    runs.SetBranchStatus("*", 0)
+    runs.SetBranchStatus("genEventCount", 1)
+    runs.SetBranchStatus("genEventSumw", 1)
+    nRuns = runs.GetEntries()
+    iRun = 0
+    genEventCount = 0
+    genEventSumw = 0.
+    while iRun < nRuns and runs.GetEntry(iRun) :
+        genEventCount += runs.genEventCount
+        genEventSumw += runs.genEventSumw
+        iRun +=1
+    nEntries = f.Events.GetEntries()
+    f.Close()
+
+    return dict(genEventSumw = genEventSumw, genEventCount = genEventCount, nEntries = nEntries)
+
+
+def getRunsInfo(filename):
+    """
+    genEventSumw, genEventCount and the number of Events entries of a file,
+    from the cache if the file did not change since it was last scanned.
+
+    Returns
+    -------
+    Dict[str, float]
+        With keys genEventSumw, genEventCount, nEntries.
+    """
+
+    key = os.path.abspath(filename)
+    stamp = fileStamp(filename)
+    if stamp is not None:
+        entry = _loadCache().get(key)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["info"]
+
+    info = scanRuns(filename)
+    if stamp is not None:
+        _saveEntry(key, dict(stamp = stamp, info = info))
+    return info
+
+
+def getGenEventSumw(filename, maxEntriesPerSample=None):
+    """
+    Sum of generator weights of a file; if only maxEntriesPerSample events
+    are used, it is scaled by the fraction of Events entries used.
+    """
+
+    info = getRunsInfo(filename)
+    genEventSumw = info["genEventSumw"]
+    nEntries = info["nEntries"]
+    print("gen=", info["genEventCount"], "sel=", nEntries, "sumw=", genEventSumw)
+    if maxEntriesPerSample is not None and nEntries > maxEntriesPerSample:
+        genEventSumw = genEventSumw*maxEntriesPerSample/nEntries
+        print("    scaled to:", maxEntriesPerSample, "sumw=", genEventSumw)
+    return genEventSumw
@@ -0,0 +1,258 @@
+#!/bin/env python3
+### Synthetic H4l nanoAODs, for benchmarking and testing the fillers offline.
+# Writes stand-in ZZ4lAnalysis.root files with the Events branches read by
+# the fillers (bestCandIdx, HLT_passZZ4l, overallEventWeight, ZZCand_*,
+# bestZIdx/ZCand_mass, run/luminosityBlock/event and Muon_*/Electron_*
+# kinematics) and a Runs tree (genEventCount, genEventSumw), with realistic
+# shapes: a Higgs peak for signal samples, the Z->4l peak and the ZZ
+# continuum for background samples, a mixture of both for data.
+#
+# Events are written in steps of `clusterSize` entries, one basket per branch
+# and step, so that files have many clusters like real productions. Sizes,
+# candidate multiplicities and compression are configurable.
+#
+# run with e.g.:
+#   python3 H4l_synth.py synth/MC2022EE --samples ggH125 ZZTo4l ggTo4mu --events 200000
+#   python3 H4l_synth.py synth/Data_EFG --samples Data --events 1000000
+
+import argparse
+import os
+
+import awkward as ak
+import numpy as np
+import uproot
+
+
+ZmassValue = 91.1876
+ZwidthValue = 2.4952
+
+Zflav_mumu = -169
+Zflav_ee = -121
+
+# fraction of 4mu, 4e, 2e2mu candidates
+fsFractions = {'default': (0.3, 0.2, 0.5),
+               'ggTo4mu': (1., 0., 0.), 'ggTo4e': (0., 1., 0.), 'ggTo2e2mu': (0., 0., 1.)}
+
+
+def sampleProcess(samplename):
+    """
+    Shape of the mZZ distribution of a sample: 'signal', 'ZZ' or 'data'.
+    """
+
+    if samplename == "Data":
+        return "data"
+    if "125" in samplename:
+        return "signal"
+    return "ZZ"
+
+
+def breitWigner(rng, n, mass=ZmassValue, width=ZwidthValue, low=40., high=120.):
+    x = mass + width/2*np.tan(np.pi*(rng.random(n)-0.5))
+    return np.clip(x, low, high)
+
+
+def generateMass(rng, n, process):
+    if process == "signal":
+        return rng.normal(125., 1.8, n)
+    if process == "data":
+        # ZZ background, a few signal events and a Z+X-like tail
+        kind = rng.choice(3, n, p=[0.90, 0.02, 0.08])
+        m = generateMass(rng, n, "ZZ")
+        m[kind == 1] = rng.normal(125., 1.8, np.count_nonzero(kind == 1))
+        m[kind == 2] = 70. + rng.lognormal(np.log(60.), 0.5, np.count_nonzero(kind == 2))
+        return m
+    # ZZ: Z->4l peak, off-shell region and on-shell continuum
+    kind = rng.choice(3, n, p=[0.15, 0.10, 0.75])
+    m = 2*ZmassValue + rng.gamma(1.3, 70., n)
+    m[kind == 0] = rng.normal(ZmassValue, 2.5, np.count_nonzero(kind == 0))
+    m[kind == 1] = rng.uniform(100., 2*ZmassValue, np.count_nonzero(kind == 1))
+    return m
+
+
+def generateCandidates(rng, n, process, fractions):
+    """
+    Variables of n ZZ candidates.
+    """
+
+    mass = np.maximum(generateMass(rng, n, process), 70.)
+    Z1mass = np.minimum(breitWigner(rng, n), mass-12.)
+    onShell = mass > 2*ZmassValue
+    Z2mass = np.where(onShell, breitWigner(rng, n, low=12.),
+                      12. + rng.random(n)*np.clip(mass-Z1mass-12., 0., 108.))
+    Z2mass = np.minimum(Z2mass, Z1mass)
+    if process == "signal":
+        KD = rng.beta(4., 2., n)
+    else:
+        KD = rng.beta(1.5, 3., n)
+
+    fs = rng.choice(3, n, p=fractions)
+    Z1flav = np.where(fs == 0, Zflav_mumu, Zflav_ee)
+    Z2flav = Z1flav.copy()
+    # 2e2mu: either Z can be the muon pair
+    mixed = fs == 2
+    muFirst = rng.random(n) < 0.5
+    Z1flav[mixed] = np.where(muFirst[mixed], Zflav_mumu, Zflav_ee)
+    Z2flav[mixed] = np.where(muFirst[mixed], Zflav_ee, Zflav_mumu)
+
+    return dict(mass = mass.astype(np.float32),
+                Z1mass = Z1mass.astype(np.float32),
+                Z2mass = Z2mass.astype(np.float32),
+                KD = KD.astype(np.float32),
+                Z1flav = Z1flav.astype(np.int32),
+                Z2flav = Z2flav.astype(np.int32),
+                dataMCWeight = np.ones(n, dtype=np.float32) if process == "data"
+                               else rng.normal(1., 0.03, n).astype(np.float32))
+
+
+def generateLeptons(rng, nLep):
+    total = int(nLep.sum())
+    charge = np.where(rng.random(total) < 0.5, -1, 1).astype(np.int32)
+    return dict(pt = (5. + rng.exponential(25., total)).astype(np.float32),
+                eta = rng.uniform(-2.4, 2.4, total).astype(np.float32),
+                phi = rng.uniform(-np.pi, np.pi, total).astype(np.float32),
+                charge = charge)
+
+
+def generateEvents(rng, n, process, fractions, firstEvent=0, run=1, lumiSize=1000,
+                   candFraction=0.6, extraCands=0.3, negativeFraction=0.):
+    """
+    One step of n Events entries, as a dict of (jagged) arrays.
+    """
+
+    isData = (process == "data")
+    hasCand = rng.random(n) < candFraction
+    # events without a selected candidate can still have (failing) candidates
+    nCand = np.where(hasCand, 1 + rng.poisson(extraCands, n), rng.poisson(0.2, n))
+    bestCandIdx = np.where(hasCand, (rng.random(n)*nCand).astype(np.int64), -1)
+    cands = generateCandidates(rng, int(nCand.sum()), process, fractions)
+
+    # leptons: those of the best candidate, plus extra ones
+    best = (np.cumsum(nCand) - nCand + bestCandIdx)[hasCand]
+    Z1flav = np.zeros(n, dtype=np.int32)
+    Z2flav = np.zeros(n, dtype=np.int32)
+    Z1flav[hasCand] = cands["Z1flav"][best]
+    Z2flav[hasCand] = cands["Z2flav"][best]
+    nMuon = 2*(Z1flav == Zflav_mumu) + 2*(Z2flav == Zflav_mumu) + rng.poisson(0.3, n)
+    nElectron = 2*(Z1flav == Zflav_ee) + 2*(Z2flav == Zflav_ee) + rng.poisson(0.3, n)
+
+    # best Z candidate (for the Z peak plots)
+    nZCand = np.where(hasCand, 1 + rng.poisson(0.5, n), rng.poisson(0.3, n))
+    bestZIdx = np.where(nZCand > 0, 0, -1)
+
+    if isData:
+        overallEventWeight = np.ones(n)
+    else:
+        overallEventWeight = rng.normal(1., 0.1, n)*np.where(rng.random(n) < negativeFraction, -1., 1.)
+
+    event = firstEvent + np.arange(n, dtype=np.uint64)
+    events = {
+        "run": np.full(n, run, dtype=np.uint32),
+        "luminosityBlock": (1 + event//lumiSize).astype(np.uint32),
+        "event": event,
+        "bestCandIdx": bestCandIdx.astype(np.int32),
+        "bestZIdx": bestZIdx.astype(np.int32),
+        "HLT_passZZ4l": rng.random(n) < 0.985,
+        "overallEventWeight": overallEventWeight.astype(np.float32),
+        "ZZCand": ak.zip({k: ak.unflatten(v, nCand) for k, v in cands.items()}),
+        "ZCand": ak.zip({"mass": ak.unflatten(breitWigner(rng, int(nZCand.sum()), low=60.).astype(np.float32), nZCand)}),
+        "Muon": ak.zip({k: ak.unflatten(v, nMuon) for k, v in generateLeptons(rng, nMuon).items()}),
+        "Electron": ak.zip({k: ak.unflatten(v, nElectron) for k, v in generateLeptons(rng, nElectron).items()}),
+    }
+    return events
+
+
+def _compression(name, level):
+    codecs = dict(zlib = uproot.ZLIB, lzma = uproot.LZMA, lz4 = uproot.LZ4, zstd = uproot.ZSTD)
+    return codecs[name](level)
+
+
+def writeSample(filename, samplename, nEvents, clusterSize=10000, seed=0, nRuns=5,
+                candFraction=0.6, extraCands=0.3, negativeFraction=None, efficiency=0.3,
+                compression="zlib", compressionLevel=1):
+    """
+    Write a synthetic nanoAOD for a sample.
+
+    Parameters
+    ----------
+    filename : str
+        The output file (directories are created).
+    samplename : str
+        Determines the mZZ shape (see sampleProcess) and the final states
+        (ggTo4mu, ggTo4e and ggTo2e2mu have a single one).
+    nEvents : int
+        Number of Events entries.
+    clusterSize : int
+        Entries per basket/cluster.
+    seed : int
+        Random seed; the same arguments give the same file contents.
+    nRuns : int
+        Runs in the Events and Runs trees.
+    candFraction : float
+        Fraction of events with a selected candidate (bestCandIdx != -1).
+    extraCands : float
+        Mean number of additional candidates in those events.
+    negativeFraction : float
+        Fraction of negative MC weights (default: 0.2 for ggTo samples,
+        as for NLO generators, 0 otherwise).
+    efficiency : float
+        Fraction of generated events stored in the file, which sets
+        genEventCount and genEventSumw in the Runs tree.
+    compression, compressionLevel :
+        Compression algorithm (zlib, lzma, lz4, zstd) and level.
+    """
+
+    process = sampleProcess(samplename)
+    fractions = fsFractions.get(samplename, fsFractions['default'])
+    if negativeFraction is None:
+        negativeFraction = 0.2 if samplename.startswith("ggTo") else 0.
+    rng = np.random.default_rng(seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    runs = 1 + np.arange(nRuns)
+    sumw = np.zeros(nRuns)
+    counts = np.zeros(nRuns, dtype=np.int64)
+    with uproot.recreate(filename, compression=_compression(compression, compressionLevel)) as f:
+        for start in range(0, nEvents, clusterSize):
+            n = min(clusterSize, nEvents-start)
+            iRun = min(nRuns-1, start*nRuns//max(1, nEvents))
+            events = generateEvents(rng, n, process, fractions, start, runs[iRun],
+                                    candFraction=candFraction, extraCands=extraCands, negativeFraction=negativeFraction)
+            sumw[iRun] += events["overallEventWeight"].astype(np.float64).sum()
+            counts[iRun] += n
+            if "Events" not in f:
+                f.mktree("Events", {k: v.type if isinstance(v, ak.Array) else v.dtype for k, v in events.items()})
+            f["Events"].extend(events)
+
+        isData = (process == "data")
+        runsTree = {"run": runs.astype(np.uint32),
+                    "genEventCount": np.zeros(nRuns, dtype=np.int64) if isData else (counts/efficiency).astype(np.int64),
+                    "genEventSumw": np.zeros(nRuns) if isData else sumw/efficiency}
+        f.mktree("Runs", {k: v.dtype for k, v in runsTree.items()})
+        f["Runs"].extend(runsTree)
+
+    print(samplename, ": wrote", nEvents, "events to", filename)
+
+
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description='Write synthetic H4l nanoAODs (<outdir>/<sample>/ZZ4lAnalysis.root)')
+    parser.add_argument('outdir', help='output directory, e.g. synth/MC2022EE')
+    parser.add_argument('--samples', nargs='+', default=['ggH125', 'ZZTo4l'],
+                        help='samples to write; "Data" for data, *125 for signal, others for ZZ backgrounds (default: %(default)s)')
+    parser.add_argument('--events', type=int, default=100000, help='Events entries per sample (default: %(default)s)')
+    parser.add_argument('--cluster-size', type=int, default=10000, help='entries per cluster (default: %(default)s)')
+    parser.add_argument('--cand-fraction', type=float, default=0.6,
+                        help='fraction of events with a selected candidate (default: %(default)s)')
+    parser.add_argument('--extra-cands', type=float, default=0.3,
+                        help='mean number of additional candidates per selected event (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='number of runs (default: %(default)s)')
+    parser.add_argument('--compression', choices=['zlib', 'lzma', 'lz4', 'zstd'], default='zlib',
+                        help='compression algorithm (default: %(default)s)')
+    parser.add_argument('--compression-level', type=int, default=1, help='compression level (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the first sample (default: %(default)s)')
+    args = parser.parse_args()
+
+    for i, samplename in enumerate(args.samples):
+        writeSample(os.path.join(args.outdir, samplename, "ZZ4lAnalysis.root"), samplename, args.events,
+                    args.cluster_size, args.seed+i, args.runs, args.cand_fraction, args.extra_cands,
+                    compression=args.compression, compressionLevel=args.compression_level)
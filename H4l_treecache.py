@@ -0,0 +1,86 @@
+### Read strategies for the TTree event loops.
+# 'default' keeps the tree as opened: ROOT's default TTreeCache learns the
+# branches read in the first entries, then prefetches them. 'tuned' sets up
+# the cache before the loop:
+#  - the active branches are added to the cache and the learning phase is
+#    stopped, so that the first entries are not read basket by basket;
+#  - the cache is sized to hold clustersPerRead clusters of the active
+#    branches (from their compressed size), so that each cache fill is a few
+#    large reads of whole clusters;
+#  - the cache entry range ends at the first cluster boundary after the last
+#    entry read, so that no baskets beyond it are prefetched.
+# The number of read calls and the bytes per call show the effect, over the
+# network in particular (see readStats).
+
+import numpy as np
+
+
+strategies = ["default", "tuned"]
+
+minCacheSize = 1 << 20
+maxCacheSize = 256 << 20
+
+
+def clusterBoundaries(tree, entryStop=None):
+    """
+    Entry boundaries of the clusters of a tree, up to the first one at or
+    after entryStop (default: all entries).
+    """
+
+    nEntries = tree.GetEntries()
+    if entryStop is None or entryStop > nEntries:
+        entryStop = nEntries
+    boundaries = [0]
+    it = tree.GetClusterIterator(0)
+    start = it.Next()
+    while start < entryStop:
+        boundaries.append(min(it.GetNextEntry(), nEntries))
+        start = it.Next()
+    return boundaries
+
+
+def cacheSize(tree, branches, boundaries, clustersPerRead=2):
+    """
+    Bytes of clustersPerRead of the longest clusters of the branches,
+    estimated from their average compressed size per entry.
+    """
+
+    zipBytes = sum(tree.GetBranch(b).GetZipBytes() for b in branches)
+    maxCluster = max(np.diff(boundaries)) if len(boundaries) > 1 else 0
+    size = int(zipBytes/max(1, tree.GetEntries())*maxCluster*clustersPerRead)
+    return min(max(size, minCacheSize), maxCacheSize)
+
+
+def configure(tree, branches, entryStop=None, strategy="default", clustersPerRead=2):
+    """
+    Set up the TTreeCache of a tree for a loop over its first entryStop
+    entries, reading the given (active) branches.
+
+    Returns
+    -------
+    dict
+        The cache size and number of clusters read; empty for the default
+        strategy.
+    """
+
+    if strategy == "default":
+        return {}
+    if strategy != "tuned":
+        raise ValueError("unknown read strategy " + strategy)
+
+    boundaries = clusterBoundaries(tree, entryStop)
+    size = cacheSize(tree, branches, boundaries, clustersPerRead)
+    tree.SetCacheSize(size)
+    tree.SetCacheEntryRange(0, boundaries[-1])
+    for branch in branches:
+        tree.AddBranchToCache(branch, True)
+    tree.StopCacheLearningPhase()
+    return dict(cacheSize = size, clusters = len(boundaries)-1)
+
+
+def readStats(f):
+    """
+    Read calls and bytes read from a TFile so far.
+    """
+
+    return dict(readCalls = f.GetReadCalls(), bytesRead = f.GetBytesRead())
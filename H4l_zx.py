@@ -0,0 +1,87 @@
+### Z+X templates for the draw scripts.
+# The Z+X m4l shape of each final state is parametrized (from 2018 data) as a
+# sum of TMath::Landau(x, location, width) terms over [70, 3000] GeV. A
+# template is the integral of the shape over each bin, from the Landau CDF at
+# the bin edges, normalized to the Z+X yield of the final state: it is exact
+# and deterministic, unlike a histogram filled with random m4l values.
+# The normalized shapes are memoized per binning, final state and parameters,
+# so the CDF (one call per bin edge) is evaluated once per binning.
+
+import numpy as np
+
+import ROOT
+
+import H4l_histos
+
+
+# (norm, location, width) of the Landau terms of each final state
+shapes = {
+    '4e':    [(1., 141.9, 21.3)],
+    '4mu':   [(1., 130.4, 15.6)],
+    '2e2mu': [(0.45, 131.1, 18.1), (0.55, 133.8, 18.9)],
+}
+shapeRange = (70., 3000.)
+
+# the final states summed in each plot final state
+plotFinalStates = {
+    'fs_4e':    ['4e'],
+    'fs_4mu':   ['4mu'],
+    'fs_2e2mu': ['2e2mu'],
+    'fs_4l':    ['4e', '4mu', '2e2mu'],
+}
+
+
+def landauIntegrals(edges, location, width):
+    """
+    Integrals of TMath::Landau(x, location, width) (not normalized) between
+    consecutive edges. The CDF is evaluated with one ROOT.Math.landau_cdf
+    call per edge: this is not vectorized, it is binFractions that keeps it
+    cheap, by computing each shape once per binning.
+    """
+
+    cdf = np.array([ROOT.Math.landau_cdf(u) for u in (edges-location)/width])
+    return width*np.diff(cdf)
+
+
+_shapeCache = {}
+
+def binFractions(edges, terms, xRange=shapeRange):
+    """
+    Fraction of a shape (a list of Landau terms) in each bin, with the shape
+    restricted to xRange and normalized to 1 over the bins.
+    """
+
+    key = (tuple(edges), tuple(terms), xRange)
+    if key not in _shapeCache:
+        clipped = np.clip(edges, *xRange)
+        integrals = sum(norm*landauIntegrals(clipped, location, width) for norm, location, width in terms)
+        _shapeCache[key] = integrals/integrals.sum()
+    return _shapeCache[key]
+
+
+def zxHisto(h_model, finalState, yields):
+    """
+    The Z+X histogram of a plot final state, with the binning of h_model.
+
+    Parameters
+    ----------
+    h_model : ROOT.TH1
+        Histogram cloned for the binning.
+    finalState : str
+        Plot final state: 'fs_4e', 'fs_4mu', 'fs_2e2mu' or 'fs_4l' (their
+        sum).
+    yields : Dict[str, float]
+        Z+X yield of each final state of shapes.
+    """
+
+    if finalState not in plotFinalStates:
+        raise ValueError('Error: wrong final state!')
+    states = plotFinalStates[finalState]
+    edges = H4l_histos.binEdges(h_model.GetXaxis())
+    contents = sum(yields[fs]*binFractions(edges, shapes[fs]) for fs in states)
+
+    h = h_model.Clone("ZX_tot" if len(states) > 1 else "ZX_" + states[0])
+    h.Reset()
+    # with underflow and overflow bins
+    h.SetContent(np.concatenate([[0.], contents, [0.]]))
+    return h
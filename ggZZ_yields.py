@@ -14,7 +14,15 @@ from typing import Dict
 
 import ROOT
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection
-from ZZAnalysis.NanoAnalysis.tools import getLeptons, get_genEventSumw
+from ZZAnalysis.NanoAnalysis.tools import getLeptons
+import H4l_columnar
+import H4l_entryindex
+import H4l_histos
+import H4l_pass
+import H4l_rdf
+import H4l_skim
+import H4l_sumw
+import H4l_treecache
 
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
@@ -29,6 +37,8 @@ pathMC2022EE = '../prod/ggZZ_no0p5_fb_12Mar2024/'
 
 ZmassValue = 91.1876
 
+fs_list = ['4mu', '4e', '2e2mu']
+
 maxEntriesPerSample = 1e12 # Use only up to this number of events in each MC sample, for quick tests.
 
 
@@ -36,7 +46,8 @@ maxEntriesPerSample = 1e12 # Use only up to this number of events in each MC sam
 ROOT.TH1.SetDefaultSumw2()
 
 ####################################
-def fillHistos(samplename: str, filename: str, lumi: float) -> Dict[str, ROOT.TH1F] :
+def fillHistos(samplename: str, filename: str, lumi: float, engine: str = 'loop', skimDir: str = 'skims',
+               entryIndex: bool = False) -> Dict[str, ROOT.TH1F] :
     """
     Fill histograms for yields.
 
@@ -48,6 +59,15 @@ def fillHistos(samplename: str, filename: str, lumi: float) -> Dict[str, ROOT.TH
         The name of the file containing the sample to open.
     lumi : float
         The integrated luminosity
+    engine : str
+        'loop' for the event loop, 'rdf' for the RDataFrame engine,
+        'columnar' for the Yields consumer of H4l_pass, 'skim' to read the
+        skim written by H4l_fill.py --write-skim.
+    skimDir : str
+        The directory of the skims, for engine='skim'.
+    entryIndex : bool
+        For engine='loop', read only the entries with a selected candidate
+        passing the trigger, from the index of the file (see H4l_entryindex).
 
     Returns
     -------
@@ -62,44 +82,56 @@ def fillHistos(samplename: str, filename: str, lumi: float) -> Dict[str, ROOT.TH
         If the flavour of the Z bosons is not correct.
     """
     
-    ## yields ggZZ
-    fs_list = ['4mu', '4e', '2e2mu', '4l']
+    ## yields ggZZ, per final state (4l is derived as their sum)
     h_yield = {fs: ROOT.TH1F(f'h_yield_{fs}_{samplename}', f'h_yield_{fs}_{samplename}', 1, 0.0, 1.0) for fs in fs_list}
 
+    # the skim replaces the input file
+    if engine == 'skim':
+        return fillHistosSkim(samplename, filename, lumi, h_yield, skimDir)
+
     # check if input file exists
     if not Path(filename).is_file():
         raise FileNotFoundError(f'Could not find input file {filename}!')
+
+    if engine == 'rdf':
+        return fillHistosRDF(samplename, filename, lumi, h_yield)
+
+    if engine == 'columnar':
+        shared = H4l_pass.SharedPass(samplename, filename)
+        yields = shared.add(H4l_pass.Yields(samplename, lumi))
+        shared.run(maxEntriesPerSample)
+        return addInclusiveYield(yields.h_yield, samplename)
     
     f = ROOT.TFile.Open(filename)
 
     # assigning branches
     event = f.Events
+    nEntries = min(event.GetEntries(), int(maxEntriesPerSample))
+
+    isMC = samplename != "Data"
+    # only the branches read in the loop: the event ids (for errors), the
+    # selection, the Z flavours and the weights
     event.SetBranchStatus("*", 0)
-    event.SetBranchStatus("run", 1)
-    event.SetBranchStatus("luminosityBlock", 1)
-    event.SetBranchStatus("event", 1)
-    event.SetBranchStatus("*Muon*", 1)
-    event.SetBranchStatus("*Electron*", 1)
-    event.SetBranchStatus("*ZZCand*", 1)
-    event.SetBranchStatus("bestCandIdx", 1)
-    event.SetBranchStatus("HLT_passZZ4l", 1)
-    nEntries = event.GetEntries() 
-
-    isMC = False
-    if(samplename == "Data"):
+    for branch in ["nZZCand"] + H4l_columnar.eventBranches(isMC, eventIds=True, variables=[]):
+        event.SetBranchStatus(branch, 1)
+
+    if not isMC:
         print("Data: sel=", nEntries)
     else:
-        isMC = True
-        event.SetBranchStatus("overallEventWeight",1)
-
         # Get sum of weights
-        genEventSumw = get_genEventSumw(f, maxEntriesPerSample)
+        genEventSumw = H4l_sumw.getGenEventSumw(filename, maxEntriesPerSample)
+
 
+    # entries read: all, or only the selected ones
+    entries = H4l_entryindex.selectedEntries(filename) if entryIndex else None
+    if entries is not None:
+        entries = entries[entries < nEntries]
+    nRead = nEntries if entries is None else len(entries)
 
     # loop over events
     iEntry=0
-    printEntries=max(5000,nEntries/10)
-    while iEntry<nEntries and event.GetEntry(iEntry):
+    printEntries=max(5000,nRead/10)
+    while iEntry<nRead and event.GetEntry(iEntry if entries is None else int(entries[iEntry])):
         iEntry+=1
         if iEntry%printEntries == 0 : print("Processing", iEntry)
 
@@ -115,8 +147,6 @@ def fillHistos(samplename: str, filename: str, lumi: float) -> Dict[str, ROOT.TH
             if isMC : 
                 weight = (lumi*1000.* event.overallEventWeight*theZZ.dataMCWeight/genEventSumw)
 
-            h_yield['4l'].Fill(0.5,weight) #yield 4l
-
             # per final state
             Z1flav = theZZ.Z1flav
             Z2flav = theZZ.Z2flav
@@ -130,17 +160,119 @@ def fillHistos(samplename: str, filename: str, lumi: float) -> Dict[str, ROOT.TH
             else:
                 raise ValueError(f'Error in event {event.run}:{event.luminosityBlock}:{event.event}: found Z1flav={Z1flav}, Z2flav={Z2flav}!')
 
-            h_yield[currentFinalState].Fill(0.5,weight) #yield 4l
+            h_yield[currentFinalState].Fill(0.5,weight)
         
+    readStats = H4l_treecache.readStats(f)
+    print(samplename, ": read {:.1f} MB in {} calls".format(readStats["bytesRead"]/1e6, readStats["readCalls"]))
     f.Close()
     
 
+    return addInclusiveYield(h_yield, samplename)
+
+
+def addInclusiveYield(h_yield: Dict[str, ROOT.TH1F], samplename: str) -> Dict[str, ROOT.TH1F] :
+    """
+    Add the 4l yield, as the sum of the yields of the three final states.
+    """
+
+    h_yield['4l'] = H4l_histos.inclusiveHisto(f'h_yield_4l_{samplename}', [h_yield[fs] for fs in fs_list])
     return h_yield
 
 
+def fillHistosRDF(samplename: str, filename: str, lumi: float, h_yield: Dict[str, ROOT.TH1F]) -> Dict[str, ROOT.TH1F] :
+    """
+    Fill the yield histograms in a single RDataFrame event loop.
+
+    Parameters
+    ----------
+    samplename : str
+        The name of the sample to read.
+    filename : str
+        The name of the file containing the sample to open.
+    lumi : float
+        The integrated luminosity
+    h_yield : Dict[str, ROOT.TH1F]
+        The histograms used as templates for name and binning.
+
+    Returns
+    -------
+    Dict[str, ROOT.TH1F]
+        The dictionary containing the final state as key, and the histogram as values.
+
+    Raises
+    ------
+    ValueError
+        If the flavour of the Z bosons is not correct.
+    """
+
+    isMC = (samplename != "Data")
+    genEventSumw = 1.
+    if isMC:
+        # all entries are read (Range does not work with implicit MT), so the
+        # sum of weights is not scaled to maxEntriesPerSample
+        genEventSumw = H4l_sumw.getGenEventSumw(filename)
+
+    df = H4l_rdf.selectedCandidates(filename, isMC, genEventSumw, lumi*1000.).Define("yieldBin", "0.5")
+    dfs = H4l_rdf.splitFinalStates(df)
+    nOther = dfs['other'].Count()
+    results = {fs: H4l_rdf.bookHisto(dfs[fs], h, "yieldBin") for fs, h in h_yield.items()}
+
+    h_yield = {fs: H4l_rdf.getHisto(r, h_yield[fs]) for fs, r in results.items()}
+    if nOther.GetValue() > 0:
+        raise ValueError(f'Error in {filename}: found {nOther.GetValue()} events with unexpected Z1flav, Z2flav!')
+
+    return addInclusiveYield(h_yield, samplename)
+
+
+def fillHistosSkim(samplename: str, filename: str, lumi: float, h_yield: Dict[str, ROOT.TH1F], skimDir: str) -> Dict[str, ROOT.TH1F] :
+    """
+    Fill the yield histograms from the skim of the sample.
+
+    Parameters
+    ----------
+    samplename : str
+        The name of the sample to read.
+    filename : str
+        The name of the file the skim was made from.
+    lumi : float
+        The integrated luminosity
+    h_yield : Dict[str, ROOT.TH1F]
+        The histograms to fill.
+    skimDir : str
+        The directory of the skims.
+
+    Returns
+    -------
+    Dict[str, ROOT.TH1F]
+        The dictionary containing the final state as key, and the histogram as values.
+
+    Raises
+    ------
+    FileNotFoundError
+        If there is no skim for the sample.
+    ValueError
+        If the flavour of the Z bosons is not correct.
+    """
+
+    cands = H4l_skim.readSkim(skimDir, samplename, filename)
+    weight = cands['weight']
+    if samplename != "Data":
+        weight = weight*lumi*1000.
+    H4l_pass.fillYields(h_yield, cands, weight)
+
+    return addInclusiveYield(h_yield, samplename)
+
    
 
-def runMC(outFile): 
+def getSamples(outFile):
+    """
+    The samples and the integrated luminosity (in fb-1) of an output file.
+
+    Raises
+    ------
+    ValueError
+        If there are no samples for the output file.
+    """
 
     if '2018' in outFile:
         path=pathMC2018
@@ -149,7 +281,7 @@ def runMC(outFile):
         path=pathMC2022EE
         lumi=27.007 #fb-1
     else:
-        print('error: specify the path and lumi')
+        raise ValueError(f'error: specify the path and lumi for {outFile}')
         
     samples = [
         dict(name = "ggTo4e",     filename = path+"ggTo4e_Contin_MCFM701/ZZ4lAnalysis.root"),
@@ -159,15 +291,16 @@ def runMC(outFile):
         dict(name = "ggTo2e2tau", filename = path+"ggTo2e2tau_Contin_MCFM701/ZZ4lAnalysis.root"),
         dict(name = "ggTo2mu2tau",filename = path+"ggTo2mu2tau_Contin_MCFM701/ZZ4lAnalysis.root"),
     ]
+    return samples, lumi
 
-    of = ROOT.TFile.Open(outFile,"recreate") 
-    
+
+def runMC(outFile, engine='loop', skimDir='skims', entryIndex=False): 
+
+    samples, lumi = getSamples(outFile)
+    histos = []
     for s in samples:
-         histos = fillHistos(s["name"], s["filename"], lumi)
-         for h in histos.values():
-             of.WriteObject(h,h.GetName())
-          
-    of.Close()
+         histos += fillHistos(s["name"], s["filename"], lumi, engine, skimDir, entryIndex).values()
+    H4l_histos.writeHistos(outFile, histos)
 
 
 
@@ -181,13 +314,13 @@ def printYields(inFile: str):
         File containing the yields histos
     """
 
-    fs_list = ['4mu', '4e', '2e2mu', '4l']
     name_list = ['ggTo4e', 'ggTo4mu', 'ggTo4tau', 'ggTo2e2mu', 'ggTo2e2tau', 'ggTo2mu2tau']
 
     in_file = ROOT.TFile.Open(inFile, 'READ')
 
     
-    # get histos from input file
+    # get histos from input file (the 4l yields are not read: they are
+    # derived below as the sum of the final states)
     # define dictionary of list of histos
     #   input_histos = {'4mu': ['h_yield_4mu_ggTo4e', 'h_yield_4mu_ggTo4mu', etc.],
     #                   '4e': ['h_yield_4e_ggTo4e', 'h_yield_4e_ggTo4mu', etc.],
@@ -212,12 +345,11 @@ def printYields(inFile: str):
         for h in h_list[1:]:
             output_histos[fs].Add(h, 1.0)
 
+    # 4l: sum of the three final states, consistent by construction
+    output_histos['4l'] = H4l_histos.inclusiveHisto('ggZZ_4l', list(output_histos.values()))
+
     # print yields for check
-    debug_dict = {fs: h.GetBinContent(1) for fs, h in output_histos.items()}
-    print(debug_dict)
-    debug_left = sum(list(debug_dict.values())[:-1])  # first three fs (4mu, 4e, 2e2mu)
-    debug_right = list(debug_dict.values())[-1]  # last fs (4l)
-    assert round(debug_left, 3) == round(debug_right, 3), "Yields do not add up!"
+    print({fs: h.GetBinContent(1) for fs, h in output_histos.items()})
 
 
     # print yields pretty
@@ -231,11 +363,14 @@ def printYields(inFile: str):
 
 def main(args: argparse.Namespace) -> int:
 
+    if args.engine == 'rdf':
+        H4l_rdf.enableMT(args.threads)
+
     for file in args.input:
 
         if args.hists:
             print(f'Making histograms for {file}...')
-            runMC(file)
+            runMC(file, args.engine, args.skim_dir, args.entry_index)
 
         print(f'Printing yields from {file}...')
         printYields(file)
@@ -250,7 +385,13 @@ if __name__ == "__main__" :
     parser = argparse.ArgumentParser(description='Print the yields', epilog='Contact info: Alessandra Cappati <alessandra.cappati@cern.ch>')
     parser.add_argument('input', nargs='+', help='input files')
     parser.add_argument('--hists', action='store_true', help='Remake histograms')
+    parser.add_argument('--engine', choices=['loop', 'rdf', 'columnar', 'skim'], default='loop', help='Fill engine: event loop, RDataFrame, columnar (the shared pass of H4l_pass.py), or the skims written by H4l_fill.py --write-skim')
+    parser.add_argument('--skim-dir', default='skims', help='Directory of the skims for --engine skim')
+    parser.add_argument('--entry-index', action='store_true', help='loop engine: read only the entries with a selected candidate passing the trigger (indexed once per file)')
+    parser.add_argument('--threads', type=int, default=0, help='Number of threads for the rdf engine (default: all cores)')
     args = parser.parse_args()
+    if args.entry_index and args.engine != 'loop':
+        parser.error('--entry-index requires --engine loop')
 
     code = main(args)
     sys.exit(code)
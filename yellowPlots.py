@@ -1,11 +1,17 @@
 # sun with python3 yellowPlots.py
+# (--engine columnar fills through the ZHistos consumer of H4l_pass.py)
 
 from __future__ import print_function
+import argparse
 import math
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection
 from ZZAnalysis.NanoAnalysis.tools import getLeptons
+import H4l_histos
+import H4l_pass
+import H4l_sumw
+import H4l_treecache
 
 
 pathMC = '/eos/user/a/acappati/run3/MC2022/'
@@ -17,7 +23,13 @@ ROOT.TH1.SetDefaultSumw2()
 
 
 
-def fillHistos(samplename, filename) :
+def fillHistos(samplename, filename, engine='loop') :
+
+    if engine == 'columnar':
+        shared = H4l_pass.SharedPass(samplename, filename)
+        zhistos = shared.add(H4l_pass.ZHistos(samplename))
+        shared.run()
+        return zhistos.results()
 
     # def histo
     h_ZMass = ROOT.TH1F("ZMass_"+samplename,"ZMass_"+samplename,60,60.,120.)
@@ -26,35 +38,21 @@ def fillHistos(samplename, filename) :
     f = ROOT.TFile.Open(filename)
 
     event = f.Events
-    event.SetBranchStatus("*", 0)
-    event.SetBranchStatus("run", 1)
-    event.SetBranchStatus("luminosityBlock", 1)
-    event.SetBranchStatus("*Muon*", 1)
-    event.SetBranchStatus("*Electron*", 1)
-    event.SetBranchStatus("*ZLLCand*", 1)
-    event.SetBranchStatus("*ZCand*", 1)
-    event.SetBranchStatus("bestZIdx", 1)
-    event.SetBranchStatus("bestCandIdx", 1)
-    event.SetBranchStatus("HLT_passZZ4l", 1)
     nEntries = event.GetEntries() 
 
-    isMC = False
-    if(samplename == "Data"):
+    isMC = samplename != "Data"
+    # only the branches read in the loop (as the ZHistos consumer of H4l_pass.py)
+    event.SetBranchStatus("*", 0)
+    for branch in ["bestZIdx", "HLT_passZZ4l", "nZCand", "ZCand_mass"] + (["overallEventWeight"] if isMC else []):
+        event.SetBranchStatus(branch, 1)
+
+    if not isMC:
         print("Data: sel=", nEntries)
     else:
-        isMC = True
-        event.SetBranchStatus("overallEventWeight",1)
-
         # Get sum of weights
-        runs = f.Runs
-        nRuns = runs.GetEntries()
-        iRun = 0
-        genEventCount = 0
-        genEventSumw = 0.
-        while iRun < nRuns and runs.GetEntry(iRun) :
-            genEventCount += runs.genEventCount
-            genEventSumw += runs.genEventSumw
-            iRun +=1
+        runsInfo = H4l_sumw.getRunsInfo(filename)
+        genEventCount = runsInfo["genEventCount"]
+        genEventSumw = runsInfo["genEventSumw"]
         print (samplename, ": gen=", genEventCount, "sel=",nEntries, "sumw=", genEventSumw)
 
 
@@ -64,7 +62,6 @@ def fillHistos(samplename, filename) :
         iEntry+=1
         if iEntry%printEntries == 0 : print("Processing", iEntry)
 
-        bestCandIdx = event.bestCandIdx
         bestZIdx = event.bestZIdx
 
         # Check that the event contains a selected candidate, and that
@@ -80,41 +77,43 @@ def fillHistos(samplename, filename) :
             h_ZMass.Fill(mZ,weight)
 
         
+    readStats = H4l_treecache.readStats(f)
+    print(samplename, ": read {:.1f} MB in {} calls".format(readStats["bytesRead"]/1e6, readStats["readCalls"]))
     f.Close()
     
     return [h_ZMass]
 
 
-def runMC():
-    outFile = "hist_MC.root" 
-
-    samples = [
+def getSamples(outFile):
+    if 'Data' in outFile:
+        return [dict(name = "Data", filename = pathDATA+ "/ZZ4lAnalysis.root")]
+    return [
         dict(name = "DY",filename = pathMC+'DYJetsToLL/ZZ4lAnalysis.root'),
     ]
 
 
-    of = ROOT.TFile.Open(outFile,"recreate") 
-    
-    for s in samples:
-         histos = fillHistos(s["name"], s["filename"])
-         print('histos ', histos)
-         for h in histos:
-             of.WriteObject(h,h.GetName()) # works only if there are at least 2 histos
+def runMC(engine='loop'):
+    outFile = "hist_MC.root" 
 
-    of.Close()
+    histos = []
+    for s in getSamples(outFile):
+         histos += fillHistos(s["name"], s["filename"], engine)
+         print('histos ', histos)
+    H4l_histos.writeHistos(outFile, histos)
 
-def runData():
+def runData(engine='loop'):
     outFile = "hist_Data.root" 
 
-    of = ROOT.TFile.Open(outFile,"recreate") 
-                
-    hs_data = fillHistos("Data", pathDATA+ "/ZZ4lAnalysis.root")
-    for h in hs_data:
-        h.SetBinErrorOption(ROOT.TH1.kPoisson)
-        of.WriteObject(h,h.GetName())
-
-    of.Close()
+    histos = []
+    for s in getSamples(outFile):
+         histos += fillHistos(s["name"], s["filename"], engine)
+    H4l_histos.writeHistos(outFile, histos, isData=True)
 
 if __name__ == "__main__" :
-    runMC()
-#    runData()
+    parser = argparse.ArgumentParser(description='Fill the Z peak histograms')
+    parser.add_argument('--engine', choices=['loop', 'columnar'], default='loop',
+                        help='fill engine: event loop (default) or columnar (the shared pass of H4l_pass.py)')
+    args = parser.parse_args()
+
+    runMC(args.engine)
+#    runData(args.engine)